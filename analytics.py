@@ -0,0 +1,169 @@
+import csv
+from collections import defaultdict
+
+from fares import format_cents, to_cents
+from invoices import Invoice, time_minutes
+from storage import atomic_write, date_ordinal
+
+ANALYSES = ("hour", "weekday", "duration", "slot")
+WEEKDAYS = ("Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche")
+MINUTES_PER_DAY = 24 * 60
+# Upper bounds (minutes) of the ride duration bands; longer rides go last
+DURATION_BANDS = (10, 20, 30, 45, 60, 90, 120)
+
+# Bucket slots: rides and revenue, then the rides with both times known,
+# their revenue and their minutes (for the fare per minute)
+RIDES, REVENUE, TIMED, TIMED_REVENUE, MINUTES = range(5)
+# Column headings of a report row, after its group label
+REPORT_HEADINGS = ("Courses", "CA TTC", "Course moyenne", "Durée moyenne (min)", "Prix par minute")
+
+
+def ride_minutes(departure, arrival):
+    # Duration from two times in minutes after midnight. An arrival before
+    # the departure is on the next day; None when a time is missing or out
+    # of the day (e.g. "24:30"), or when both are equal (the form's 00:00
+    # left as is)
+    if not (0 <= departure < MINUTES_PER_DAY and 0 <= arrival < MINUTES_PER_DAY) or departure == arrival:
+        return None
+    return (arrival - departure) % MINUTES_PER_DAY
+
+
+def duration_band(minutes):
+    for band, bound in enumerate(DURATION_BANDS):
+        if minutes < bound:
+            return band
+    return len(DURATION_BANDS)
+
+
+def ride_features(invoice):
+    # (day ordinal, departure, arrival, total in cents) of an Invoice or dict
+    if isinstance(invoice, Invoice):
+        day = invoice.day if isinstance(invoice.day, int) else None
+        return day, invoice.departure, invoice.arrival, invoice.total
+    return (date_ordinal(invoice['date']), time_minutes(invoice.get('departure_time')),
+            time_minutes(invoice.get('arrival_time')), to_cents(invoice['total']))
+
+
+def analysis_keys(day, departure, arrival):
+    # Bucket key per analysis; None where the invoice doesn't tell
+    minutes = ride_minutes(departure, arrival)
+    hour = None if minutes is None else departure // 60
+    # date(1, 1, 1), ordinal 1, was a Monday
+    weekday = None if day is None else (day - 1) % 7
+    band = None if minutes is None else duration_band(minutes)
+    slot = None if hour is None or weekday is None else (weekday, hour)
+    return (hour, weekday, band, slot), minutes
+
+
+def format_key(analysis, key):
+    if key is None:
+        return "?"
+    if analysis == "hour":
+        return f"{key:02d}h"
+    if analysis == "weekday":
+        return WEEKDAYS[key]
+    if analysis == "duration":
+        if key == len(DURATION_BANDS):
+            return f"{DURATION_BANDS[-1]} min et plus"
+        low = DURATION_BANDS[key - 1] if key else 0
+        return f"{low}-{DURATION_BANDS[key]} min"
+    return f"{WEEKDAYS[key[0]]} {key[1]:02d}h"
+
+
+class RideAnalytics:
+    """Rides and revenue per departure hour, weekday, duration band and
+    weekday x hour, with the minutes driven for the fare per minute.
+
+    Durations come from the departure and arrival times, wrapping past
+    midnight. Like RevenueRollups, add() and remove() adjust one bucket per
+    analysis and sealed months bring their own buckets.
+    """
+
+    def __init__(self, invoices=()):
+        self.buckets = {analysis: defaultdict(lambda: [0, 0, 0, 0, 0]) for analysis in ANALYSES}
+        self.version = 0
+        for invoice in invoices:
+            self.add(invoice)
+
+    def add(self, invoice):
+        self.count(*ride_features(invoice), 1)
+
+    def remove(self, invoice):
+        self.count(*ride_features(invoice), -1)
+
+    def count(self, day, departure, arrival, total, sign=1):
+        keys, minutes = analysis_keys(day, departure, arrival)
+        if minutes is None:
+            amounts = (1, total, 0, 0, 0)
+        else:
+            amounts = (1, total, 1, total, minutes)
+        for analysis, key in zip(ANALYSES, keys):
+            if key is None and analysis == "slot":
+                continue
+            groups = self.buckets[analysis]
+            bucket = groups[key]
+            for slot, amount in enumerate(amounts):
+                bucket[slot] += sign * amount
+            if not bucket[RIDES]:
+                del groups[key]
+        self.version += 1
+
+    def merge(self, serialized):
+        # Adds buckets saved as {analysis: [[key, bucket], ...]} (e.g. by an archive)
+        for analysis, entries in serialized.items():
+            groups = self.buckets[analysis]
+            for key, amounts in entries:
+                bucket = groups[tuple(key) if isinstance(key, list) else key]
+                for slot, amount in enumerate(amounts):
+                    bucket[slot] += amount
+        self.version += 1
+
+    def serialize(self):
+        return {analysis: [[key, bucket] for key, bucket in buckets.items()]
+                for analysis, buckets in self.buckets.items()}
+
+    def report(self, analysis):
+        # Rows of (label, rides, revenue, average fare, average minutes, fare
+        # per minute); money in cents, None where no ride was timed
+        rows = []
+        for key in sorted(self.buckets[analysis], key=lambda key: (key is None, key)):
+            rides, revenue, timed, timed_revenue, minutes = self.buckets[analysis][key]
+            rows.append((format_key(analysis, key), rides, revenue, (revenue + rides // 2) // rides,
+                         round(minutes / timed) if timed else None,
+                         round(timed_revenue / minutes) if minutes else None))
+        return rows
+
+    def totals(self):
+        # All rides, and those with both times known
+        rides = timed = 0
+        for bucket in self.buckets["weekday"].values():
+            rides += bucket[RIDES]
+            timed += bucket[TIMED]
+        return rides, timed
+
+    def grid(self):
+        # Rides per weekday (rows) and departure hour (columns)
+        counts = [[0] * 24 for _ in WEEKDAYS]
+        for (weekday, hour), bucket in self.buckets["slot"].items():
+            # Months sealed before times were checked may hold hour 24 or more
+            if hour < 24:
+                counts[weekday][hour] = bucket[RIDES]
+        return counts
+
+
+def format_analytics(rows):
+    # Same rows with amounts and averages as display strings
+    return [(label, rides, format_cents(revenue), format_cents(average),
+             "" if minutes is None else minutes, "" if per_minute is None else format_cents(per_minute))
+            for label, rides, revenue, average, minutes, per_minute in rows]
+
+
+def write_analytics_csv(path, analytics):
+    # Every analysis in one file, one section after another
+    with atomic_write(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(("analyse", "groupe") + REPORT_HEADINGS)
+        for analysis in ANALYSES:
+            for row in format_analytics(analytics.report(analysis)):
+                writer.writerow((analysis, *row))
+    return path
@@ -0,0 +1,329 @@
+"""Local HTTP/JSON service over the invoice store.
+
+    python app.py serve [--host 127.0.0.1] [--port 8765] [--connections 8]
+
+    POST   /calculate            {"tarifs": [..4], "resa": 0, "add_to_total": 0}
+    POST   /invoices             ride fields as for `app.py import` -> 201 + invoice
+    GET    /invoices             ?client=&from=&to=&total_min=&total_max=&offset=&limit= (open months)
+    GET    /invoices/<id>        live or archived invoice
+    DELETE /invoices/<id>        204 (409 for an archived invoice)
+    GET    /invoices/<id>/ticket ticket text
+    GET    /invoices/<id>/pdf    one-page PDF
+
+Requests are parsed on the event loop; store calls run on a thread pool,
+each borrowing one of the pooled SQLite connections.
+"""
+import asyncio
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+
+from fares import compute_fare, format_cents
+from storage import InvoiceStore, date_ordinal, on_network_share, open_store
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+POOL_SIZE = 8
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_BODY = 1 << 20
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 15
+REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class StorePool:
+    """A fixed set of InvoiceStore connections, lent out one call at a time."""
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        # The first connection runs the migration and the legacy import
+        first = open_store(db_path)
+        shared = on_network_share(db_path)
+        self.stores = [first] + [InvoiceStore(db_path, shared=shared) for _ in range(size - 1)]
+        self._idle = queue.Queue()
+        for store in self.stores:
+            self._idle.put(store)
+
+    @contextmanager
+    def store(self):
+        store = self._idle.get()
+        try:
+            yield store
+        finally:
+            self._idle.put(store)
+
+    def close(self):
+        for store in self.stores:
+            store.close()
+
+
+class InvoiceService:
+    """The operations of the invoice window, without Tk.
+
+    Methods are blocking and thread-safe; the HTTP layer runs them on a
+    thread pool the size of the connection pool.
+    """
+
+    def __init__(self, db_path, pool_size=POOL_SIZE, archive_directory=None):
+        from archive import open_archives
+        from cli import archive_dir
+        self.archive_directory = archive_directory or archive_dir(db_path)
+        self.pool = StorePool(db_path, pool_size)
+        with self.pool.store() as store:
+            self.archives = open_archives(store, self.archive_directory)
+        # Change counter last seen on each pooled connection
+        self._versions = {}
+        self._archives_lock = threading.Lock()
+
+    def current_archives(self, store):
+        # A month sealed by another process deletes its live rows, which moves
+        # the connection's change counter: only then are the files looked at.
+        # A replaced set isn't closed, a request may still be reading it
+        from archive import ArchiveSet, archive_signature
+        version = store.data_version()
+        with self._archives_lock:
+            if self._versions.get(store) != version:
+                self._versions[store] = version
+                if archive_signature(self.archive_directory) != self.archives.signature:
+                    self.archives = ArchiveSet(self.archive_directory)
+            return self.archives
+
+    def calculate(self, ride):
+        # Same checks as a saved ride
+        from cli import ride_amounts
+        fare = compute_fare(*ride_amounts({"tarifs": [0, 0, 0, 0], **ride}))
+        return {"subtotal": format_cents(fare.subtotal), "total": format_cents(fare.total),
+                "tva": format_cents(fare.tva), "ht": format_cents(fare.ht)}
+
+    def save(self, ride):
+        # Same validation and fare as a CLI import
+        from cli import ride_to_invoice
+        invoice = ride_to_invoice(ride)
+        with self.pool.store() as store:
+            store.append(invoice)
+        return invoice
+
+    def list(self, offset=0, limit=PAGE_SIZE, **filters):
+        with self.pool.store() as store:
+            return {"total": store.count(**filters), "offset": offset,
+                    "invoices": store.page(offset, limit, **filters)}
+
+    def get(self, invoice_id):
+        with self.pool.store() as store:
+            invoice = store.get(invoice_id)
+            archives = self.current_archives(store)
+        return invoice or archives.get(invoice_id)
+
+    def delete(self, invoice_id):
+        # False when there is nothing to delete; sealed months are read-only
+        with self.pool.store() as store:
+            if store.get(invoice_id) is None:
+                if self.current_archives(store).get(invoice_id) is not None:
+                    raise PermissionError("facture d'une période clôturée")
+                return False
+            store.delete(invoice_id)
+        return True
+
+    def close(self):
+        self.pool.close()
+        self.archives.close()
+
+
+def _number(query, name, convert=float):
+    values = query.get(name)
+    if not values or not values[0]:
+        return None
+    try:
+        return convert(values[0])
+    except ValueError:
+        raise HTTPError(400, f"{name} invalide: {values[0]!r}")
+
+
+def _date(query, name):
+    values = query.get(name)
+    if not values or not values[0]:
+        return None
+    day = date_ordinal(values[0])
+    if day is None:
+        raise HTTPError(400, f"{name} invalide: {values[0]!r} (JJ/MM/AAAA)")
+    return day
+
+
+class InvoiceAPI:
+    def __init__(self, service, pool_size=POOL_SIZE):
+        self.service = service
+        self.executor = ThreadPoolExecutor(pool_size, thread_name_prefix="api-store")
+
+    async def call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HTTPError as error:
+                    # The body can't be skipped: answer, then drop the connection
+                    writer.write(self.response(error.status, "application/json", {"error": str(error)}, False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                try:
+                    status, content_type, payload = await self.dispatch(method, target, body)
+                except HTTPError as error:
+                    status, content_type, payload = error.status, "application/json", {"error": str(error)}
+                except Exception as error:
+                    status, content_type, payload = 500, "application/json", {"error": repr(error)}
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(self.response(status, content_type, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise ConnectionError("requête invalide")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, f"content-length invalide: {headers['content-length']!r}")
+        if length < 0:
+            raise HTTPError(400, f"content-length invalide: {length}")
+        if length > MAX_BODY:
+            raise ConnectionError("corps trop grand")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    def response(status, content_type, payload, keep_alive):
+        if payload is None:
+            body = b""
+        elif content_type == "application/json":
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        elif isinstance(payload, str):
+            body = payload.encode("utf-8")
+        else:
+            body = payload
+        if content_type != "application/pdf":
+            content_type += "; charset=utf-8"
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        return head.encode("latin-1") + body
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["calculate"]:
+            self.allow(method, "POST")
+            try:
+                return 200, "application/json", self.service.calculate(self.json_body(body))
+            except (TypeError, ValueError) as error:
+                raise HTTPError(400, str(error))
+        if parts == ["invoices"]:
+            if method == "POST":
+                try:
+                    invoice = await self.call(self.service.save, self.json_body(body))
+                except (TypeError, ValueError) as error:
+                    raise HTTPError(400, str(error))
+                return 201, "application/json", invoice
+            self.allow(method, "GET")
+            query = parse_qs(url.query)
+            offset = _number(query, "offset", int) or 0
+            limit = min(_number(query, "limit", int) or PAGE_SIZE, MAX_PAGE_SIZE)
+            client = (query.get("client") or [""])[0] or None
+            page = await self.call(self.service.list, max(offset, 0), max(limit, 1), client=client,
+                                   date_from=_date(query, "from"), date_to=_date(query, "to"),
+                                   total_min=_number(query, "total_min"), total_max=_number(query, "total_max"))
+            return 200, "application/json", page
+        if len(parts) in (2, 3) and parts[0] == "invoices":
+            try:
+                invoice_id = int(parts[1])
+            except ValueError:
+                raise HTTPError(404, "facture introuvable")
+            if len(parts) == 2 and method == "DELETE":
+                try:
+                    deleted = await self.call(self.service.delete, invoice_id)
+                except PermissionError as error:
+                    raise HTTPError(409, str(error))
+                if not deleted:
+                    raise HTTPError(404, "facture introuvable")
+                return 204, "application/json", None
+            self.allow(method, "GET")
+            invoice = await self.call(self.service.get, invoice_id)
+            if invoice is None:
+                raise HTTPError(404, "facture introuvable")
+            if len(parts) == 2:
+                return 200, "application/json", invoice
+            if parts[2] == "ticket":
+                from tickets import render_ticket
+                return 200, "text/plain", render_ticket(invoice)
+            if parts[2] == "pdf":
+                from pdf_export import invoice_pdf_bytes
+                return 200, "application/pdf", await self.call(invoice_pdf_bytes, invoice)
+        raise HTTPError(404, "ressource inconnue")
+
+    @staticmethod
+    def allow(method, expected):
+        if method != expected:
+            raise HTTPError(405, f"méthode {method} non permise")
+
+    @staticmethod
+    def json_body(body):
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError as error:
+            raise HTTPError(400, f"JSON invalide: {error}")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "objet JSON attendu")
+        return data
+
+
+async def serve_forever(api, host, port, ready=None):
+    server = await asyncio.start_server(api.handle_client, host, port, backlog=1024)
+    address = server.sockets[0].getsockname()
+    print(f"Service factures sur http://{address[0]}:{address[1]}", flush=True)
+    if ready:
+        ready(address)
+    async with server:
+        await server.serve_forever()
+
+
+def serve(db_path, host=DEFAULT_HOST, port=DEFAULT_PORT, pool_size=POOL_SIZE):
+    service = InvoiceService(db_path, pool_size)
+    api = InvoiceAPI(service, pool_size)
+    try:
+        asyncio.run(serve_forever(api, host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.executor.shutdown()
+        service.close()
@@ -0,0 +1,687 @@
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from analytics import RideAnalytics
+from fares import to_cents
+from invoices import minutes_text, time_minutes
+from reports import RevenueRollups
+from storage import atomic_write, date_ordinal
+
+ARCHIVE_DIR = "archives"
+ARCHIVE_SUFFIX = ".tia"
+# Old months kept zlib-compressed, decompressed when first read
+COMPRESSED_SUFFIX = ".tiz"
+# A damaged archive is kept under this suffix next to the rebuilt one
+DAMAGED_SUFFIX = ".damaged"
+MAGIC = b"TIA2"
+# Archives sealed before checksums were added are still read
+MAGIC_V1 = b"TIA1"
+BYTE_ORDER_MARK = 0x01020304
+
+# Fixed-width columns, in file order: (name, array typecode)
+ROW_COLUMNS = [
+    ("id", "q"), ("day", "i"), ("departure", "h"), ("arrival", "h"),
+    ("tarif_a", "i"), ("tarif_b", "i"), ("tarif_c", "i"), ("tarif_d", "i"),
+    ("resa", "i"), ("supplement", "i"), ("total", "i"), ("client", "I"),
+    # CRC-32 of each row with its client name, to salvage a damaged file
+    ("crc", "I"),
+    # Row numbers sorted by client code, day and total, for indexed search
+    ("by_client", "I"), ("by_day", "I"), ("by_total", "I"),
+]
+ROW_COLUMNS_V1 = [column for column in ROW_COLUMNS if column[0] != "crc"]
+# The row fields covered by the row checksum, id to total
+ROW_FIELDS = [name for name, _ in ROW_COLUMNS[:11]]
+ROW_STRUCT = struct.Struct("<qihhiiiiiii")
+# magic, byte order mark, row count, distinct names, then one offset per
+# column, the name offsets, the name bytes and the JSON footer (offset and
+# size), and last the CRC-32 of the whole file without that field
+HEADER = struct.Struct("<4sIII" + "Q" * (len(ROW_COLUMNS) + 4) + "I")
+HEADER_V1 = struct.Struct("<4sIII" + "Q" * (len(ROW_COLUMNS_V1) + 4))
+COMPRESSED_MAGIC = b"TIZ2"
+# magic, row count, first and last ID, first and last day, footer size,
+# block count and the CRC-32 of the rest of the file: the footer (as in the
+# archive) compressed, the compressed size of each block, then the blocks
+COMPRESSED_HEADER = struct.Struct("<4sIqqiiIII")
+# The archive file is compressed in blocks of this size after its header,
+# each its own zlib stream: a damaged byte only loses the rows of its block
+COMPRESSED_BLOCK = 1 << 11
+
+log = logging.getLogger("taxi123.archive")
+
+
+class ArchiveDamaged(ValueError):
+    pass
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _name_matches(query, name):
+    # Same rule as the live search index: prefix below 3 characters, else substring
+    return name.startswith(query) if len(query) < 3 else query in name
+
+
+def _checksum(buffer, end):
+    with memoryview(buffer) as view:
+        return zlib.crc32(view[HEADER.size:end], zlib.crc32(view[:HEADER.size - 4]))
+
+
+def _row_checksum(values, name_bytes):
+    return zlib.crc32(name_bytes, zlib.crc32(ROW_STRUCT.pack(*values)))
+
+
+def _read_header(buffer, path):
+    # (row columns, header fields) of a readable file, else ArchiveDamaged
+    magic = bytes(buffer[:4])
+    if magic == MAGIC and len(buffer) >= HEADER.size:
+        *fields, checksum = HEADER.unpack_from(buffer)
+        end = fields[-2] + fields[-1]
+        if end > len(buffer) or _checksum(buffer, end) != checksum:
+            raise ArchiveDamaged(f"Archive endommagée: {path}")
+        layout = ROW_COLUMNS
+    elif magic == MAGIC_V1 and len(buffer) >= HEADER_V1.size:
+        fields = HEADER_V1.unpack_from(buffer)
+        layout = ROW_COLUMNS_V1
+    else:
+        raise ArchiveDamaged(f"Archive illisible: {path}")
+    if fields[1] != BYTE_ORDER_MARK:
+        raise ArchiveDamaged(f"Archive illisible: {path}")
+    return layout, fields
+
+
+def _row_invoice(columns, row, name):
+    c = columns
+    return {
+        "id": c["id"][row],
+        "date": date.fromordinal(c["day"][row]).strftime("%d/%m/%Y"),
+        "name": name,
+        "departure_time": minutes_text(c["departure"][row]),
+        "arrival_time": minutes_text(c["arrival"][row]),
+        "total": c["total"][row] / 100,
+        "tarifs": [c["tarif_a"][row] / 100, c["tarif_b"][row] / 100,
+                   c["tarif_c"][row] / 100, c["tarif_d"][row] / 100],
+        "resa": c["resa"][row],
+        "add_to_total": c["supplement"][row] / 100,
+        "archived": True,
+    }
+
+
+def archive_path(directory, year, month):
+    return os.path.join(directory, f"{year:04d}-{month:02d}{ARCHIVE_SUFFIX}")
+
+
+def compressed_path(path):
+    return os.path.splitext(path)[0] + COMPRESSED_SUFFIX
+
+
+def month_days(path):
+    # First and last day ordinal of the month an archive is named after
+    year, month = map(int, os.path.basename(path)[:7].split("-"))
+    first = date(year, month, 1).toordinal()
+    return first, date(year + month // 12, month % 12 + 1, 1).toordinal() - 1
+
+
+def month_files(directory):
+    # Archive file of each sealed month, in month order. A month found both
+    # mapped and compressed is being compressed or sealed again (or was when
+    # a program stopped): the mapped file is complete, so it is the one read
+    paths = {}
+    if os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            month, suffix = os.path.splitext(filename)
+            if suffix == ARCHIVE_SUFFIX or (suffix == COMPRESSED_SUFFIX and month not in paths):
+                paths[month] = os.path.join(directory, filename)
+    return [paths[month] for month in sorted(paths)]
+
+
+def archive_signature(directory):
+    # Changes whenever a month is sealed, extended or compressed
+    try:
+        entries = os.scandir(directory)
+    except OSError:
+        return ()
+    with entries:
+        return tuple(sorted((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size) for entry in entries
+                            if entry.name.endswith((ARCHIVE_SUFFIX, COMPRESSED_SUFFIX))))
+
+
+def open_month(path):
+    if path.endswith(COMPRESSED_SUFFIX):
+        return CompressedMonth(path)
+    return MonthArchive(path)
+
+
+def write_archive(path, invoices):
+    """Seal invoices into a columnar archive file at `path`.
+
+    Invoices are stored in ID order; money as integer cents, dates as
+    ordinals, times as minutes and client names dictionary-encoded. Each row
+    carries a checksum and the header one for the whole file, which goes
+    through atomic_write().
+    """
+    invoices = sorted(invoices, key=lambda invoice: invoice['id'])
+    columns = {name: array(typecode) for name, typecode in ROW_COLUMNS}
+    codes = {}
+    encoded = []
+    for invoice in invoices:
+        tarifs = invoice['tarifs']
+        code = codes.setdefault(invoice['name'], len(codes))
+        if code == len(encoded):
+            encoded.append(invoice['name'].encode("utf-8"))
+        values = (invoice['id'], date_ordinal(invoice['date']),
+                  time_minutes(invoice.get('departure_time')), time_minutes(invoice.get('arrival_time')),
+                  to_cents(tarifs[0]), to_cents(tarifs[1]), to_cents(tarifs[2]), to_cents(tarifs[3]),
+                  int(invoice.get('resa', 0)), to_cents(invoice.get('add_to_total', 0)),
+                  to_cents(invoice['total']))
+        row = (*values, code, _row_checksum(values, encoded[code]))
+        for (name, _), value in zip(ROW_COLUMNS, row):
+            columns[name].append(value)
+    rows = range(len(invoices))
+    for name, key in (("by_client", columns["client"]), ("by_day", columns["day"]), ("by_total", columns["total"])):
+        columns[name].extend(sorted(rows, key=key.__getitem__))
+
+    names = list(codes)
+    name_offsets = array("Q", [0])
+    for blob in encoded:
+        name_offsets.append(name_offsets[-1] + len(blob))
+    client_starts = array("I", [0] * (len(names) + 1))
+    for code in columns["client"]:
+        client_starts[code + 1] += 1
+    for code in range(len(names)):
+        client_starts[code + 1] += client_starts[code]
+
+    rollups = RevenueRollups(invoices)
+    footer = json.dumps({
+        "client_starts": client_starts.tolist(),
+        "rollups": rollups.serialize(),
+        "analytics": RideAnalytics(invoices).serialize(),
+    }).encode("utf-8")
+
+    blocks = [columns[name].tobytes() for name, _ in ROW_COLUMNS]
+    blocks += [name_offsets.tobytes(), b"".join(encoded), footer]
+    offsets = []
+    position = _align(HEADER.size)
+    for block in blocks:
+        offsets.append(position)
+        position = _align(position + len(block))
+
+    data = bytearray(offsets[-1] + len(footer))
+    for offset, block in zip(offsets, blocks):
+        data[offset:offset + len(block)] = block
+    fields = (MAGIC, BYTE_ORDER_MARK, len(invoices), len(names), *offsets, len(footer))
+    HEADER.pack_into(data, 0, *fields, 0)
+    HEADER.pack_into(data, 0, *fields, _checksum(data, len(data)))
+    with atomic_write(path, 'wb') as f:
+        f.write(data)
+    return len(invoices)
+
+
+def _archive_bytes(path):
+    # The archive file, or as much of it as a compressed one still yields
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not path.endswith(COMPRESSED_SUFFIX):
+        return data
+    if len(data) < COMPRESSED_HEADER.size or data[:4] != COMPRESSED_MAGIC:
+        return b""
+    output = []
+    for index, block in enumerate(_compressed_blocks(data)[1]):
+        try:
+            output.append(zlib.decompress(block))
+        except zlib.error:
+            # Zeroes keep the next blocks at their offsets, and fail the
+            # checksum of every row this one held
+            output.append(bytes(COMPRESSED_BLOCK if index else HEADER.size))
+    return b"".join(output)
+
+
+def _compressed_blocks(data):
+    # The compressed footer and blocks of a .tiz file, cut where its header
+    # and block sizes say, without checking them
+    fields = COMPRESSED_HEADER.unpack_from(data)
+    footer_size, block_count = fields[6], fields[7]
+    start = COMPRESSED_HEADER.size + footer_size
+    table = data[start:start + 4 * block_count]
+    sizes = array("I")
+    sizes.frombytes(table[:len(table) - len(table) % 4])
+    blocks = []
+    position = start + len(table)
+    for size in sizes:
+        blocks.append(data[position:position + size])
+        position += size
+    return data[COMPRESSED_HEADER.size:start], blocks
+
+
+def salvage_archive(path):
+    """Invoices of a damaged archive whose row checksum still matches.
+
+    Reads the file without trusting it: a row is kept only if its fields
+    and client name hash to its stored checksum. Archives sealed before
+    checksums existed can't be salvaged.
+    """
+    data = _archive_bytes(path)
+    if data[:4] != MAGIC or len(data) < HEADER.size:
+        return []
+    _, _, count, name_count, *offsets, _ = HEADER.unpack_from(data)
+    columns = {}
+    for (name, typecode), offset in zip(ROW_COLUMNS, offsets):
+        column = array(typecode)
+        block = data[offset:offset + count * column.itemsize]
+        column.frombytes(block[:len(block) - len(block) % column.itemsize])
+        columns[name] = column
+    names_offset, blob_offset = offsets[len(ROW_COLUMNS):len(ROW_COLUMNS) + 2]
+    name_offsets = array("Q")
+    block = data[names_offset:names_offset + (name_count + 1) * 8]
+    name_offsets.frombytes(block[:len(block) - len(block) % 8])
+    invoices = []
+    for row in range(min(len(columns[name]) for name in (*ROW_FIELDS, "client", "crc"))):
+        code = columns["client"][row]
+        if code + 1 >= len(name_offsets):
+            continue
+        name_bytes = data[blob_offset + name_offsets[code]:blob_offset + name_offsets[code + 1]]
+        values = [columns[name][row] for name in ROW_FIELDS]
+        if _row_checksum(values, name_bytes) != columns["crc"][row]:
+            continue
+        try:
+            invoices.append(_row_invoice(columns, row, name_bytes.decode("utf-8")))
+        except (ValueError, OverflowError):
+            continue
+    return invoices
+
+
+def recover_archive(path):
+    # Rebuilds a damaged archive from its intact rows, keeping the damaged
+    # file aside; returns (MonthArchive or None, rows kept)
+    invoices = salvage_archive(path)
+    if not invoices:
+        # Nothing left to read: set aside so later starts don't retry it,
+        # and the file stays at hand for a manual recovery
+        log.error("%s endommagée: aucune facture récupérable, mise de côté en %s", path, path + DAMAGED_SUFFIX)
+        try:
+            os.replace(path, path + DAMAGED_SUFFIX)
+        except OSError as error:
+            log.warning("%s n'a pas pu être mise de côté: %s", path, error)
+        return None, 0
+    log.warning("%s endommagée: %d factures récupérées", path, len(invoices))
+    shutil.copyfile(path, path + DAMAGED_SUFFIX)
+    rebuilt = os.path.splitext(path)[0] + ARCHIVE_SUFFIX
+    write_archive(rebuilt, invoices)
+    if rebuilt != path:
+        os.remove(path)
+    return MonthArchive(rebuilt), len(invoices)
+
+
+def compress_month(path):
+    """Replace the archive at `path` with its compressed form; returns the
+    new path, or None when the archive file couldn't be removed (e.g. it is
+    still mapped by another terminal on Windows)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    archive = MonthArchive(path)
+    try:
+        footer = {"rollups": archive.rollups, "analytics": archive.analytics}
+        if archive.analytics is None:
+            footer["analytics"] = RideAnalytics(archive).serialize()
+        first_id, last_id = archive.ids[0], archive.ids[-1]
+        count = len(archive)
+    finally:
+        archive.close()
+    footer = zlib.compress(json.dumps(footer).encode("utf-8"))
+    first_day, last_day = month_days(path)
+    # The archive's header is a block of its own: no row can be read without it
+    starts = [0, *range(HEADER.size, len(data), COMPRESSED_BLOCK), len(data)]
+    blocks = [zlib.compress(data[start:end]) for start, end in zip(starts, starts[1:])]
+    sizes = array("I", map(len, blocks)).tobytes()
+    fields = (COMPRESSED_MAGIC, count, first_id, last_id, first_day, last_day, len(footer), len(blocks))
+    header = COMPRESSED_HEADER.pack(*fields, 0)
+    checksum = zlib.crc32(sizes, zlib.crc32(footer, zlib.crc32(header[:-4])))
+    for block in blocks:
+        checksum = zlib.crc32(block, checksum)
+    target = compressed_path(path)
+    with atomic_write(target, 'wb') as f:
+        f.write(COMPRESSED_HEADER.pack(*fields, checksum))
+        f.write(footer)
+        f.write(sizes)
+        f.writelines(blocks)
+    try:
+        os.remove(path)
+    except OSError:
+        # Both files would be found next time, and the uncompressed one wins
+        os.remove(target)
+        return None
+    return target
+
+
+class MonthArchive:
+    """Read-only, memory-mapped view of one sealed month.
+
+    Columns are memoryviews straight onto the mapped file; an invoice dict is
+    only built when a row is actually read.
+    """
+
+    def __init__(self, path, data=None):
+        # `data`: the file's bytes, already read (a decompressed month)
+        self.path = path
+        if data is None:
+            with open(path, 'rb') as f:
+                try:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    raise ArchiveDamaged(f"Archive vide: {path}") from None
+        else:
+            self._mmap = None
+        buffer = data if data is not None else self._mmap
+        try:
+            # One pass of CRC-32 over the file: cheap next to reading it
+            layout, (magic, mark, count, name_count, *offsets) = _read_header(buffer, path)
+        except ArchiveDamaged:
+            if self._mmap is not None:
+                self._mmap.close()
+            raise
+        view = memoryview(buffer)
+        self.count = count
+        self.columns = {}
+        for (name, typecode), offset in zip(layout, offsets):
+            size = array(typecode).itemsize
+            self.columns[name] = view[offset:offset + count * size].cast(typecode)
+        names_offset, blob_offset, footer_offset, footer_size = offsets[len(layout):]
+        name_offsets = view[names_offset:names_offset + (name_count + 1) * 8].cast("Q")
+        blob = bytes(view[blob_offset:blob_offset + name_offsets[name_count]])
+        self.names = [blob[name_offsets[i]:name_offsets[i + 1]].decode("utf-8") for i in range(name_count)]
+        footer = json.loads(bytes(view[footer_offset:footer_offset + footer_size]))
+        self.client_starts = footer["client_starts"]
+        self.rollups = footer["rollups"]
+        # Absent from months sealed before ride analytics existed
+        self.analytics = footer.get("analytics")
+        self.ids = self.columns["id"]
+        self.days = self.columns["day"]
+        self.totals = self.columns["total"]
+        # Highest ID of the month, like CompressedMonth's header field
+        self.last_id = self.ids[-1] if self.count else 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(self.count))]
+        if row < 0:
+            row += self.count
+        return _row_invoice(self.columns, row, self.names[self.columns["client"][row]])
+
+    def find(self, invoice_id):
+        row = bisect_left(self.ids, invoice_id)
+        return row if row < self.count and self.ids[row] == invoice_id else None
+
+    def search(self, name=None, date_from=None, date_to=None, total_min=None, total_max=None):
+        # Matching row numbers in ascending order, from the sorted columns
+        row_sets = []
+        if name:
+            query = name.casefold()
+            by_client = self.columns["by_client"]
+            rows = set()
+            for code, client in enumerate(self.names):
+                if _name_matches(query, client.casefold()):
+                    rows.update(by_client[self.client_starts[code]:self.client_starts[code + 1]])
+            row_sets.append(rows)
+        if date_from is not None or date_to is not None:
+            row_sets.append(self._range("by_day", self.days, date_from, date_to))
+        if total_min is not None or total_max is not None:
+            low = None if total_min is None else to_cents(total_min)
+            high = None if total_max is None else to_cents(total_max)
+            row_sets.append(self._range("by_total", self.totals, low, high))
+        if not row_sets:
+            return range(self.count)
+        row_sets.sort(key=len)
+        return sorted(set(row_sets[0]).intersection(*row_sets[1:]))
+
+    def _range(self, order, values, low, high):
+        permutation = self.columns[order]
+        start = 0 if low is None else bisect_left(permutation, low, key=values.__getitem__)
+        end = self.count if high is None else bisect_right(permutation, high, key=values.__getitem__)
+        return permutation[start:end]
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        self.ids = self.days = self.totals = None
+        self.columns = {}
+        if self._mmap is not None:
+            self._mmap.close()
+
+
+class CompressedMonth:
+    """A sealed month kept compressed, with the MonthArchive interface.
+
+    The file is checked and held compressed when opened; its row count,
+    ID and day range and footer come from the header, and the rows are only
+    decompressed on first use. Searches outside its days and lookups
+    outside its IDs don't decompress anything.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._archive = None
+        # API requests run on several threads and may decompress it together
+        self._lock = threading.Lock()
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < COMPRESSED_HEADER.size or data[:4] != COMPRESSED_MAGIC:
+            raise ArchiveDamaged(f"Archive illisible: {path}")
+        (_, self.count, self.first_id, self.last_id, self.first_day, self.last_day,
+         _, _, checksum) = COMPRESSED_HEADER.unpack_from(data)
+        with memoryview(data) as view:
+            if zlib.crc32(view[COMPRESSED_HEADER.size:], zlib.crc32(view[:COMPRESSED_HEADER.size - 4])) != checksum:
+                raise ArchiveDamaged(f"Archive endommagée: {path}")
+        footer, self._blocks = _compressed_blocks(data)
+        footer = json.loads(zlib.decompress(footer))
+        self.rollups = footer["rollups"]
+        self.analytics = footer["analytics"]
+
+    def load(self):
+        archive = self._archive
+        if archive is not None:
+            return archive
+        with self._lock:
+            if self._archive is None:
+                try:
+                    data = b"".join(map(zlib.decompress, self._blocks))
+                except zlib.error:
+                    raise ArchiveDamaged(f"Archive endommagée: {self.path}") from None
+                self._archive = MonthArchive(self.path, data)
+            return self._archive
+
+    def __getattr__(self, name):
+        # ids, days, totals, columns, names...: from the decompressed month.
+        # Never the private fields, which are missing only when __init__
+        # failed partway: looking them up here would recurse
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, row):
+        return self.load()[row]
+
+    def find(self, invoice_id):
+        if not self.first_id <= invoice_id <= self.last_id:
+            return None
+        return self.load().find(invoice_id)
+
+    def search(self, name=None, date_from=None, date_to=None, total_min=None, total_max=None):
+        if (date_from is not None and date_from > self.last_day) or (date_to is not None and date_to < self.first_day):
+            return []
+        return self.load().search(name, date_from, date_to, total_min, total_max)
+
+    def close(self):
+        with self._lock:
+            if self._archive is not None:
+                self._archive.close()
+                self._archive = None
+
+
+class ArchiveSet:
+    """All sealed months of a directory, read as one sequence in month order.
+
+    Months are either mapped archives or compressed ones. A month whose
+    checksum doesn't match is rebuilt from its intact rows; `recovered`
+    lists (path, rows kept) for each.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self.months = []
+        self.starts = [0]
+        self.recovered = []
+        self.last_id = 0
+        for path in month_files(directory):
+            try:
+                archive = open_month(path)
+            except ArchiveDamaged:
+                archive, kept = recover_archive(path)
+                self.recovered.append((path, kept))
+                if archive is None:
+                    continue
+            self.add(archive)
+        # Once recovery has rewritten or set aside the damaged months: the
+        # directory as read, not as found
+        self.signature = archive_signature(directory)
+
+    def add(self, archive):
+        self.months.append(archive)
+        self.starts.append(self.starts[-1] + len(archive))
+        self.last_id = max(self.last_id, archive.last_id)
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        month = bisect_right(self.starts, position) - 1
+        return self.months[month][position - self.starts[month]]
+
+    def __iter__(self):
+        for archive in self.months:
+            for row in range(len(archive)):
+                yield archive[row]
+
+    def get(self, invoice_id):
+        for archive in self.months:
+            row = archive.find(invoice_id)
+            if row is not None:
+                return archive[row]
+        return None
+
+    def search(self, **filters):
+        # Global positions of the matching archived invoices
+        positions = []
+        for start, archive in zip(self.starts, self.months):
+            positions.extend(start + row for row in archive.search(**filters))
+        return positions
+
+    def ids(self, positions):
+        # Invoice IDs of global positions, straight from the id columns
+        ids = []
+        for position in positions:
+            month = bisect_right(self.starts, position) - 1
+            ids.append(self.months[month].ids[position - self.starts[month]])
+        return ids
+
+    def sort_entries(self, column):
+        # (key, id) of every archived invoice for a history column, keyed
+        # like search.SORT_KEYS
+        entries = []
+        for archive in self.months:
+            if column == "date":
+                keys = archive.days
+            elif column == "total":
+                keys = [total / 100 for total in archive.totals]
+            else:
+                names = [name.casefold() for name in archive.names]
+                keys = [names[code] for code in archive.columns["client"]]
+            entries.extend(zip(keys, archive.ids))
+        return entries
+
+    def merge_rollups(self, rollups):
+        for archive in self.months:
+            rollups.merge(archive.rollups)
+
+    def merge_analytics(self, analytics):
+        for archive in self.months:
+            if archive.analytics is not None:
+                analytics.merge(archive.analytics)
+                continue
+            columns = archive.columns
+            for values in zip(archive.days, columns["departure"], columns["arrival"], archive.totals):
+                analytics.count(*values)
+
+    def close(self):
+        for archive in self.months:
+            archive.close()
+
+
+def seal_month(store, year, month, directory=ARCHIVE_DIR):
+    # Moves one month out of the live store; the rows are only deleted once
+    # the archive file is safely on disk
+    first = date(year, month, 1)
+    last = date(year + month // 12, month % 12 + 1, 1).toordinal() - 1
+    invoices = list(store.iter(date_from=first.toordinal(), date_to=last))
+    if not invoices:
+        return 0
+    live_ids = [invoice['id'] for invoice in invoices]
+    os.makedirs(directory, exist_ok=True)
+    path = archive_path(directory, year, month)
+    compressed = compressed_path(path)
+    existing_path = path if os.path.exists(path) else compressed if os.path.exists(compressed) else None
+    if existing_path:
+        # Rides entered late for a sealed month join the existing archive
+        # Rows already in it (a seal cut short, or another terminal sealing
+        # the same month) are only deleted from the store, never added twice
+        existing = open_month(existing_path)
+        invoices = [invoice for invoice in invoices if existing.find(invoice['id']) is None]
+        invoices.extend(existing[:])
+        existing.close()
+    write_archive(path, invoices)
+    if existing_path == compressed:
+        # Compressed again by the next retention pass
+        os.remove(compressed)
+    store.delete_many(live_ids)
+    return len(live_ids)
+
+
+def open_archives(store, directory=ARCHIVE_DIR):
+    # The ArchiveSet, once rows left in the store by a seal_month cut short
+    # between writing the archive and deleting them are gone
+    archives = ArchiveSet(directory)
+    for archive in archives.months:
+        first, last = month_days(archive.path)
+        sealed = [invoice['id'] for invoice in store.iter(date_from=first, date_to=last)
+                  if archive.find(invoice['id']) is not None]
+        if sealed:
+            store.delete_many(sealed)
+    return archives
+
+
+def closed_months(store, before_ordinal):
+    # (year, month) of every live month that ends before the given day
+    months = set()
+    for day in store.days(before=before_ordinal):
+        as_date = date.fromordinal(day)
+        months.add((as_date.year, as_date.month))
+    first_open = date.fromordinal(before_ordinal)
+    return sorted(month for month in months if month < (first_open.year, first_open.month))
@@ -0,0 +1,127 @@
+"""Load test of the local invoice service, from localhost clients only.
+
+    python benchmarks/api_load.py [--clients 200] [--requests 10000] [--port PORT]
+
+Without --port, a service is started on a temporary database and stopped at
+the end. Each client keeps one keep-alive connection and sends a mix of
+saves, fetches, listings, tickets and fare calculations.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (weight, request) mix
+MIX = [(20, "save"), (45, "get"), (15, "list"), (10, "ticket"), (10, "calculate")]
+
+
+def ride(rng):
+    return {"date": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024",
+            "name": f"CLIENT {rng.randrange(50)}", "departure_time": "08:00", "arrival_time": "08:40",
+            "tarifs": [round(rng.uniform(0, 60), 2), 0, 0, 0], "resa": rng.choice([0, 0, 5]),
+            "add_to_total": 0}
+
+
+async def request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def client(port, count, ids, rng, latencies, statuses):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    kinds = [kind for weight, kind in MIX for _ in range(weight)]
+    try:
+        for _ in range(count):
+            kind = rng.choice(kinds) if ids else "save"
+            start = time.perf_counter()
+            if kind == "save":
+                status, body = await request(reader, writer, "POST", "/invoices", ride(rng))
+                if status == 201:
+                    ids.append(json.loads(body)["id"])
+            elif kind == "get":
+                status, _ = await request(reader, writer, "GET", f"/invoices/{rng.choice(ids)}")
+            elif kind == "list":
+                status, _ = await request(reader, writer, "GET",
+                                          f"/invoices?client=CLIENT%20{rng.randrange(50)}&limit=50")
+            elif kind == "ticket":
+                status, _ = await request(reader, writer, "GET", f"/invoices/{rng.choice(ids)}/ticket")
+            else:
+                status, _ = await request(reader, writer, "POST", "/calculate", ride(rng))
+            latencies[kind].append((time.perf_counter() - start) * 1000)
+            statuses[status] += 1
+    finally:
+        writer.close()
+
+
+def percentile(ordered, point):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))]
+
+
+async def run(port, clients, total):
+    ids = []
+    latencies = {kind: [] for _, kind in MIX}
+    statuses = Counter()
+    rng = random.Random(0)
+    start = time.perf_counter()
+    per_client = max(1, total // clients)
+    await asyncio.gather(*(client(port, per_client, ids, random.Random(rng.random()), latencies, statuses)
+                           for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    done = sum(statuses.values())
+    print(f"{clients} clients, {done} requests in {elapsed:.2f} s: {done / elapsed:.0f} req/s")
+    print(f"{'request':<10}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind, times in latencies.items():
+        if times:
+            times.sort()
+            print(f"{kind:<10}{len(times):>8}{percentile(times, 50):>10.2f}"
+                  f"{percentile(times, 95):>10.2f}{percentile(times, 99):>10.2f}")
+    print("statuses: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())))
+    return 0 if all(status < 500 for status in statuses) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent localhost clients against the invoice service")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--port", type=int, help="port of a running service (default: start one)")
+    parser.add_argument("--connections", type=int, default=8, help="store connections of the started service")
+    args = parser.parse_args()
+
+    if args.port:
+        return asyncio.run(run(args.port, args.clients, args.requests))
+    with tempfile.TemporaryDirectory() as tmp:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "app.py"), "--db", os.path.join(tmp, "invoices.db"),
+             "serve", "--port", "0", "--connections", str(args.connections)],
+            cwd=tmp, stdout=subprocess.PIPE, text=True)
+        try:
+            # "Service factures sur http://127.0.0.1:PORT"
+            port = int(server.stdout.readline().rsplit(":", 1)[1])
+            return asyncio.run(run(port, args.clients, args.requests))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
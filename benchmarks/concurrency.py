@@ -0,0 +1,127 @@
+"""Several terminals saving and deleting on one invoices.db at once.
+
+    python benchmarks/concurrency.py [--terminals 8] [--invoices 300] [--shared] [--dir PATH]
+
+Each terminal is a process with its own InvoiceStore. It saves invoices one
+transaction at a time and deletes every fifth of its own. A watcher process
+follows along with changes(), the way the window polls. At the end no write
+may be missing, and the watcher's copy must match the database. Point --dir
+at a network folder (with --shared) to check a real share.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import InvoiceStore  # noqa: E402
+
+DELETE_EVERY = 5
+WATCH_INTERVAL = 0.01
+
+
+def terminal(db_path, shared, number, count, results):
+    store = InvoiceStore(db_path, shared=shared)
+    saved, deleted = [], []
+    for i in range(count):
+        invoice = {"date": "15/06/2024", "name": f"POSTE {number}", "departure_time": "08:00",
+                   "arrival_time": "08:30", "total": 13.7 + i, "tarifs": [10.0 + i, 0.0, 0.0, 0.0],
+                   "resa": 0, "add_to_total": 0.0}
+        saved.append(store.append(invoice))
+        if i % DELETE_EVERY == DELETE_EVERY - 1:
+            store.delete(saved[-2])
+            deleted.append(saved[-2])
+    store.close()
+    results.put((saved, deleted))
+
+
+def watcher(db_path, shared, stop, results):
+    # Replays other terminals' changes like TaxiApp.poll_changes
+    store = InvoiceStore(db_path, shared=shared)
+    version = store.data_version()
+    seen_id, seen_deletion = store.max_id(), store.last_deletion()
+    live = {invoice['id'] for invoice in store.iter()}
+    polls = 0
+    while True:
+        stopping = stop.is_set()
+        current = store.data_version()
+        if current != version:
+            version = current
+            added, deleted, seen_deletion = store.changes(seen_id, seen_deletion)
+            if added:
+                seen_id = added[-1]['id']
+            live.update(invoice['id'] for invoice in added)
+            live.difference_update(deleted)
+        polls += 1
+        if stopping:
+            break
+        time.sleep(WATCH_INTERVAL)
+    store.close()
+    results.put((sorted(live), polls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent saves and deletes from several processes")
+    parser.add_argument("--terminals", type=int, default=8)
+    parser.add_argument("--invoices", type=int, default=300, help="invoices saved per terminal")
+    parser.add_argument("--shared", action="store_true", help="network share mode (rollback journal)")
+    parser.add_argument("--dir", help="folder for the database (default: a temporary one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        db_path = os.path.join(tmp, "invoices.db")
+        store = InvoiceStore(db_path, shared=args.shared)
+        store.import_invoices([])
+        store.close()
+
+        results = multiprocessing.Queue()
+        watch_results = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        watch = multiprocessing.Process(target=watcher, args=(db_path, args.shared, stop, watch_results))
+        watch.start()
+        start = time.perf_counter()
+        processes = [multiprocessing.Process(target=terminal,
+                                             args=(db_path, args.shared, number, args.invoices, results))
+                     for number in range(args.terminals)]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        watched, polls = watch_results.get()
+        watch.join()
+
+        failed = [process.exitcode for process in processes + [watch] if process.exitcode]
+        expected = set()
+        for saved, deleted in outcomes:
+            expected.update(saved)
+            expected.difference_update(deleted)
+        store = InvoiceStore(db_path, shared=args.shared)
+        stored = {invoice['id'] for invoice in store.iter()}
+        store.close()
+
+    writes = sum(len(saved) + len(deleted) for saved, deleted in outcomes)
+    print(f"{args.terminals} terminals, {writes} writes in {elapsed:.2f} s "
+          f"({writes / elapsed:.0f} writes/s), watcher polled {polls} times")
+    problems = []
+    if failed:
+        problems.append(f"processes failed: exit codes {failed}")
+    if stored != expected:
+        problems.append(f"database differs: {len(expected - stored)} missing, {len(stored - expected)} unexpected")
+    if set(watched) != stored:
+        problems.append(f"watcher differs: {len(stored - set(watched))} missing, "
+                        f"{len(set(watched) - stored)} unexpected")
+    for problem in problems:
+        print(problem)
+    if not problems:
+        print(f"OK: {len(stored)} invoices, nothing lost")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""Fault injection: writers killed mid-way and damaged files, then recovery.
+
+    python benchmarks/crash_recovery.py [--trials 20] [--invoices 5000] [--seed 0]
+
+Each trial works on a fresh copy of one generated history:
+
+- seal: `app.py archive` is killed at a random moment. Every invoice must
+  then be found exactly once, in the store or in a sealed month.
+- compress: the same, killed while compressing the sealed months.
+- export: `app.py export` is killed while overwriting an earlier export,
+  which must be left either untouched or complete.
+- damage: random bytes of a sealed month, mapped or compressed on
+  alternate trials, are overwritten. The month must still open, with only
+  intact, unaltered rows.
+- legacy: invoices.json is cut at a random byte, as by a crash in the old
+  save. The import must keep every complete invoice before the cut.
+
+The time taken to open the archives, checksums included, is reported.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(ROOT))
+sys.path.insert(0, ROOT)
+
+from archive import ARCHIVE_DIR, ARCHIVE_SUFFIX, COMPRESSED_SUFFIX, open_archives  # noqa: E402
+from startup import make_history  # noqa: E402
+from storage import InvoiceStore, open_store  # noqa: E402
+
+APP = os.path.join(os.path.dirname(ROOT), "app.py")
+# Compared between the original history and what is left after a crash
+SCENARIOS = ("seal", "compress", "export", "damage", "legacy")
+COMPARED = ("date", "name", "departure_time", "arrival_time", "total", "tarifs", "resa", "add_to_total")
+
+
+def record(invoice):
+    return tuple(json.dumps(invoice[field]) for field in COMPARED)
+
+
+def run_killed(args, rng, duration):
+    # Starts the command and kills it somewhere within its usual duration
+    process = subprocess.Popen([sys.executable, APP, *args], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(rng.uniform(0, duration))
+    process.kill()
+    process.wait()
+    return process.returncode
+
+
+def timed_run(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, APP, *args], check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def history(db_path):
+    store = InvoiceStore(db_path)
+    invoices = {invoice['id']: record(invoice) for invoice in store.iter()}
+    store.close()
+    return invoices
+
+
+def trial_seal(source, original, rng, duration, tmp):
+    db_path = os.path.join(tmp, "invoices.db")
+    shutil.copy(source, db_path)
+    run_killed(["--db", db_path, "archive", "--before", "01/2024"], rng, duration)
+    return check_history(original, tmp)
+
+
+def trial_compress(sealed_db, sealed_dir, original, rng, duration, tmp):
+    db_path = os.path.join(tmp, "invoices.db")
+    shutil.copy(sealed_db, db_path)
+    shutil.copytree(sealed_dir, os.path.join(tmp, ARCHIVE_DIR))
+    run_killed(["--db", db_path, "archive", "--before", "01/2024", "--compress-after", "1"], rng, duration)
+    return check_history(original, tmp)
+
+
+def check_history(original, tmp):
+    # Every invoice once, live or archived; and how long the archives take to open
+    db_path = os.path.join(tmp, "invoices.db")
+    store = open_store(db_path, os.path.join(tmp, "none.journal"), os.path.join(tmp, "none.json"))
+    start = time.perf_counter()
+    archives = open_archives(store, os.path.join(tmp, ARCHIVE_DIR))
+    opened = time.perf_counter() - start
+    seen = [(invoice['id'], record(invoice)) for invoice in archives]
+    seen += [(invoice['id'], record(invoice)) for invoice in store.iter()]
+    archives.close()
+    store.close()
+    problems = []
+    if len(seen) != len(dict(seen)):
+        problems.append(f"{len(seen) - len(dict(seen))} invoices both live and archived")
+    if dict(seen) != original:
+        problems.append(f"{len(set(original) - dict(seen).keys())} invoices lost or changed")
+    return problems, opened
+
+
+def trial_export(source, rng, duration, tmp):
+    db_path = os.path.join(tmp, "invoices.db")
+    shutil.copy(source, db_path)
+    path = os.path.join(tmp, "export.jsonl")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("earlier export\n")
+    run_killed(["--db", db_path, "export", "-o", path], rng, duration)
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    if lines == ["earlier export"]:
+        return []
+    store = InvoiceStore(db_path)
+    expected = store.count()
+    store.close()
+    try:
+        complete = len(lines) == expected and all(json.loads(line) for line in lines)
+    except ValueError:
+        complete = False
+    return [] if complete else [f"export left half written ({len(lines)} of {expected} lines)"]
+
+
+def trial_damage(sealed_dir, rng, tmp):
+    directory = os.path.join(tmp, ARCHIVE_DIR)
+    shutil.copytree(sealed_dir, directory)
+    names = sorted(name for name in os.listdir(directory) if name.endswith((ARCHIVE_SUFFIX, COMPRESSED_SUFFIX)))
+    path = os.path.join(directory, rng.choice(names))
+    archives = open_archives(_NoStore(), directory)
+    original = {invoice['id']: record(invoice) for invoice in archives}
+    archives.close()
+    with open(path, 'r+b') as f:
+        size = os.path.getsize(path)
+        for _ in range(rng.randint(1, 8)):
+            f.seek(rng.randrange(size))
+            f.write(bytes([rng.randrange(256)]))
+    archives = open_archives(_NoStore(), directory)
+    kept = {invoice['id']: record(invoice) for invoice in archives}
+    archives.close()
+    problems = [f"altered row {invoice_id}" for invoice_id, row in kept.items() if original.get(invoice_id) != row]
+    return problems, len(original) - len(kept)
+
+
+class _NoStore:
+    # open_archives without a live store: nothing to delete
+    def iter(self, **filters):
+        return iter(())
+
+
+def trial_legacy(invoices, rng, tmp):
+    text = json.dumps(invoices, ensure_ascii=False, indent=4)
+    cut = rng.randrange(len(text))
+    json_path = os.path.join(tmp, "invoices.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        f.write(text[:cut])
+    store = open_store(os.path.join(tmp, "invoices.db"), os.path.join(tmp, "none.journal"), json_path)
+    imported = [record(invoice) for invoice in store.iter()]
+    store.close()
+    # Objects that end before the cut are complete
+    complete = len(json.loads(text[:text.rfind("}", 0, cut) + 1] + "]")) if "}" in text[:cut] else 0
+    problems = []
+    if imported != [record(invoice) for invoice in invoices[:complete]]:
+        problems.append(f"{len(imported)} invoices imported, {complete} complete before the cut")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kill writers and damage files, then check recovery")
+    parser.add_argument("--trials", type=int, default=20, help="trials per scenario")
+    parser.add_argument("--invoices", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as base:
+        source = os.path.join(base, "source.db")
+        make_history(source, args.invoices, args.seed)
+        original = history(source)
+
+        # Full runs give the window in which the kills land
+        scratch = os.path.join(base, "scratch")
+        os.makedirs(scratch)
+        shutil.copy(source, os.path.join(scratch, "invoices.db"))
+        export_time = timed_run(["--db", os.path.join(scratch, "invoices.db"), "export",
+                                 "-o", os.path.join(scratch, "export.jsonl")])
+        seal_time = timed_run(["--db", os.path.join(scratch, "invoices.db"), "archive", "--before", "01/2024"])
+        sealed_dir = os.path.join(scratch, ARCHIVE_DIR)
+        packed = os.path.join(base, "packed")
+        shutil.copytree(scratch, packed)
+        compress_time = timed_run(["--db", os.path.join(packed, "invoices.db"), "archive", "--before", "01/2024",
+                                   "--compress-after", "1"])
+        compressed_dir = os.path.join(packed, ARCHIVE_DIR)
+
+        legacy = [dict(zip(COMPARED, map(json.loads, row))) for _, row in sorted(original.items())[:500]]
+
+        open_times = []
+        lost = 0
+        for trial in range(args.trials):
+            for scenario in SCENARIOS:
+                tmp = os.path.join(base, f"{scenario}-{trial}")
+                os.makedirs(tmp)
+                if scenario == "seal":
+                    problems, opened = trial_seal(source, original, rng, seal_time, tmp)
+                    open_times.append(opened)
+                elif scenario == "compress":
+                    problems, opened = trial_compress(os.path.join(scratch, "invoices.db"), sealed_dir, original,
+                                                      rng, compress_time, tmp)
+                    open_times.append(opened)
+                elif scenario == "export":
+                    problems = trial_export(source, rng, export_time, tmp)
+                elif scenario == "damage":
+                    problems, dropped = trial_damage(compressed_dir if trial % 2 else sealed_dir, rng, tmp)
+                    lost += dropped
+                else:
+                    problems = trial_legacy(legacy, rng, tmp)
+                for problem in problems:
+                    print(f"{scenario} #{trial}: {problem}")
+                failures += bool(problems)
+                shutil.rmtree(tmp, ignore_errors=True)
+
+    open_times.sort()
+    print(f"{args.trials} trials x {len(SCENARIOS)} scenarios, {failures} failed")
+    print(f"damaged months: {lost} rows dropped in total over {args.trials} trials")
+    print(f"archives opened in {open_times[len(open_times) // 2] * 1000:.1f} ms (median, checksums included)")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from startup import make_history  # noqa: E402
+
+DEFAULT_SIZES = [10000, 100000, 500000]
+# Results stay out of the source tree unless --output says otherwise
+DEFAULT_OUTPUT = os.path.join(tempfile.gettempdir(), "taxi123-memory_results.jsonl")
+
+
+def traced_size(build):
+    # Bytes still allocated once build() has returned, i.e. held by its result
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def measure(db_path, json_path):
+    from invoices import Invoice, InvoiceColumns, dump_jsonl, load_jsonl
+    from storage import InvoiceStore
+
+    store = InvoiceStore(db_path)
+    until = store.max_id()
+    dicts, dict_bytes = traced_size(lambda: store.load_range(0, until, until))
+    names = {}
+    records, record_bytes = traced_size(
+        lambda: store.load_range(0, until, until, lambda row: Invoice.from_row(row, names)))
+    columns, column_bytes = traced_size(lambda: InvoiceColumns(records))
+    store.close()
+
+    # JSON export of the records must read back as the same invoices
+    dump_jsonl(json_path, records)
+    if load_jsonl(json_path) != records or [invoice.to_dict() for invoice in columns] != dicts:
+        raise SystemExit("JSON round trip changed the invoices")
+    count = len(dicts)
+    return {
+        "dict_bytes_per_invoice": round(dict_bytes / count, 1),
+        "slots_bytes_per_invoice": round(record_bytes / count, 1),
+        "columns_bytes_per_invoice": round(column_bytes / count, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per invoice: dicts, slotted records and columns")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON lines file results are appended to")
+    args = parser.parse_args()
+
+    run_at = datetime.now().isoformat(timespec="seconds")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            db_path = os.path.join(tmp, f"history_{size}.db")
+            make_history(db_path, size)
+            result = {"run_at": run_at, "invoices": size,
+                      **measure(db_path, os.path.join(tmp, f"history_{size}.jsonl"))}
+            print(f"{size:>8} invoices: dict {result['dict_bytes_per_invoice']:.0f} B, "
+                  f"slots {result['slots_bytes_per_invoice']:.0f} B, "
+                  f"columns {result['columns_bytes_per_invoice']:.0f} B per invoice")
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+START = time.perf_counter()
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+# Results stay out of the source tree unless --output says otherwise
+DEFAULT_OUTPUT = os.path.join(tempfile.gettempdir(), "taxi123-startup_results.jsonl")
+
+
+def make_history(path, size, seed=0):
+    from storage import InvoiceStore
+
+    rng = random.Random(seed)
+    first_day = date(2020, 1, 1).toordinal()
+    clients = [f"CLIENT {i}" for i in range(max(1, size // 20))]
+
+    def invoices():
+        for _ in range(size):
+            tarifs = [round(rng.uniform(0, 150), 2) for _ in range(4)]
+            yield {
+                "date": date.fromordinal(first_day + rng.randrange(1500)).strftime("%d/%m/%Y"),
+                "name": rng.choice(clients),
+                "departure_time": "08:00",
+                "arrival_time": "08:40",
+                "total": round(sum(tarifs) + 3.70, 2),
+                "tarifs": tarifs,
+                "resa": 0,
+                "add_to_total": 0.0,
+            }
+
+    store = InvoiceStore(path)
+    store.import_invoices([])
+    store.append_many(invoices())
+    store.close()
+
+
+def measure(db_path):
+    # Child process: one cold start of the window against db_path
+    import tkinter as tk
+    from gui import TaxiApp
+
+    root = tk.Tk()
+    app = TaxiApp(root, db_path=db_path)
+    root.update()
+    window = time.perf_counter() - START
+    while app.loading:
+        root.update()
+        time.sleep(0.001)
+    loaded = time.perf_counter() - START
+    root.after(0, app.on_close)
+    root.update()
+    return {"window_s": round(window, 4), "history_loaded_s": round(loaded, 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time of the invoice window by history size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON lines file results are appended to")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child)))
+        return
+
+    run_at = datetime.now().isoformat(timespec="seconds")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            db_path = os.path.join(tmp, f"history_{size}.db")
+            make_history(db_path, size)
+            output = subprocess.run([sys.executable, __file__, "--child", db_path],
+                                    cwd=tmp, capture_output=True, text=True, check=True).stdout
+            result = {"run_at": run_at, "invoices": size, **json.loads(output.splitlines()[-1])}
+            print(f"{size:>8} invoices: window {result['window_s']:.3f} s, "
+                  f"history loaded {result['history_loaded_s']:.3f} s")
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == '__main__':
+    main()
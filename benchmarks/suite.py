@@ -0,0 +1,339 @@
+"""Timings of the invoice window's hot paths by history size.
+
+    python benchmarks/suite.py run [--sizes 1000 10000] [-o results.json]
+    python benchmarks/suite.py compare baseline.json results.json [--threshold 0.15]
+
+Each size runs in its own process so peak memory is per history. The window
+is driven for real when a display is available (e.g. under xvfb-run);
+otherwise TaxiApp runs against a stand-in Treeview and inline workers, so the
+same methods are timed without Tk drawing anything.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(ROOT))
+sys.path.insert(0, ROOT)
+
+from startup import make_history  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+# Results stay out of the source tree unless -o says otherwise
+DEFAULT_OUTPUT = os.path.join(tempfile.gettempdir(), "taxi123-suite_results.json")
+# Timed calls per path and size
+REPEAT = 200
+# Slowdown (as a fraction of the baseline) reported as a regression
+DEFAULT_THRESHOLD = 0.15
+
+
+class FakeTree:
+    # Just enough of ttk.Treeview for VirtualTreeview and TaxiApp
+    def __init__(self, *args, **options):
+        self.items = []
+        self.values = {}
+        self._selection = ()
+        self._focus = ""
+
+    def bind(self, *args):
+        pass
+
+    def heading(self, column, **options):
+        pass
+
+    def get_children(self, item=""):
+        return tuple(self.items)
+
+    def insert(self, parent, position, iid, values):
+        iid = str(iid)
+        self.items.insert(len(self.items) if position == "end" else position, iid)
+        self.values[iid] = values
+        return iid
+
+    def delete(self, *iids):
+        for iid in map(str, iids):
+            self.items.remove(iid)
+            del self.values[iid]
+
+    def exists(self, iid):
+        return str(iid) in self.values
+
+    def item(self, iid, values=None):
+        if values is not None:
+            self.values[str(iid)] = values
+        return {"values": self.values[str(iid)]}
+
+    def index(self, iid):
+        return self.items.index(str(iid))
+
+    def focus(self, iid=None):
+        if iid is None:
+            return self._focus
+        self._focus = str(iid)
+
+    def selection_set(self, iid):
+        self._selection = (str(iid),)
+
+    def selection(self):
+        return self._selection
+
+
+class FakeScrollbar:
+    def __init__(self, *args, **options):
+        pass
+
+    def set(self, first, last):
+        pass
+
+
+class FakeVar:
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class InlineWorker:
+    # BackgroundWorker stand-in: jobs run at once on the calling thread
+    def submit(self, func, *args, on_done=None, on_error=None):
+        try:
+            result = func(*args)
+        except Exception as error:
+            if on_error is None:
+                raise
+            on_error(error)
+        else:
+            if on_done:
+                on_done(result)
+
+    def stop(self, timeout=None):
+        pass
+
+
+def headless_app(db_path):
+    # TaxiApp without a display: its state from init_state() and the history
+    # part of build_ui, with the Treeview, Tk variables and worker threads
+    # stood in for
+    import history_view
+    from gui import TaxiApp
+    from history_view import VirtualTreeview
+    from tickets import TicketCache
+
+    history_view.ttk = SimpleNamespace(Treeview=FakeTree, Scrollbar=FakeScrollbar)
+    app = TaxiApp.__new__(TaxiApp)
+    app.root = SimpleNamespace(after=lambda *args: None, after_idle=lambda *args: None,
+                               after_cancel=lambda *args: None)
+    app.db_path = db_path
+    app.instruments = None
+    app.init_state()
+    # The generated histories are dated in the past: keep them all live
+    app.retention = (0, 0)
+    # No print queue nor ticket files: they would live in the user's profile
+    app._start_spooler = lambda: 0
+    app.ticket_cache = TicketCache()
+    app.io_worker = app.print_worker = InlineWorker()
+    app.status_text = FakeVar()
+    app.history_view = VirtualTreeview(
+        None, ("date", "client", "total"),
+        row_values=lambda invoice: (invoice['date'], invoice['name'], f"{invoice['total']:.2f}"),
+        row_id=lambda invoice: invoice['id'],
+        height=13,
+    )
+    app.invoice_tree = app.history_view.tree
+    app.load_data()
+    if app.loading:
+        # Inline workers: the history is loaded by now unless a job failed
+        raise RuntimeError(app.status_text.get())
+    return app, lambda: None
+
+
+def display_app(db_path):
+    import tkinter as tk
+    from gui import TaxiApp
+
+    root = tk.Tk()
+    app = TaxiApp(root, db_path=db_path)
+
+    def pump():
+        root.update()
+    return app, pump
+
+
+def has_display():
+    try:
+        import tkinter as tk
+        tk.Tk().destroy()
+        return True
+    except Exception:
+        return False
+
+
+def timed(func, repeat=REPEAT):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {"mean_ms": round(statistics.fmean(times), 4),
+            "median_ms": round(times[len(times) // 2], 4),
+            "p95_ms": round(times[int(len(times) * 0.95)], 4)}
+
+
+def peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def measure(db_path, mode):
+    # Child process: every path against one history
+    from tickets import render_ticket
+
+    rng = random.Random(0)
+    results = {}
+    start = time.perf_counter()
+    app, pump = (display_app if mode == "display" else headless_app)(db_path)
+    while app.loading:
+        pump()
+    elapsed = round((time.perf_counter() - start) * 1000, 4)
+    results["load_data"] = {"mean_ms": elapsed, "median_ms": elapsed, "p95_ms": elapsed}
+
+    def save(i):
+        invoice = {"date": "15/06/2024", "name": f"BENCH {i % 10}", "departure_time": "08:00",
+                   "arrival_time": "08:30", "total": 25.7, "tarifs": [22.0, 0.0, 0.0, 0.0],
+                   "resa": 0, "add_to_total": 0.0}
+        app.store.append(invoice)
+        app.on_invoice_saved(invoice, False)
+        pump()
+    results["save_invoice"] = timed(save)
+
+    def refresh(i):
+        app.refresh_invoice_list()
+        pump()
+    results["refresh_invoice_list"] = timed(refresh)
+
+    def sort(i):
+        # Ascending, descending, natural order per column: the first click
+        # on a column builds its sort order
+        app.sort_by(("date", "client", "total")[i // 3 % 3])
+        pump()
+    results["sort_by"] = timed(sort, repeat=REPEAT - REPEAT % 9)
+
+    rows = app.all_rows
+
+    def select(i):
+        index = rng.randrange(len(rows))
+        app.history_view.scroll_to(index)
+        app.invoice_tree.selection_set(app.history_view.row_id(rows[index]))
+        app.on_select_invoice(None)
+        pump()
+    results["on_select_invoice"] = timed(select)
+
+    invoices = [rows[rng.randrange(len(rows))] for _ in range(REPEAT)]
+    results["render_ticket"] = timed(lambda i: render_ticket(invoices[i]))
+    results["ticket_cache_hit"] = timed(lambda i: app.ticket_cache.get(invoices[0]))
+    results["peak_memory_mb"] = peak_memory_mb()
+    app.store.close()
+    return results
+
+
+def run(args):
+    mode = "display" if args.display or (not args.headless and has_display()) else "headless"
+    report = {"run_at": datetime.now().isoformat(timespec="seconds"), "mode": mode,
+              "python": platform.python_version(), "platform": platform.platform(), "sizes": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            db_path = os.path.join(tmp, f"history_{size}.db")
+            make_history(db_path, size)
+            output = subprocess.run([sys.executable, __file__, "child", db_path, mode],
+                                    cwd=tmp, capture_output=True, text=True, check=True).stdout
+            results = json.loads(output.splitlines()[-1])
+            report["sizes"][str(size)] = results
+            print(f"{size:>8} invoices ({mode}): " + ", ".join(
+                f"{path} {value['mean_ms']:.3f} ms" for path, value in results.items() if isinstance(value, dict))
+                + f", peak {results['peak_memory_mb']} MB")
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results: {args.output}")
+
+
+def compare(args):
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.results, encoding='utf-8') as f:
+        results = json.load(f)
+    regressions = 0
+    print(f"{'size':>8} {'path':<22} {'before':>10} {'after':>10} {'change':>8}")
+    for size, paths in results["sizes"].items():
+        before_paths = baseline["sizes"].get(size, {})
+        for path, value in paths.items():
+            before = before_paths.get(path)
+            if before is None:
+                continue
+            if isinstance(value, dict):
+                # Medians: one descheduled call shifts a mean, not a median
+                before = before.get("median_ms", before["mean_ms"])
+                value, unit = value.get("median_ms", value["mean_ms"]), "ms"
+            else:
+                unit = "MB"
+            if not before or value is None:
+                continue
+            change = (value - before) / before
+            flag = ""
+            if change > args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{size:>8} {path:<22} {before:>8.3f}{unit} {value:>8.3f}{unit} {change:>+8.1%}{flag}")
+    if baseline.get("mode") != results.get("mode"):
+        print(f"Attention: modes differ ({baseline.get('mode')} / {results.get('mode')})")
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of save, load, refresh, select and ticket rendering")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_cmd = commands.add_parser("run", help="time every path for each history size")
+    run_cmd.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    run_cmd.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="JSON results file")
+    display = run_cmd.add_mutually_exclusive_group()
+    display.add_argument("--display", action="store_true", help="drive the real window (needs a display)")
+    display.add_argument("--headless", action="store_true", help="stand-in Treeview even if a display exists")
+    compare_cmd = commands.add_parser("compare", help="flag paths slower than a baseline run")
+    compare_cmd.add_argument("baseline")
+    compare_cmd.add_argument("results")
+    compare_cmd.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                             help="allowed slowdown, e.g. 0.15 for 15%% (default: %(default)s)")
+    child_cmd = commands.add_parser("child")
+    child_cmd.add_argument("db_path")
+    child_cmd.add_argument("mode")
+    args = parser.parse_args()
+
+    if args.command == "child":
+        print(json.dumps(measure(args.db_path, args.mode)))
+    elif args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import date
+from itertools import chain, islice
+
+from fares import RESA_AMOUNTS, compute_fare, to_cents
+from storage import DB_FILE, atomic_write, date_ordinal, open_store
+
+# Rides written per transaction during an import
+IMPORT_BATCH_SIZE = 5000
+CSV_FIELDS = ["date", "name", "departure_time", "arrival_time",
+              "tarif_a", "tarif_b", "tarif_c", "tarif_d", "resa", "add_to_total"]
+EXPORT_FORMATS = ("txt", "pdf", "csv", "jsonl")
+
+
+def read_rides(path):
+    # Yields (line number, ride) one at a time, whatever the file size;
+    # JSONL rides are left as text so a bad line only rejects that line
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_number, line
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def ride_amounts(ride):
+    # (tarifs, RESA, supplement) of a ride as the form allows them: four
+    # amounts, a RESA of 0, 4 or 7; ValueError otherwise
+    tarifs = ride.get("tarifs")
+    if tarifs is None:
+        tarifs = [ride.get(f"tarif_{letter}") or 0 for letter in "abcd"]
+    if not isinstance(tarifs, (list, tuple)) or len(tarifs) != 4:
+        raise ValueError("4 tarifs attendus")
+    if any(isinstance(tarif, bool) for tarif in tarifs):
+        raise ValueError(f"tarifs invalides: {tarifs!r}")
+    tarifs = [to_cents(tarif) / 100 for tarif in tarifs]
+    value = ride.get("resa") or 0
+    resa = to_cents(value)
+    if isinstance(value, bool) or resa % 100 or resa // 100 not in RESA_AMOUNTS:
+        raise ValueError(f"RESA invalide: {value!r} (0, 4 ou 7)")
+    return tarifs, resa // 100, to_cents(ride.get("add_to_total") or 0) / 100
+
+
+def ride_time(ride, field):
+    # "HH:MM" between 00:00 and 23:59; missing means 00:00
+    value = ride.get(field) or "00:00"
+    try:
+        hours, minutes = value.strip().split(":")
+        if not (hours.isdigit() and minutes.isdigit() and len(minutes) == 2):
+            raise ValueError
+        hours, minutes = int(hours), int(minutes)
+    except (AttributeError, ValueError):
+        raise ValueError(f"{field} invalide: {value!r} (HH:MM)") from None
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"{field} invalide: {value!r} (00:00 à 23:59)")
+    return f"{hours:02d}:{minutes:02d}"
+
+
+def ride_to_invoice(ride):
+    if isinstance(ride, str):
+        ride = json.loads(ride)
+    if not isinstance(ride, dict):
+        raise ValueError("objet attendu")
+    tarifs, resa, add_to_total = ride_amounts(ride)
+    name = ride.get("name") or ride.get("client") or ""
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError(f"nom du client manquant ou invalide: {name!r}")
+    name = name.strip()
+    date = ride.get("date") or ""
+    if not isinstance(date, str) or date_ordinal(date.strip()) is None:
+        raise ValueError(f"date invalide: {date!r}")
+    date = date.strip()
+    fare = compute_fare(tarifs, resa, add_to_total)
+    return {
+        "date": date,
+        "name": name,
+        "departure_time": ride_time(ride, "departure_time"),
+        "arrival_time": ride_time(ride, "arrival_time"),
+        "total": fare.total / 100,
+        "tarifs": tarifs,
+        "resa": resa,
+        "add_to_total": add_to_total,
+    }
+
+
+def import_rides(store, path, batch_size=IMPORT_BATCH_SIZE, errors=sys.stderr):
+    rejected = 0
+
+    def invoices():
+        nonlocal rejected
+        for line_number, ride in read_rides(path):
+            try:
+                yield ride_to_invoice(ride)
+            except (ValueError, TypeError) as error:
+                rejected += 1
+                print(f"{path}:{line_number}: ligne ignorée ({error})", file=errors)
+
+    imported = 0
+    stream = invoices()
+    while True:
+        batch = list(islice(stream, batch_size))
+        if not batch:
+            break
+        imported += store.append_many(batch)
+    return imported, rejected
+
+
+def archive_dir(db_path):
+    from archive import ARCHIVE_DIR
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), ARCHIVE_DIR)
+
+
+def archived_invoices(archives, client=None, date_from=None, date_to=None):
+    # Same filters as InvoiceStore.iter: client prefix and date range
+    positions = archives.search(date_from=date_ordinal(date_from) if date_from else None,
+                                date_to=date_ordinal(date_to) if date_to else None)
+    for position in positions:
+        invoice = archives[position]
+        if not client or invoice['name'].startswith(client):
+            yield invoice
+
+
+def export_invoices(store, archives, path, fmt, **filters):
+    invoices = chain(archived_invoices(archives, **filters), store.iter(**filters))
+    if fmt == "txt":
+        from tickets import write_tickets
+        return write_tickets(path, invoices)
+    if fmt == "pdf":
+        from pdf_export import write_pdf
+        return write_pdf(path, invoices)
+    count = 0
+    with atomic_write(path, 'w', encoding='utf-8', newline='') as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(["id"] + CSV_FIELDS + ["total"])
+            for invoice in invoices:
+                writer.writerow([invoice['id'], invoice['date'], invoice['name'],
+                                 invoice['departure_time'], invoice['arrival_time'],
+                                 *invoice['tarifs'], invoice['resa'], invoice['add_to_total'],
+                                 f"{invoice['total']:.2f}"])
+                count += 1
+        else:
+            for invoice in invoices:
+                # "archived" only marks rows read from a sealed month
+                record = {key: value for key, value in invoice.items() if key != 'archived'}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+
+def print_report(store, archives, grouping, out=sys.stdout, **filters):
+    from reports import RevenueRollups, format_report
+    rollups = RevenueRollups(store.iter(**filters))
+    if any(filters.values()):
+        for invoice in archived_invoices(archives, **filters):
+            rollups.add(invoice)
+    else:
+        # Sealed months carry their rollups: no need to read their rows
+        archives.merge_rollups(rollups)
+    headings = ("", "Courses", "CA TTC", "TVA", "Moyenne", "RESA", "Suppléments")
+    print("".join(f"{heading:>12}" for heading in headings), file=out)
+    for row in format_report(rollups.report(grouping)):
+        print("".join(f"{value:>12}" for value in row), file=out)
+
+
+def ride_analytics(store, archives, **filters):
+    from analytics import RideAnalytics
+    analytics = RideAnalytics(store.iter(**filters))
+    if any(filters.values()):
+        for invoice in archived_invoices(archives, **filters):
+            analytics.add(invoice)
+    else:
+        archives.merge_analytics(analytics)
+    return analytics
+
+
+def print_analytics(analytics, analysis, out=sys.stdout):
+    from analytics import format_analytics
+    headings = ("", "Courses", "CA TTC", "Moyenne", "Minutes", "Par minute")
+    print("".join(f"{heading:>14}" for heading in headings), file=out)
+    for row in format_analytics(analytics.report(analysis)):
+        print("".join(f"{value:>14}" for value in row), file=out)
+
+
+def seal_closed_months(store, directory, before):
+    from archive import closed_months, seal_month
+    sealed = []
+    for year, month in closed_months(store, before):
+        sealed.append((year, month, seal_month(store, year, month, directory)))
+    return sealed
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="app.py", description="Taxi 123 - factures sans interface graphique")
+    parser.add_argument("--db", default=DB_FILE, help="base de factures (défaut: %(default)s)")
+    parser.add_argument("--instrument", action="store_true",
+                        help="mesurer les opérations de stockage (aussi: TAXI123_INSTRUMENT=1)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_cmd = commands.add_parser("import", help="importer des courses depuis un fichier CSV ou JSONL")
+    import_cmd.add_argument("file", help="fichier .csv (colonnes: " + ", ".join(CSV_FIELDS) + ") ou .jsonl")
+    import_cmd.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE,
+                            help="courses par transaction (défaut: %(default)s)")
+
+    export_cmd = commands.add_parser("export", help="exporter des factures")
+    export_cmd.add_argument("--from", dest="date_from", help="date de début (JJ/MM/AAAA)")
+    export_cmd.add_argument("--to", dest="date_to", help="date de fin (JJ/MM/AAAA)")
+    export_cmd.add_argument("--client", help="début du nom du client")
+    export_cmd.add_argument("--format", choices=EXPORT_FORMATS, help="par défaut: extension du fichier de sortie")
+    export_cmd.add_argument("-o", "--output", required=True, help="fichier de sortie")
+
+    report_cmd = commands.add_parser("report", help="chiffre d'affaires, courses, TVA et course moyenne")
+    report_cmd.add_argument("--by", choices=("day", "month", "client", "band"), default="month",
+                            help="regroupement (défaut: %(default)s)")
+    report_cmd.add_argument("--from", dest="date_from", help="date de début (JJ/MM/AAAA)")
+    report_cmd.add_argument("--to", dest="date_to", help="date de fin (JJ/MM/AAAA)")
+
+    analytics_cmd = commands.add_parser("analytics", help="courses et CA par heure, jour de semaine et durée")
+    analytics_cmd.add_argument("--by", choices=("hour", "weekday", "duration", "slot"), default="hour",
+                               help="regroupement (défaut: %(default)s; slot: jour et heure)")
+    analytics_cmd.add_argument("--from", dest="date_from", help="date de début (JJ/MM/AAAA)")
+    analytics_cmd.add_argument("--to", dest="date_to", help="date de fin (JJ/MM/AAAA)")
+    analytics_cmd.add_argument("-o", "--output", help="enregistrer toutes les analyses en CSV")
+
+    archive_cmd = commands.add_parser("archive", help="clôturer les mois passés dans des archives en colonnes")
+    kept = archive_cmd.add_mutually_exclusive_group()
+    kept.add_argument("--before", help="premier mois laissé ouvert, MM/AAAA (défaut: mois en cours)")
+    kept.add_argument("--keep-months", type=int, help="mois laissés ouverts avant le mois en cours")
+    archive_cmd.add_argument("--compress-after", type=int,
+                             help="compresser les archives de plus de N mois")
+
+    serve_cmd = commands.add_parser("serve", help="service HTTP/JSON local pour créer et lire les factures")
+    serve_cmd.add_argument("--host", default="127.0.0.1", help="adresse d'écoute (défaut: %(default)s)")
+    serve_cmd.add_argument("--port", type=int, default=8765, help="port (défaut: %(default)s)")
+    serve_cmd.add_argument("--connections", type=int, default=8,
+                           help="connexions à la base et threads de stockage (défaut: %(default)s)")
+    return parser
+
+
+def check_dates(parser, args):
+    for value in (args.date_from, args.date_to):
+        if value and date_ordinal(value) is None:
+            parser.error(f"date invalide: {value}")
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        # Runs until interrupted, with its own pool of store connections
+        from api import serve
+        serve(args.db, args.host, args.port, args.connections)
+        return 0
+    from archive import DAMAGED_SUFFIX, open_archives
+    from instrument import Instruments, enabled_by_env, format_snapshot
+    instruments = Instruments() if args.instrument or enabled_by_env() else None
+    store = open_store(args.db)
+    if instruments:
+        instruments.wrap_storage(store)
+    started = time.perf_counter()
+    archives = open_archives(store, archive_dir(args.db))
+    if instruments:
+        instruments.record("archives.open", (time.perf_counter() - started) * 1000)
+        instruments.wrap_storage(archives=archives)
+    for path, kept in archives.recovered:
+        if kept:
+            print(f"Archive endommagée {path}: {kept} factures récupérées", file=sys.stderr)
+        else:
+            print(f"Archive illisible {path}: mise de côté en {path}{DAMAGED_SUFFIX}", file=sys.stderr)
+    try:
+        if args.command == "import":
+            imported, rejected = import_rides(store, args.file, args.batch_size)
+            print(f"{imported} factures importées, {rejected} lignes ignorées")
+        elif args.command == "report":
+            check_dates(parser, args)
+            print_report(store, archives, args.by, date_from=args.date_from, date_to=args.date_to)
+        elif args.command == "analytics":
+            check_dates(parser, args)
+            analytics = ride_analytics(store, archives, date_from=args.date_from, date_to=args.date_to)
+            if args.output:
+                from analytics import write_analytics_csv
+                write_analytics_csv(args.output, analytics)
+                print(f"Analyses enregistrées: {args.output}")
+            else:
+                print_analytics(analytics, args.by)
+        elif args.command == "export":
+            check_dates(parser, args)
+            fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+            if fmt not in EXPORT_FORMATS:
+                parser.error(f"format inconnu: {fmt!r} (choisir parmi {', '.join(EXPORT_FORMATS)})")
+            count = export_invoices(store, archives, args.output, fmt, client=args.client,
+                                    date_from=args.date_from, date_to=args.date_to)
+            print(f"{count} factures exportées: {args.output}")
+        elif args.command == "archive":
+            from retention import apply_retention, month_start
+            if args.keep_months is not None:
+                before = month_start(date.today(), max(args.keep_months, 0))
+            else:
+                before = date_ordinal(f"01/{args.before}") if args.before else date.today().replace(day=1).toordinal()
+            if before is None:
+                parser.error(f"mois invalide: {args.before}")
+            # The archive files are rewritten: release our own mappings first
+            archives.close()
+            for year, month, count in seal_closed_months(store, archive_dir(args.db), before):
+                print(f"{month:02d}/{year}: {count} factures archivées")
+            if args.compress_after:
+                _, compressed = apply_retention(store, archive_dir(args.db), 0, args.compress_after)
+                for path in compressed:
+                    print(f"{os.path.basename(path)[:7]}: archive compressée")
+    finally:
+        store.close()
+        archives.close()
+        if instruments:
+            instruments.record(f"cli.{args.command}", (time.perf_counter() - started) * 1000)
+            print(format_snapshot(instruments.snapshot()), file=sys.stderr)
+    return 0
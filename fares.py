@@ -0,0 +1,112 @@
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+# All amounts are integer cents (MAD centimes) so sums never drift
+PRISE_EN_CHARGE_CENTS = 370
+PRISE_EN_CHARGE = PRISE_EN_CHARGE_CENTS / 100
+# RESA options of the form, in euros
+RESA_AMOUNTS = (4, 7, 0)
+# TVA as printed on the tickets: 10% of the TTC total, HT is the remainder
+TVA_PERCENT = 10
+
+Fare = namedtuple("Fare", ["subtotal", "total", "tva", "ht"])
+FareBatch = namedtuple("FareBatch", ["subtotal", "total", "tva", "ht"])
+
+
+def to_cents(value):
+    # Accepts what the form fields hold ("12.5", "12,5", 7, 3.7) and rounds half up
+    if isinstance(value, str):
+        value = value.strip().replace(",", ".")
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"Montant invalide: {value!r}") from None
+    if not amount.is_finite():
+        raise ValueError(f"Montant invalide: {value!r}")
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_cents(cents):
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
+def tva_cents(total):
+    # Half-up rounding, away from zero for refunds
+    magnitude = (abs(total) * TVA_PERCENT + 50) // 100
+    return magnitude if total >= 0 else -magnitude
+
+
+def compute_fare(tarifs, resa=0, add_to_total=0):
+    return fare_from_cents([to_cents(tarif) for tarif in tarifs], to_cents(resa), to_cents(add_to_total))
+
+
+def fare_from_cents(tarifs, resa=0, add_to_total=0):
+    # Same as compute_fare for amounts already converted with to_cents
+    subtotal = sum(tarifs) + resa
+    total = subtotal + PRISE_EN_CHARGE_CENTS + add_to_total
+    tva = tva_cents(total)
+    return Fare(subtotal, total, tva, total - tva)
+
+
+def cents_array(values):
+    """Amounts to an int64 array of cents of the same shape.
+
+    Each amount goes through to_cents, so the batch rounds exactly like a
+    single fare; convert once, then keep the arrays in cents.
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=object)
+    return np.fromiter(map(to_cents, values.ravel()), dtype=np.int64, count=values.size).reshape(values.shape)
+
+
+def compute_fares_batch(tarifs, resa, add_to_total):
+    """Vectorized fare_from_cents over many rides.
+
+    `tarifs` is an (n, 4) array-like of cents, `resa` and `add_to_total`
+    length-n array-likes of cents (see cents_array for amounts). All the
+    math is int64. Returns a FareBatch of int64 cent arrays.
+    """
+    import numpy as np
+
+    def cents(values):
+        values = np.asarray(values)
+        if values.size and values.dtype.kind not in "iu":
+            raise TypeError(f"Montants en centimes entiers attendus, pas {values.dtype}")
+        return values.astype(np.int64)
+
+    subtotal = cents(tarifs).sum(axis=1) + cents(resa)
+    total = subtotal + PRISE_EN_CHARGE_CENTS + cents(add_to_total)
+    tva = np.sign(total) * ((np.abs(total) * TVA_PERCENT + 50) // 100)
+    return FareBatch(subtotal, total, tva, total - tva)
+
+
+if __name__ == '__main__':
+    # Per-ride path against the batch path: python fares.py
+    import random
+    import time
+
+    count = 1_000_000
+    rng = random.Random(0)
+    rides = [([round(rng.uniform(0, 300), 2) for _ in range(4)], rng.choice((0, 4, 7)), round(rng.uniform(0, 20), 2))
+             for _ in range(count)]
+
+    start = time.perf_counter()
+    single = [compute_fare(*ride).total for ride in rides]
+    per_ride = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tarifs = cents_array([ride[0] for ride in rides])
+    resa = cents_array([ride[1] for ride in rides])
+    supplements = cents_array([ride[2] for ride in rides])
+    conversion = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = compute_fares_batch(tarifs, resa, supplements)
+    vectorized = time.perf_counter() - start
+
+    assert batch.total.tolist() == single
+    print(f"{count} rides: per-ride {per_ride:.2f} s, conversion to cents {conversion:.2f} s, "
+          f"batch {vectorized:.3f} s ({per_ride / vectorized:.0f}x)")
@@ -0,0 +1,1472 @@
+import tkinter as tk
+from tkinter import messagebox, ttk, font, filedialog
+from datetime import datetime
+from bisect import bisect_left
+import logging
+import os
+import webbrowser
+from storage import DB_FILE, date_ordinal, open_store
+from history_view import ChainedRows, FilteredRows, IndexedRows, SortedRows, VirtualTreeview
+from archive import ARCHIVE_DIR, DAMAGED_SUFFIX, ArchiveSet, archive_signature, open_archives
+from retention import apply_retention, retention_settings
+from search import InvoiceIndex, SortOrders, range_slice
+from invoices import Invoice
+from fares import PRISE_EN_CHARGE, RESA_AMOUNTS, fare_from_cents, format_cents, to_cents
+from tickets import TicketCache, ticket_cache_dir, ticket_filename, write_tickets
+from worker import BackgroundWorker
+from spooler import PrintSpooler
+from reports import GROUPINGS, RevenueRollups, format_report
+from analytics import ANALYSES, REPORT_HEADINGS, WEEKDAYS, RideAnalytics, format_analytics, write_analytics_csv
+
+# Color scheme
+PRIMARY_COLOR = "#3498db"
+SECONDARY_COLOR = "#2ecc71"
+ACCENT_COLOR = "#e74c3c"
+BG_COLOR = "#f5f5f5"
+TEXT_COLOR = "#2c3e50"
+HIGHLIGHT_COLOR = "#f39c12"
+
+# Delay before the history filter runs after the last keystroke (ms)
+SEARCH_DEBOUNCE_MS = 150
+# The total follows the amount fields once typing pauses (ms)
+FARE_DEBOUNCE_MS = 150
+# History is streamed in chunks that start small (fast first rows) and double
+FIRST_LOAD_CHUNK = 500
+MAX_LOAD_CHUNK = 50000
+# Handlers timed when instrumentation is on, with every storage operation
+TIMED_CALLBACKS = ("calculate_total", "save_invoice", "refresh_invoice_list", "on_select_invoice",
+                   "apply_search", "delete_invoice", "print_invoice", "print_selected_invoice",
+                   "download_invoice", "download_invoice_pdf", "export_invoices", "on_chunk_loaded")
+DIAGNOSTICS_REFRESH_MS = 1000
+# How often other terminals' saves and deletes are looked for (ms)
+CHANGE_POLL_MS = 2000
+# Status bar refresh of the print queue while tickets are waiting (ms)
+SPOOL_STATUS_MS = 1000
+# Click a heading to sort by it: ascending, descending, then back to ID order
+HISTORY_HEADINGS = {"date": "Date", "client": "Client", "total": "Total (MAD)"}
+# Report tab title and first column heading per grouping
+REPORT_TABS = {"day": ("Par jour", "Jour"), "month": ("Par mois", "Mois"),
+               "client": ("Par client", "Client"), "band": ("Par tarif", "Tarifs")}
+ANALYSIS_TABS = {"hour": ("Par heure", "Départ"), "weekday": ("Par jour", "Jour"),
+                 "duration": ("Par durée", "Durée"), "slot": ("Jour et heure", "Créneau")}
+
+log = logging.getLogger("taxi123.gui")
+
+
+class TaxiApp:
+    def __init__(self, root, db_path=DB_FILE, instruments=None):
+        self.root = root
+        self.db_path = db_path
+        # Opt-in timings (instrument.Instruments); None costs nothing
+        self.instruments = instruments
+        self.root.title("Taxi 123 - Gestion des factures")
+        self.root.geometry("1000x630")
+        self.root.configure(bg=BG_COLOR)
+        self.root.minsize(800, 580)
+        
+        # Set up custom fonts
+        self.title_font = font.Font(family="Segoe UI", size=12, weight="bold")
+        self.subtitle_font = font.Font(family="Segoe UI", size=11, weight="bold")
+        self.normal_font = font.Font(family="Segoe UI", size=9)
+        self.small_font = font.Font(family="Segoe UI", size=8)
+        self.total_font = font.Font(family="Segoe UI", size=14, weight="bold")
+        
+        self.init_state()
+        # Storage runs on one thread so writes keep their order; printing and
+        # opening files get their own so a stuck spooler never delays a save
+        self.io_worker = BackgroundWorker(self.root, "invoice-io")
+        self.print_worker = BackgroundWorker(self.root, "invoice-print")
+        
+        if instruments:
+            # Before build_ui, so buttons and bindings get the timed methods
+            instruments.wrap(self, TIMED_CALLBACKS)
+            instruments.wrap(self.ticket_cache, ("get", "write"), "tickets.")
+        self.build_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after_idle(self.apply_theme)
+        self.load_data()
+        
+        # Set up app icon
+        try:
+            self.root.iconbitmap("taxi_icon.ico")
+        except:
+            pass
+
+    def init_state(self):
+        # Everything the window works on besides Tk itself and the worker
+        # threads; the headless benchmarks set up an app through it too
+
+        # History held as slotted Invoice records; one string per client name
+        self.data = []
+        self.invoices_by_id = {}
+        self.client_names = {}
+        # Sealed months (memory-mapped, read-only) come before the live invoices
+        self.archives = []
+        self.all_rows = ChainedRows(self.archives, self.data)
+        # (months kept live, months before compressing), applied at startup
+        self.retention = retention_settings()
+        self.archived_at_startup = 0
+        self.store = None
+        self.loading = True
+        self._saved_during_load = []
+        self._deleted_during_load = []
+        self._changes_job = None
+        # Set on the print thread, before any print job runs
+        self.spooler = None
+        self._spool_job = None
+        # Reprints of recent tickets are spooled from files already written
+        self.ticket_cache = TicketCache(directory=ticket_cache_dir(self.db_path))
+        self.search_index = InvoiceIndex()
+        self.rollups = RevenueRollups()
+        self.analytics = RideAnalytics()
+        self.search_filters = {}
+        self._search_job = None
+        self.sort_orders = SortOrders()
+        self.sort_column = None
+        self.sort_reverse = False
+        # Live total: each field's text and its cents, parsed once per edit
+        self._amount_cache = {}
+        self._fare_job = None
+        self.fare = None
+        self.fare_amounts = None
+        self.invalid_amounts = []
+
+        # Add variables for help window and tooltip
+        self.help_window = None
+        self.reports_window = None
+        self._reports_job = None
+        self.analytics_window = None
+        self._analytics_job = None
+        self.tooltip = None
+        self.diagnostics_window = None
+        self._diagnostics_job = None
+
+    def validate_time(self, value):
+        if value == "": return True
+        try:
+            val = int(value)
+            return 0 <= val <= 23 if len(value) <= 2 else False
+        except ValueError:
+            return False
+
+    def validate_minutes(self, value):
+        if value == "": return True
+        try:
+            val = int(value)
+            return 0 <= val <= 59 if len(value) <= 2 else False
+        except ValueError:
+            return False
+
+    def configure_styles(self, style):
+        # Configure custom button styles
+        style.configure("TLabel", background=BG_COLOR, foreground=TEXT_COLOR, font=self.normal_font)
+        style.configure("TFrame", background=BG_COLOR)
+        style.configure("TButton", font=self.normal_font)
+        style.configure("TEntry", font=self.normal_font)
+        style.configure("Header.TLabel", font=self.subtitle_font)
+        style.configure("Total.TLabel", font=self.total_font)
+        # Amount fields that can't be read are flagged in place
+        style.map("TEntry", foreground=[("invalid", ACCENT_COLOR)], fieldbackground=[("invalid", "#fdecea")])
+
+    def apply_theme(self):
+        # ttkthemes is slow to import, so the theme is applied once the window is up
+        try:
+            from ttkthemes import ThemedStyle
+        except ImportError:
+            return
+        style = ThemedStyle(self.root)
+        style.set_theme("arc")  # Using a modern theme from ttkthemes
+        self.configure_styles(style)
+
+    def build_ui(self):
+        # Main container with reduced padding
+        container = ttk.Frame(self.root, padding="5")
+        container.pack(fill="both", expand=True)
+        
+        self.configure_styles(ttk.Style())
+        
+        # Create main panels with better spacing
+        main_frame = ttk.PanedWindow(container, orient=tk.HORIZONTAL)
+        main_frame.pack(fill="both", expand=True, padx=2, pady=2)
+        
+        # Left panel (form)
+        left_frame = ttk.Frame(main_frame, padding="5")
+        left_frame.pack(side="left", fill="both", expand=True)
+        
+        # Right panel (invoice history)
+        right_frame = ttk.Frame(main_frame, padding="5")
+        right_frame.pack(side="right", fill="both", expand=True)
+        
+        main_frame.add(left_frame, weight=60)
+        main_frame.add(right_frame, weight=40)
+
+        # Form variables
+        self.nom_var = tk.StringVar()
+        self.date_var = tk.StringVar(value=datetime.now().strftime("%d/%m/%Y"))
+        self.depart_hour = tk.StringVar(value="00")
+        self.depart_minute = tk.StringVar(value="00")
+        self.arrivee_hour = tk.StringVar(value="00")
+        self.arrivee_minute = tk.StringVar(value="00")
+        self.tarif_vars = [tk.StringVar(value="0") for _ in range(4)]
+        self.resa_var = tk.IntVar(value=0)
+        self.add_to_total_var = tk.StringVar(value="0")
+        self.total_var = tk.StringVar(value="0.00")
+        self.subtotal_var = tk.StringVar(value="0.00")
+
+        # Left panel - Form section
+        form_title = ttk.Label(left_frame, text="FACTURE TAXI", font=self.title_font, foreground=PRIMARY_COLOR)
+        form_title.pack(pady=(0, 8))
+
+        form_frame = ttk.Frame(left_frame)
+        form_frame.pack(fill="both", expand=True)
+        
+        client_frame = ttk.LabelFrame(form_frame, text="Information Client", padding=5)
+        client_frame.pack(fill="x", pady=3)
+        
+        ttk.Label(client_frame, text="Nom du client:").grid(row=0, column=0, sticky="w", pady=2)
+        ttk.Entry(client_frame, textvariable=self.nom_var, width=30).grid(row=0, column=1, sticky="we", pady=2, padx=5)
+        
+        ttk.Label(client_frame, text="Date:").grid(row=1, column=0, sticky="w", pady=2)
+        date_entry = ttk.Entry(client_frame, textvariable=self.date_var, width=15)
+        date_entry.grid(row=1, column=1, sticky="w", pady=2, padx=5)
+        
+        time_frame = ttk.LabelFrame(form_frame, text="Heure de course", padding=5)
+        time_frame.pack(fill="x", pady=3)
+        
+        vcmd_hour = (self.root.register(self.validate_time), '%P')
+        vcmd_min = (self.root.register(self.validate_minutes), '%P')
+        
+        ttk.Label(time_frame, text="Départ:").grid(row=0, column=0, sticky="w", pady=2)
+        time_departure_frame = ttk.Frame(time_frame)
+        time_departure_frame.grid(row=0, column=1, sticky="w", pady=2)
+        
+        ttk.Spinbox(time_departure_frame, from_=0, to=23, width=5, 
+                    format="%02.0f", textvariable=self.depart_hour,
+                    validate='all', validatecommand=vcmd_hour).pack(side="left")
+        
+        ttk.Label(time_departure_frame, text=":").pack(side="left", padx=2)
+        
+        ttk.Spinbox(time_departure_frame, from_=0, to=59, width=5,
+                    format="%02.0f", textvariable=self.depart_minute,
+                    validate='all', validatecommand=vcmd_min).pack(side="left")
+        
+        ttk.Label(time_frame, text="Arrivée:").grid(row=1, column=0, sticky="w", pady=2)
+        time_arrival_frame = ttk.Frame(time_frame)
+        time_arrival_frame.grid(row=1, column=1, sticky="w", pady=2)
+        
+        ttk.Spinbox(time_arrival_frame, from_=0, to=23, width=5,
+                    format="%02.0f", textvariable=self.arrivee_hour,
+                    validate='all', validatecommand=vcmd_hour).pack(side="left")
+        
+        ttk.Label(time_arrival_frame, text=":").pack(side="left", padx=2)
+        
+        ttk.Spinbox(time_arrival_frame, from_=0, to=59, width=5,
+                    format="%02.0f", textvariable=self.arrivee_minute,
+                    validate='all', validatecommand=vcmd_min).pack(side="left")
+        
+        tariff_frame = ttk.LabelFrame(form_frame, text="Tarifs", padding=5)
+        tariff_frame.pack(fill="x", pady=3)
+        
+        # (label, variable, entry) of the free-typed amounts, tarifs first
+        self.amount_fields = []
+        tariff_labels = ["Tarif A Km", "Tarif B Km", "Tarif C Km", "Tarif D Km"]
+        for i, label in enumerate(tariff_labels):
+            row, col = divmod(i, 2)
+            ttk.Label(tariff_frame, text=label).grid(row=row, column=col*2, sticky="w", pady=2, padx=(5 if col else 0, 0))
+            entry = ttk.Entry(tariff_frame, textvariable=self.tarif_vars[i], width=8)
+            entry.grid(row=row, column=col*2+1, pady=2, padx=5)
+            self.amount_fields.append((label, self.tarif_vars[i], entry))
+        
+        resa_frame = ttk.LabelFrame(form_frame, text="RESA", padding=5)
+        resa_frame.pack(fill="x", pady=3)
+        
+        for i, val in enumerate(RESA_AMOUNTS):
+            ttk.Radiobutton(resa_frame, text=str(val), variable=self.resa_var, value=val).grid(row=0, column=i, padx=15)
+        
+        additional_frame = ttk.LabelFrame(form_frame, text="Suppléments", padding=5)
+        additional_frame.pack(fill="x", pady=3)
+        
+        ttk.Label(additional_frame, text="Ajouter au total:").grid(row=0, column=0, sticky="w", pady=2)
+        entry = ttk.Entry(additional_frame, textvariable=self.add_to_total_var, width=8)
+        entry.grid(row=0, column=1, sticky="w", pady=2, padx=5)
+        self.amount_fields.append(("Ajouter au total", self.add_to_total_var, entry))
+        for var in [*self.tarif_vars, self.resa_var, self.add_to_total_var]:
+            var.trace_add("write", self.schedule_fare)
+        
+        total_frame = ttk.Frame(form_frame, padding=5)
+        total_frame.pack(fill="x", pady=3)
+        
+        ttk.Label(total_frame, text="Sous-total:").grid(row=0, column=0, sticky="w", pady=2)
+        ttk.Label(total_frame, textvariable=self.subtotal_var).grid(row=0, column=1, sticky="e", pady=2)
+        ttk.Label(total_frame, text="MAD").grid(row=0, column=2, sticky="w", pady=2, padx=(5, 0))
+        
+        ttk.Label(total_frame, text="Prise en charge:").grid(row=1, column=0, sticky="w", pady=2)
+        ttk.Label(total_frame, text=f"{PRISE_EN_CHARGE:.2f}").grid(row=1, column=1, sticky="e", pady=2)
+        ttk.Label(total_frame, text="MAD").grid(row=1, column=2, sticky="w", pady=2, padx=(5, 0))
+        
+        ttk.Separator(total_frame, orient="horizontal").grid(row=2, column=0, columnspan=3, sticky="ew", pady=5)
+        
+        ttk.Label(total_frame, text="TOTAL:", font=self.subtitle_font).grid(row=3, column=0, sticky="w", pady=2)
+        ttk.Label(total_frame, textvariable=self.total_var, font=self.total_font, foreground=PRIMARY_COLOR).grid(row=3, column=1, sticky="e", pady=2)
+        ttk.Label(total_frame, text="MAD", font=self.subtitle_font).grid(row=3, column=2, sticky="w", pady=2, padx=(5, 0))
+        self.update_fare()
+        
+        button_frame = ttk.Frame(left_frame)
+        button_frame.pack(fill="x", pady=5)
+        
+        reset_btn = tk.Button(
+            button_frame, 
+            text="Réinitialiser", 
+            command=self.reset_form,
+            bg=ACCENT_COLOR,
+            fg="white",
+            font=self.normal_font,
+            relief=tk.RAISED,
+            borderwidth=2,
+            padx=5
+        )
+        reset_btn.pack(side="left", padx=2)
+        
+        calc_btn = tk.Button(
+            button_frame, 
+            text="Calculer", 
+            command=self.calculate_total,
+            bg=PRIMARY_COLOR,
+            fg="white",
+            font=self.normal_font,
+            relief=tk.RAISED,
+            borderwidth=2,
+            padx=5
+        )
+        calc_btn.pack(side="left", padx=2)
+        
+        save_btn = tk.Button(
+            button_frame, 
+            text="Enregistrer", 
+            command=self.save_invoice,
+            bg=PRIMARY_COLOR,
+            fg="white",
+            font=self.normal_font,
+            relief=tk.RAISED,
+            borderwidth=2,
+            padx=5
+        )
+        save_btn.pack(side="left", padx=2)
+        
+        print_btn = tk.Button(
+            button_frame, 
+            text="Enreg. et imprimer", 
+            command=lambda: self.save_invoice(print_it=True),
+            bg=SECONDARY_COLOR,
+            fg="white",
+            font=self.normal_font,
+            relief=tk.RAISED,
+            borderwidth=2,
+            padx=5
+        )
+        print_btn.pack(side="right", padx=2)
+        
+        # Right panel - Invoice history
+        title_frame = ttk.Frame(right_frame)
+        title_frame.pack(fill="x", pady=(0, 8))
+        
+        history_title = ttk.Label(title_frame, text="HISTORIQUE DES FACTURES", font=self.title_font, foreground=PRIMARY_COLOR)
+        history_title.pack(side="left")
+        
+        help_button = ttk.Button(title_frame, text="?", width=2, command=self.show_help)
+        help_button.pack(side="right")
+        
+        reports_button = ttk.Button(title_frame, text="Rapports", command=self.show_reports)
+        reports_button.pack(side="right", padx=(0, 3))
+        
+        analytics_button = ttk.Button(title_frame, text="Analyse", command=self.show_analytics)
+        analytics_button.pack(side="right", padx=(0, 3))
+        
+        if self.instruments:
+            diagnostics_button = ttk.Button(title_frame, text="Diagnostics", command=self.show_diagnostics)
+            diagnostics_button.pack(side="right", padx=(0, 3))
+        
+        help_button.bind("<Enter>", self.show_tooltip)
+        help_button.bind("<Leave>", self.hide_tooltip)
+        
+        self.title_frame = title_frame
+        self.help_button = help_button
+        
+        search_frame = ttk.LabelFrame(right_frame, text="Recherche", padding=5)
+        search_frame.pack(fill="x", pady=(0, 3))
+        
+        self.search_var = tk.StringVar()
+        self.search_date_from = tk.StringVar()
+        self.search_date_to = tk.StringVar()
+        self.search_total_min = tk.StringVar()
+        self.search_total_max = tk.StringVar()
+        
+        ttk.Label(search_frame, text="Client:").grid(row=0, column=0, sticky="w", pady=2)
+        ttk.Entry(search_frame, textvariable=self.search_var).grid(row=0, column=1, columnspan=5, sticky="we", pady=2, padx=5)
+        ttk.Button(search_frame, text="✕", width=2, command=self.clear_search).grid(row=0, column=6, pady=2)
+        
+        ttk.Label(search_frame, text="Du:").grid(row=1, column=0, sticky="w", pady=2)
+        ttk.Entry(search_frame, textvariable=self.search_date_from, width=10).grid(row=1, column=1, sticky="w", pady=2, padx=5)
+        ttk.Label(search_frame, text="Au:").grid(row=1, column=2, sticky="w", pady=2)
+        ttk.Entry(search_frame, textvariable=self.search_date_to, width=10).grid(row=1, column=3, sticky="w", pady=2, padx=5)
+        ttk.Label(search_frame, text="Total:").grid(row=2, column=0, sticky="w", pady=2)
+        ttk.Entry(search_frame, textvariable=self.search_total_min, width=10).grid(row=2, column=1, sticky="w", pady=2, padx=5)
+        ttk.Label(search_frame, text="à").grid(row=2, column=2, sticky="w", pady=2)
+        ttk.Entry(search_frame, textvariable=self.search_total_max, width=10).grid(row=2, column=3, sticky="w", pady=2, padx=5)
+        search_frame.columnconfigure(5, weight=1)
+        
+        for var in (self.search_var, self.search_date_from, self.search_date_to,
+                    self.search_total_min, self.search_total_max):
+            var.trace_add("write", self.schedule_search)
+        
+        columns = ("date", "client", "total")
+        self.history_view = VirtualTreeview(
+            right_frame,
+            columns,
+            row_values=lambda invoice: (invoice['date'], invoice['name'], f"{invoice['total']:.2f}"),
+            row_id=lambda invoice: invoice['id'],
+            height=13
+        )
+        self.invoice_tree = self.history_view.tree
+        
+        for column, text in HISTORY_HEADINGS.items():
+            self.invoice_tree.heading(column, text=text, command=lambda column=column: self.sort_by(column))
+        
+        self.invoice_tree.column("date", width=90)
+        self.invoice_tree.column("client", width=140)
+        self.invoice_tree.column("total", width=90, anchor="e")
+        
+        scrollbar = self.history_view.scrollbar
+        scrollbar.pack(side="right", fill="y")
+        self.invoice_tree.pack(fill="both", expand=True, pady=3)
+        
+        self.invoice_tree.bind("<<TreeviewSelect>>", self.on_select_invoice)
+        
+        action_frame = ttk.Frame(right_frame)
+        action_frame.pack(fill="x", pady=5)
+        
+        download_btn = tk.Button(
+            action_frame, 
+            text="Télécharger", 
+            command=self.download_invoice,
+            bg=PRIMARY_COLOR,
+            fg="white",
+            font=self.normal_font,
+            relief=tk.RAISED,
+            borderwidth=2,
+            padx=5
+        )
+        download_btn.pack(side="left", padx=2)
+        
+        pdf_btn = tk.Button(
+            action_frame, 
+            text="PDF", 
+            command=self.download_invoice_pdf,
+            bg=PRIMARY_COLOR,
+            fg="white",
+            font=self.normal_font,
+            relief=tk.RAISED,
+            borderwidth=2,
+            padx=5
+        )
+        pdf_btn.pack(side="left", padx=2)
+        
+        print_select_btn = tk.Button(
+            action_frame, 
+            text="Imprimer", 
+            command=lambda: self.print_selected_invoice(),
+            bg=SECONDARY_COLOR,
+            fg="white",
+            font=self.normal_font,
+            relief=tk.RAISED,
+            borderwidth=2,
+            padx=5
+        )
+        print_select_btn.pack(side="left", padx=2)
+        
+        export_btn = tk.Button(
+            action_frame, 
+            text="Exporter la liste", 
+            command=self.export_invoices,
+            bg=PRIMARY_COLOR,
+            fg="white",
+            font=self.normal_font,
+            relief=tk.RAISED,
+            borderwidth=2,
+            padx=5
+        )
+        export_btn.pack(side="left", padx=2)
+        
+        delete_btn = tk.Button(
+            action_frame, 
+            text="Effacer", 
+            command=self.delete_invoice,
+            bg=ACCENT_COLOR,
+            fg="white",
+            font=self.normal_font,
+            relief=tk.RAISED,
+            borderwidth=2,
+            padx=5
+        )
+        delete_btn.pack(side="right", padx=2)
+        
+        status_bar = ttk.Frame(self.root, relief=tk.SUNKEN)
+        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        self.status_text = tk.StringVar(value="Prêt")
+        ttk.Label(status_bar, textvariable=self.status_text, font=self.small_font).pack(side=tk.LEFT, padx=3, pady=1)
+        self.spool_text = tk.StringVar()
+        ttk.Label(status_bar, textvariable=self.spool_text, font=self.small_font).pack(side=tk.RIGHT, padx=3, pady=1)
+        
+        for button in [reset_btn, calc_btn, save_btn, print_btn, download_btn, pdf_btn, print_select_btn, export_btn, delete_btn]:
+            self._add_button_hover(button)
+        
+        self.refresh_invoice_list()
+
+    def _add_button_hover(self, button):
+        original_color = button["bg"]
+        
+        def on_enter(e):
+            r, g, b = button.winfo_rgb(original_color)
+            darker = f'#{int(r*0.8/256):02x}{int(g*0.8/256):02x}{int(b*0.8/256):02x}'
+            button["bg"] = darker
+            
+        def on_leave(e):
+            button["bg"] = original_color
+            
+        button.bind("<Enter>", on_enter)
+        button.bind("<Leave>", on_leave)
+
+    def schedule_fare(self, *args):
+        # Debounced like the search: typing only re-arms the timer
+        if self._fare_job:
+            self.root.after_cancel(self._fare_job)
+        self._fare_job = self.root.after(FARE_DEBOUNCE_MS, self.update_fare)
+
+    def _amount_cents(self, var):
+        # An empty field counts as 0; None when the text isn't an amount
+        key = str(var)
+        text = var.get()
+        cached = self._amount_cache.get(key)
+        if cached is None or cached[0] != text:
+            try:
+                cached = (text, to_cents(text or "0"))
+            except ValueError:
+                cached = (text, None)
+            self._amount_cache[key] = cached
+        return cached[1]
+
+    def update_fare(self):
+        self._fare_job = None
+        amounts = []
+        invalid = []
+        for label, var, entry in self.amount_fields:
+            cents = self._amount_cents(var)
+            entry.state(["invalid" if cents is None else "!invalid"])
+            if cents is None:
+                invalid.append(label)
+            amounts.append(cents)
+        was_invalid, self.invalid_amounts = self.invalid_amounts, invalid
+        if invalid:
+            self.fare = self.fare_amounts = None
+            self.subtotal_var.set("-")
+            self.total_var.set("-")
+            self.status_text.set(f"Montant invalide: {', '.join(invalid)}")
+            return None
+        self.fare_amounts = amounts
+        self.fare = fare_from_cents(amounts[:-1], self.resa_var.get() * 100, amounts[-1])
+        self.subtotal_var.set(format_cents(self.fare.subtotal))
+        self.total_var.set(format_cents(self.fare.total))
+        if was_invalid:
+            self.status_text.set(f"Total: {format_cents(self.fare.total)} MAD")
+        return self.fare
+
+    def calculate_total(self):
+        # The total is already live: this only skips a pending debounce
+        if self._fare_job:
+            self.root.after_cancel(self._fare_job)
+        fare = self.update_fare()
+        if fare is not None:
+            self.status_text.set("Total calculé avec succès")
+        return fare
+
+    def reset_form(self):
+        self.nom_var.set("")
+        self.date_var.set(datetime.now().strftime("%d/%m/%Y"))
+        self.depart_hour.set("00")
+        self.depart_minute.set("00")
+        self.arrivee_hour.set("00")
+        self.arrivee_minute.set("00")
+        for tarif_var in self.tarif_vars:
+            tarif_var.set("0")
+        self.resa_var.set(0)
+        self.add_to_total_var.set("0")
+        self.calculate_total()
+        self.status_text.set("Formulaire réinitialisé")
+
+    def save_invoice(self, print_it=False):
+        if not self.nom_var.get().strip():
+            messagebox.showwarning("Attention", "Veuillez entrer le nom du client")
+            return
+            
+        fare = self.calculate_total()
+        if fare is None:
+            # The fields are already flagged: back to the first one
+            label = self.invalid_amounts[0]
+            next(entry for name, var, entry in self.amount_fields if name == label).focus_set()
+            return
+        departure_time = f"{self.depart_hour.get()}:{self.depart_minute.get()}"
+        arrival_time = f"{self.arrivee_hour.get()}:{self.arrivee_minute.get()}"
+        # Amounts as parsed for the total, not read from the fields again
+        tarifs = [cents / 100 for cents in self.fare_amounts[:-1]]
+        resa_val = self.resa_var.get()  # Get the RESA value
+        add_val = self.fare_amounts[-1] / 100
+        invoice = {
+            "date": self.date_var.get(),
+            "name": self.nom_var.get(),
+            "departure_time": departure_time,
+            "arrival_time": arrival_time,
+            "total": fare.total / 100,
+            "tarifs": tarifs,  # Add tarifs to the invoice
+            "resa": resa_val,  # Add RESA value to the invoice
+            "add_to_total": add_val  # Add Ajouter au total value to the invoice
+        }
+        self.status_text.set(f"Enregistrement de la facture pour {invoice['name']}...")
+        self.io_worker.submit(
+            lambda: self.store.append(invoice),
+            on_done=lambda invoice_id: self.on_invoice_saved(invoice, print_it),
+            on_error=self.report_error
+        )
+
+    def on_invoice_saved(self, invoice, print_it):
+        invoice = Invoice.from_dict(invoice, self.client_names)
+        if self.loading:
+            # Older invoices are still streaming in; they go first to keep ID order
+            self._saved_during_load.append(invoice)
+        else:
+            self.add_to_history(invoice)
+        
+        if print_it:
+            self.print_invoice(invoice)
+        else:
+            self.status_text.set(f"Facture pour {invoice['name']} enregistrée")
+
+    def add_to_history(self, invoice):
+        # Usually the newest invoice, but another terminal's may arrive after
+        # ours: the insert position keeps the rows in ID order
+        index = bisect_left(self.data, invoice['id'], key=lambda invoice: invoice['id'])
+        self.data.insert(index, invoice)
+        self.invoices_by_id[invoice['id']] = invoice
+        self.search_index.add(invoice)
+        self.sort_orders.add(invoice)
+        self.rollups.add(invoice)
+        self.analytics.add(invoice)
+        self.schedule_reports_refresh()
+        if self.search_filters and not self.search_index.matches(invoice, **self.search_filters):
+            return
+        rows = self.history_view.rows
+        if isinstance(rows, SortedRows):
+            index = rows.insert(self.sort_orders.entry(self.sort_column, invoice))
+        else:
+            live = rows.live
+            if isinstance(live, SortedRows):
+                # Filtered on one range: listed in that column's order
+                index = live.insert(self.sort_orders.entry(self.search_index.range_column(**self.search_filters),
+                                                           invoice))
+            elif live is not self.data:
+                index = bisect_left(live.positions, invoice['id'])
+                live.positions.insert(index, invoice['id'])
+            index += rows.offset
+        self.history_view.row_inserted(index)
+
+    def remove_from_history(self, invoice):
+        # Live rows stay ordered by ID, so the row is found by bisection. The
+        # selection goes first: the row may not be in the current view
+        invoice_id = invoice['id']
+        selected = getattr(self, 'selected_invoice', None)
+        if selected is not None and selected['id'] == invoice_id:
+            del self.selected_invoice
+        index = bisect_left(self.data, invoice_id, key=lambda invoice: invoice['id'])
+        if index == len(self.data) or self.data[index]['id'] != invoice_id:
+            return
+        del self.data[index]
+        del self.invoices_by_id[invoice_id]
+        if self.loading:
+            # The search index is still being built on the storage thread
+            self._deleted_during_load.append(invoice)
+        else:
+            self.search_index.remove(invoice)
+        self.sort_orders.remove(invoice)
+        self.rollups.remove(invoice)
+        self.analytics.remove(invoice)
+        self.schedule_reports_refresh()
+        self.print_worker.submit(self.ticket_cache.invalidate, invoice_id, on_error=self.report_error)
+        rows = self.history_view.rows
+        if isinstance(rows, SortedRows):
+            index = rows.remove(self.sort_orders.entry(self.sort_column, invoice))
+            if index is None:
+                return
+        else:
+            live = rows.live
+            if isinstance(live, SortedRows):
+                index = live.remove(self.sort_orders.entry(self.search_index.range_column(**self.search_filters),
+                                                           invoice))
+                if index is None:
+                    return
+            elif live is not self.data:
+                index = bisect_left(live.positions, invoice_id)
+                if index == len(live.positions) or live.positions[index] != invoice_id:
+                    return
+                del live.positions[index]
+            index += rows.offset
+        self.history_view.row_deleted(index, invoice_id)
+
+    def report_error(self, error):
+        self.status_text.set(f"Erreur: {error}")
+
+    def refresh_invoice_list(self):
+        self.show_history()
+
+    def find_invoice(self, invoice_id):
+        # The archives are a plain [] until the store has been opened
+        invoice = self.invoices_by_id.get(invoice_id)
+        if invoice is None and self.archives:
+            invoice = self.archives.get(invoice_id)
+        return invoice
+
+    def history_rows(self):
+        # The rows for the current filter and sort, read lazily: sorted rows
+        # through the column's sort order, a filter on one range through
+        # the index slice (in that column's order), the others in ID order
+        filters = self.search_filters
+        column = self.search_index.range_column(**filters) if filters else None
+        if self.sort_column is None:
+            if not filters:
+                return self.all_rows
+            archived = IndexedRows(self.archives, self.archives.search(**filters)) if self.archives else []
+            if column:
+                live = SortedRows(self.search_index.range_entries(column, filters), self.invoices_by_id.get)
+            else:
+                live = IndexedRows(self.invoices_by_id, self.search_index.search(**filters))
+            return ChainedRows(archived, live)
+        entries = self.sort_orders.order(self.sort_column, self.data, self.archives)
+        if not filters:
+            entries = list(entries)
+        elif column == self.sort_column:
+            # Filtered on the sorted column: a slice of its order
+            entries = range_slice(entries, column, filters)
+        else:
+            # Filtered by ID against a mask built in one pass over the index
+            # arrays, padded to the highest ID of the order: archived IDs,
+            # and live ones the index doesn't hold yet while loading
+            mask = self.search_index.mask(**filters)
+            last_id = max(self.data[-1]['id'] if self.data else 0,
+                          self.archives.last_id if self.archives else 0)
+            mask.extend(bytes(max(0, last_id + 1 - len(mask))))
+            if self.archives:
+                for invoice_id in self.archives.ids(self.archives.search(**filters)):
+                    mask[invoice_id] = 1
+            return FilteredRows(entries, mask, self.find_invoice, self.sort_reverse)
+        return SortedRows(entries, self.find_invoice, self.sort_reverse)
+
+    def show_history(self, top=None):
+        # Only the visible window is redrawn, whatever the number of rows
+        rows = self.history_rows()
+        self.history_view.set_rows(rows, top=top)
+        if self.search_filters:
+            self.status_text.set(f"{len(rows)} facture(s) trouvée(s)")
+        else:
+            self.status_text.set(f"{len(rows)} factures au total")
+
+    def sort_by(self, column):
+        if column != self.sort_column:
+            self.sort_column, self.sort_reverse = column, False
+        elif not self.sort_reverse:
+            self.sort_reverse = True
+        else:
+            self.sort_column, self.sort_reverse = None, False
+        for name, text in HISTORY_HEADINGS.items():
+            if name == self.sort_column:
+                text += " ▼" if self.sort_reverse else " ▲"
+            self.invoice_tree.heading(name, text=text)
+        self.show_history(top=0)
+
+    def schedule_search(self, *args):
+        # Debounced: typing only re-arms the timer, the filter runs once
+        if self._search_job:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(SEARCH_DEBOUNCE_MS, self.apply_search)
+
+    def apply_search(self):
+        self._search_job = None
+        filters = {
+            "name": self.search_var.get().strip() or None,
+            "date_from": date_ordinal(self.search_date_from.get().strip()),
+            "date_to": date_ordinal(self.search_date_to.get().strip()),
+            "total_min": self._parse_amount(self.search_total_min.get()),
+            "total_max": self._parse_amount(self.search_total_max.get()),
+        }
+        if filters == self.search_filters:
+            return
+        # No criterion at all is stored as {}: the whole history
+        self.search_filters = filters if any(value is not None for value in filters.values()) else {}
+        self.show_history(top=0)
+
+    def clear_search(self):
+        for var in (self.search_var, self.search_date_from, self.search_date_to,
+                    self.search_total_min, self.search_total_max):
+            var.set("")
+
+    @staticmethod
+    def _parse_amount(text):
+        try:
+            return float(text.replace(",", "."))
+        except ValueError:
+            return None
+
+    def on_select_invoice(self, event):
+        selected_items = self.invoice_tree.selection()
+        if not selected_items:
+            return
+            
+        # Tree items are keyed by invoice ID
+        invoice_id = int(selected_items[0])
+        invoice = self.find_invoice(invoice_id)
+        if invoice:
+            self.selected_invoice = invoice
+            self.status_text.set(f"Facture sélectionnée: {invoice['name']}")
+
+    def print_selected_invoice(self):
+        if hasattr(self, 'selected_invoice'):
+            self.print_invoice(self.selected_invoice)
+        else:
+            messagebox.showinfo("Information", "Veuillez sélectionner une facture d'abord")
+
+    def delete_invoice(self):
+        if hasattr(self, 'selected_invoice') and self.selected_invoice.get('archived'):
+            messagebox.showinfo("Information", "Cette facture appartient à une période clôturée et ne peut pas être supprimée")
+        elif hasattr(self, 'selected_invoice'):
+            confirm = messagebox.askyesno("Confirmation", f"Êtes-vous sûr de vouloir supprimer la facture de {self.selected_invoice['name']}?")
+            if confirm:
+                self.io_worker.submit(self.store.delete, self.selected_invoice['id'], on_error=self.report_error)
+                self.remove_from_history(self.selected_invoice)
+                self.status_text.set(f"Facture supprimée")
+        else:
+            messagebox.showinfo("Information", "Veuillez sélectionner une facture d'abord")
+
+    def print_invoice(self, invoice):
+        # Queued, not printed: the spooler batches, retries and survives a restart
+        self.print_worker.submit(
+            lambda: self.spooler.submit(self.ticket_cache.get(invoice)),
+            on_done=lambda _: self.status_text.set(f"Facture pour {invoice['name']} ajoutée à la file d'impression"),
+            on_error=self.report_error
+        )
+        self.status_text.set(f"Impression de la facture en cours...")
+        if self._spool_job is None:
+            self._spool_job = self.root.after(SPOOL_STATUS_MS, self.update_spool_status)
+
+    def _start_spooler(self):
+        # Print thread: tickets left in the queue by a previous run go out now
+        self.spooler = PrintSpooler()
+        return self.spooler.depth
+
+    def on_spooler_started(self, depth):
+        if depth and self._spool_job is None:
+            self._spool_job = self.root.after(SPOOL_STATUS_MS, self.update_spool_status)
+
+    def update_spool_status(self):
+        # Polled only while tickets wait or the last job failed
+        self._spool_job = None
+        if self.spooler is None:
+            depth, error = 0, None
+        else:
+            depth, error = self.spooler.depth, self.spooler.last_error
+        if error:
+            self.spool_text.set(f"Impression: {depth} en attente - erreur: {error}")
+        elif depth:
+            self.spool_text.set(f"Impression: {depth} en attente")
+        else:
+            self.spool_text.set("")
+        if depth or self.spooler is None:
+            self._spool_job = self.root.after(SPOOL_STATUS_MS, self.update_spool_status)
+
+    def open_in_background(self, write, path, *args):
+        # Writes a file with write(path, *args) and opens it, off the Tk thread
+        def job():
+            write(path, *args)
+            webbrowser.open(path)
+            return path
+        
+        self.print_worker.submit(
+            job,
+            on_done=lambda path: self.status_text.set(f"Facture téléchargée: {path}"),
+            on_error=self.report_error
+        )
+
+    def download_invoice(self):
+        if hasattr(self, 'selected_invoice'):
+            path = os.path.join(os.getcwd(), ticket_filename(self.selected_invoice))
+            self.open_in_background(self.ticket_cache.write, path, self.selected_invoice)
+        else:
+            messagebox.showinfo("Information", "Veuillez sélectionner une facture d'abord")
+
+    def download_invoice_pdf(self):
+        if hasattr(self, 'selected_invoice'):
+            filename = os.path.splitext(ticket_filename(self.selected_invoice))[0] + ".pdf"
+            from pdf_export import write_invoice_pdf
+            self.open_in_background(write_invoice_pdf, os.path.join(os.getcwd(), filename), self.selected_invoice)
+        else:
+            messagebox.showinfo("Information", "Veuillez sélectionner une facture d'abord")
+
+    def export_invoices(self):
+        # Every invoice currently listed (e.g. a filtered month) in a single file
+        rows = self.history_view.rows
+        if not rows:
+            messagebox.showinfo("Information", "Aucune facture à exporter")
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".txt",
+            initialfile="factures.txt",
+            filetypes=[("Fichier texte", "*.txt"), ("PDF (une page par course)", "*.pdf")]
+        )
+        if path:
+            if path.lower().endswith(".pdf"):
+                from pdf_export import write_pdf as writer
+            else:
+                writer = write_tickets
+            # Snapshot the rows: the list may change while the export runs
+            self.io_worker.submit(
+                writer, path, list(rows),
+                on_done=lambda count: self.status_text.set(f"{count} factures exportées: {path}"),
+                on_error=self.report_error
+            )
+            self.status_text.set("Export en cours...")
+
+    def load_data(self):
+        # Runs after the window is built: the store is opened and the history
+        # streamed in on the storage thread, so startup doesn't grow with it
+        self.status_text.set("Chargement de l'historique...")
+        self.print_worker.submit(self._start_spooler, on_done=self.on_spooler_started, on_error=self.report_error)
+        self.io_worker.submit(self._open_store, on_done=self.on_store_opened, on_error=self.report_error)
+
+    def _open_store(self):
+        # Jobs queued behind this one (saves, deletes) find the store set
+        self.store = open_store(self.db_path)
+        if self.instruments:
+            self.instruments.wrap_storage(self.store)
+        self._archive_directory = os.path.join(os.path.dirname(os.path.abspath(self.db_path)), ARCHIVE_DIR)
+        keep_months, compress_after = self.retention
+        try:
+            if keep_months or compress_after:
+                # Rows left live by a seal cut short go first, as in the CLI;
+                # the months are unmapped again so they can be rewritten
+                open_archives(self.store, self._archive_directory).close()
+            # Old months leave the live store before anything is loaded
+            sealed, _ = apply_retention(self.store, self._archive_directory, keep_months, compress_after)
+            self.archived_at_startup = sum(count for _, _, count in sealed)
+        except OSError as error:
+            # Months mapped by another terminal: sealed by a later start
+            log.warning("Archivage automatique interrompu: %s", error)
+        archives = open_archives(self.store, self._archive_directory)
+        if self.instruments:
+            self.instruments.wrap_storage(archives=archives)
+        self._archive_signature = archives.signature
+        self._load_until = self.store.max_id()
+        # Starting point for picking up other terminals' changes
+        self._data_version = self.store.data_version()
+        self._seen_id = self._load_until
+        self._seen_deletion = self.store.last_deletion()
+        return archives
+
+    def on_store_opened(self, archives):
+        # Archived months are shown straight from their mapped columns, and
+        # their revenue comes from the rollups saved when they were sealed
+        self.archives = archives
+        self.all_rows = ChainedRows(archives, self.data)
+        archives.merge_rollups(self.rollups)
+        archives.merge_analytics(self.analytics)
+        self.show_history()
+        if archives.recovered:
+            messagebox.showwarning("Archives", "Archives endommagées reconstruites :\n" + "\n".join(
+                f"{os.path.basename(path)} : {kept} factures récupérées" if kept else
+                f"{os.path.basename(path)} : illisible, mise de côté ({DAMAGED_SUFFIX})"
+                for path, kept in archives.recovered))
+        self._load_chunk(0, FIRST_LOAD_CHUNK, InvoiceIndex())
+
+    def _load_chunk(self, after_id, size, index):
+        self.io_worker.submit(
+            self._read_chunk, after_id, size, index,
+            on_done=lambda loaded: self.on_chunk_loaded(loaded, size, index),
+            on_error=self.report_error
+        )
+
+    def _read_chunk(self, after_id, size, index):
+        # Storage thread: the per-row work happens here and the Tk thread
+        # only merges the chunk's buckets. `index` is read by the Tk thread
+        # once the whole history is in it
+        chunk = self.store.load_range(after_id, self._load_until, size, self._invoice_record)
+        index.extend(chunk)
+        return chunk, RevenueRollups(chunk).serialize(), RideAnalytics(chunk).serialize()
+
+    def _invoice_record(self, row):
+        # Runs on the storage thread, row by row as the chunk is read
+        return Invoice.from_row(row, self.client_names)
+
+    def on_chunk_loaded(self, loaded, size, index):
+        chunk, rollups, analytics = loaded
+        self.data.extend(chunk)
+        self.invoices_by_id.update((invoice.id, invoice) for invoice in chunk)
+        self.sort_orders.extend(chunk)
+        self.rollups.merge(rollups)
+        self.analytics.merge(analytics)
+        self.schedule_reports_refresh()
+        if self.history_view.rows is self.all_rows:
+            self.history_view.rows_extended()
+        elif self.sort_column and not self.search_filters:
+            # Loaded rows land anywhere in a sorted list
+            self.show_history()
+        if len(chunk) == size:
+            self.status_text.set(f"Chargement... {len(self.all_rows)} factures")
+            self._load_chunk(chunk[-1].id, min(size * 2, MAX_LOAD_CHUNK), index)
+        else:
+            self.on_history_loaded(index)
+
+    def on_history_loaded(self, index):
+        # Searches so far only saw the archives: the live rows are now
+        # indexed, less those deleted meanwhile
+        for invoice in self._deleted_during_load:
+            index.remove(invoice)
+        self._deleted_during_load = []
+        self.search_index = index
+        self.loading = False
+        for invoice in self._saved_during_load:
+            self.add_to_history(invoice)
+        self._saved_during_load = []
+        if self.search_filters:
+            # A filter typed during loading only saw part of the history
+            self.search_filters = None
+            self.apply_search()
+        else:
+            self.status_text.set(f"{len(self.all_rows)} factures au total")
+        if self.archived_at_startup:
+            self.status_text.set(f"{self.status_text.get()} ({self.archived_at_startup} anciennes archivées)")
+        self._changes_job = self.root.after(CHANGE_POLL_MS, self.poll_changes)
+
+    def poll_changes(self):
+        # Other terminals sharing invoices.db: queued behind our own writes
+        self._changes_job = None
+        self.io_worker.submit(self._read_changes, on_done=self.on_changes, on_error=self.on_changes_error)
+
+    def _read_changes(self):
+        # Storage thread: data_version only moves when another connection
+        # committed, so an idle poll is a single pragma
+        version = self.store.data_version()
+        if version == self._data_version:
+            return [], [], None
+        self._data_version = version
+        added, deleted, self._seen_deletion = self.store.changes(
+            self._seen_id, self._seen_deletion, self._invoice_record)
+        if added:
+            self._seen_id = added[-1].id
+        archives = None
+        if deleted:
+            # Rows deleted because another terminal sealed their month
+            signature = archive_signature(self._archive_directory)
+            if signature != self._archive_signature:
+                archives = ArchiveSet(self._archive_directory)
+                if self.instruments:
+                    self.instruments.wrap_storage(archives=archives)
+                self._archive_signature = archives.signature
+        return added, deleted, archives
+
+    def on_changes(self, changes):
+        # Our own saves and deletes come back too: they are already applied
+        added = [invoice for invoice in changes[0] if invoice.id not in self.invoices_by_id]
+        deleted = [self.invoices_by_id[invoice_id] for invoice_id in changes[1] if invoice_id in self.invoices_by_id]
+        archives = changes[2]
+        moved = []
+        if archives is not None:
+            moved = [invoice for invoice in deleted if archives.get(invoice['id']) is not None]
+            moved_ids = {invoice['id'] for invoice in moved}
+            deleted = [invoice for invoice in deleted if invoice['id'] not in moved_ids]
+            self.on_archives_changed(archives, moved)
+        for invoice in added:
+            self.add_to_history(invoice)
+        for invoice in deleted:
+            self.remove_from_history(invoice)
+        if added or deleted or moved:
+            self.status_text.set(f"Historique mis à jour depuis un autre poste ({len(added)} ajout(s), "
+                                 f"{len(deleted)} suppression(s), {len(moved)} archivée(s))")
+        self._changes_job = self.root.after(CHANGE_POLL_MS, self.poll_changes)
+
+    def on_archives_changed(self, archives, moved):
+        # Sealed invoices are still in the history, now read from the
+        # archives: the totals and analytics already count them
+        moved_ids = {invoice['id'] for invoice in moved}
+        for invoice in moved:
+            del self.invoices_by_id[invoice['id']]
+            self.search_index.remove(invoice)
+        self.data[:] = [invoice for invoice in self.data if invoice['id'] not in moved_ids]
+        old, self.archives = self.archives, archives
+        self.all_rows = ChainedRows(archives, self.data)
+        # Archived entries of the sort orders came from the old months
+        self.sort_orders = SortOrders()
+        self.show_history()
+        if old:
+            old.close()
+
+    def on_changes_error(self, error):
+        self.report_error(error)
+        self._changes_job = self.root.after(CHANGE_POLL_MS, self.poll_changes)
+
+    def on_close(self):
+        # Pending saves and deletes are flushed before the store is closed
+        if self._changes_job:
+            self.root.after_cancel(self._changes_job)
+        if self._spool_job:
+            self.root.after_cancel(self._spool_job)
+        self.print_worker.stop(timeout=5)
+        if self.spooler:
+            # Tickets not yet printed stay queued on disk for the next start
+            self.spooler.stop(timeout=1)
+        self.io_worker.stop()
+        if self.store:
+            self.store.close()
+        if self.archives:
+            self.archives.close()
+        self.root.destroy()
+
+    def show_tooltip(self, event):
+        if self.tooltip:
+            self.tooltip.destroy()
+        self.tooltip = tk.Label(
+            self.root,  # Use the root window for consistent placement
+            text="Aide",
+            background="white",
+            relief="solid",
+            borderwidth=1
+        )
+        # Calculate the position relative to the help button
+        x = self.help_button.winfo_rootx() - self.root.winfo_rootx()
+        y = self.help_button.winfo_rooty() - self.root.winfo_rooty() + self.help_button.winfo_height() + 10
+        self.tooltip.place(x=x, y=y)
+
+    def hide_tooltip(self, event):
+        if self.tooltip:
+            self.tooltip.destroy()
+            self.tooltip = None
+
+    def show_help(self):
+        if self.help_window and self.help_window.winfo_exists():
+            self.help_window.lift()
+            self.help_window.focus_force()
+        else:
+            self.help_window = tk.Toplevel(self.root)
+            self.help_window.title("Aide - Taxi 123")
+            self.help_window.geometry("450x350")
+            self.help_window.transient(self.root)
+
+            header_frame = tk.Frame(self.help_window, pady=10)
+            header_frame.pack(fill="x")
+            header_label = tk.Label(
+                header_frame, 
+                text="Aide - Instructions d'utilisation", 
+                font=self.title_font
+            )
+            header_label.pack()
+
+            content_frame = tk.Frame(self.help_window, padx=10, pady=10)
+            content_frame.pack(fill="both", expand=True)
+
+            instructions = tk.Text(
+                content_frame, 
+                wrap="word", 
+                height=15, 
+                width=50, 
+                font=self.normal_font, 
+                relief="flat"
+            )
+            instructions.insert("end", "Instructions d'utilisation\n", "header")
+            instructions.insert("end", "\nCréer une facture :\n", "subheader")
+            instructions.insert("end", "1. Remplissez les informations du client (nom et date).\n")
+            instructions.insert("end", "2. Entrez les heures de départ et d'arrivée.\n")
+            instructions.insert("end", "3. Ajoutez les tarifs (A, B, C, D) en kilomètres.\n")
+            instructions.insert("end", "4. Sélectionnez une option RESA (4, 7, ou 0).\n")
+            instructions.insert("end", "5. Ajoutez un supplément si nécessaire.\n")
+            instructions.insert("end", "6. Le total se met à jour pendant la saisie ; un montant invalide apparaît en rouge.\n")
+            instructions.insert("end", "7. Cliquez sur 'Enregistrer' pour sauvegarder ou 'Enreg. et imprimer' pour imprimer.\n")
+            instructions.insert("end", "\nHistorique des factures :\n", "subheader")
+            instructions.insert("end", "- Sélectionnez une facture dans la liste.\n")
+            instructions.insert("end", "- 'Télécharger' pour sauvegarder en fichier texte.\n")
+            instructions.insert("end", "- 'Imprimer' pour imprimer la facture sélectionnée.\n")
+            instructions.insert("end", "- 'PDF' pour sauvegarder la facture sélectionnée en PDF.\n")
+            instructions.insert("end", "- 'Exporter la liste' pour enregistrer toutes les factures affichées dans un seul fichier (texte ou PDF).\n")
+            instructions.insert("end", "- 'Effacer' pour supprimer la facture sélectionnée.\n")
+            instructions.insert("end", "- 'Rapports' pour le chiffre d'affaires par jour, mois, client et tarif.\n")
+            instructions.insert("end", "- 'Analyse' pour les courses par heure, jour de semaine et durée (exportable en CSV).\n")
+            keep_months, _ = self.retention
+            if keep_months:
+                instructions.insert("end", f"- Les factures de plus de {keep_months} mois sont archivées au démarrage ; "
+                                           "elles restent consultables, recherchables et exportables.\n")
+            if self.instruments:
+                instructions.insert("end", "- 'Diagnostics' pour les temps de réponse et les profils (lancé avec --instrument).\n")
+
+            instructions.tag_configure("header", font=self.title_font)
+            instructions.tag_configure("subheader", font=self.subtitle_font)
+            instructions.config(state="disabled")
+
+            scrollbar = ttk.Scrollbar(content_frame, orient="vertical", command=instructions.yview)
+            instructions.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side="right", fill="y")
+            instructions.pack(side="left", fill="both", expand=True)
+
+            footer_frame = tk.Frame(self.help_window, pady=10)
+            footer_frame.pack(fill="x")
+            close_button = tk.Button(
+                footer_frame, 
+                text="Fermer", 
+                command=self.on_help_close, 
+                bg=ACCENT_COLOR, 
+                fg="white", 
+                font=self.normal_font, 
+                relief="flat", 
+                padx=10, 
+                pady=5
+            )
+            close_button.pack()
+
+            self.help_window.protocol("WM_DELETE_WINDOW", self.on_help_close)
+
+    def show_reports(self):
+        if self.reports_window and self.reports_window.winfo_exists():
+            self.reports_window.lift()
+            self.reports_window.focus_force()
+            return
+        self.reports_window = tk.Toplevel(self.root)
+        self.reports_window.title("Rapports - Taxi 123")
+        self.reports_window.geometry("720x420")
+        self.reports_window.transient(self.root)
+        
+        self.reports_summary = tk.StringVar()
+        ttk.Label(self.reports_window, textvariable=self.reports_summary, font=self.subtitle_font).pack(fill="x", padx=10, pady=(10, 5))
+        
+        notebook = ttk.Notebook(self.reports_window)
+        notebook.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        columns = ("group", "rides", "revenue", "tva", "average", "resa", "supplements")
+        headings = (None, "Courses", "CA TTC", "TVA", "Course moyenne", "RESA", "Suppléments")
+        self.report_trees = {}
+        for grouping in GROUPINGS:
+            tab = ttk.Frame(notebook)
+            tree = ttk.Treeview(tab, columns=columns, show="headings")
+            tab_title, group_heading = REPORT_TABS[grouping]
+            for column, heading in zip(columns, headings):
+                tree.heading(column, text=heading or group_heading)
+                tree.column(column, width=130 if column == "group" else 85, anchor="w" if column == "group" else "e")
+            scrollbar = ttk.Scrollbar(tab, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side="right", fill="y")
+            tree.pack(fill="both", expand=True)
+            notebook.add(tab, text=tab_title)
+            self.report_trees[grouping] = tree
+        self.reports_notebook = notebook
+        # Only the visible tab is redrawn, and only when the rollups changed
+        self.report_versions = {}
+        notebook.bind("<<NotebookTabChanged>>", lambda e: self.refresh_reports())
+        self.reports_window.protocol("WM_DELETE_WINDOW", self.on_reports_close)
+        self.refresh_reports()
+
+    def schedule_reports_refresh(self):
+        # Both report windows follow the history while they are open
+        if self.reports_window and self._reports_job is None:
+            self._reports_job = self.root.after_idle(self.refresh_reports)
+        if self.analytics_window and self._analytics_job is None:
+            self._analytics_job = self.root.after_idle(self.refresh_analytics)
+
+    def refresh_reports(self):
+        self._reports_job = None
+        if not (self.reports_window and self.reports_window.winfo_exists()):
+            return
+        rides, total, tva = self.rollups.totals()
+        self.reports_summary.set(f"{rides} courses - CA TTC {format_cents(total)} MAD - TVA {format_cents(tva)} MAD")
+        grouping = GROUPINGS[self.reports_notebook.index("current")]
+        if self.report_versions.get(grouping) == self.rollups.version:
+            return
+        self.report_versions[grouping] = self.rollups.version
+        tree = self.report_trees[grouping]
+        tree.delete(*tree.get_children())
+        for row in format_report(self.rollups.report(grouping)):
+            tree.insert("", "end", values=row)
+
+    def on_reports_close(self):
+        self.reports_window.destroy()
+        self.reports_window = None
+
+    def show_analytics(self):
+        if self.analytics_window and self.analytics_window.winfo_exists():
+            self.analytics_window.lift()
+            self.analytics_window.focus_force()
+            return
+        self.analytics_window = tk.Toplevel(self.root)
+        self.analytics_window.title("Analyse des courses - Taxi 123")
+        self.analytics_window.geometry("760x460")
+        self.analytics_window.transient(self.root)
+        
+        top_frame = ttk.Frame(self.analytics_window)
+        top_frame.pack(fill="x", padx=10, pady=(10, 5))
+        self.analytics_summary = tk.StringVar()
+        ttk.Label(top_frame, textvariable=self.analytics_summary, font=self.subtitle_font).pack(side="left")
+        ttk.Button(top_frame, text="Exporter (CSV)", command=self.export_analytics).pack(side="right")
+        
+        notebook = ttk.Notebook(self.analytics_window)
+        notebook.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        columns = ("group", "rides", "revenue", "average", "minutes", "per_minute")
+        self.analytics_trees = {}
+        for analysis in ANALYSES:
+            tab = ttk.Frame(notebook)
+            tree = ttk.Treeview(tab, columns=columns, show="headings")
+            tab_title, group_heading = ANALYSIS_TABS[analysis]
+            for column, heading in zip(columns, (group_heading,) + REPORT_HEADINGS):
+                tree.heading(column, text=heading)
+                tree.column(column, width=130 if column == "group" else 105, anchor="w" if column == "group" else "e")
+            scrollbar = ttk.Scrollbar(tab, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side="right", fill="y")
+            tree.pack(fill="both", expand=True)
+            notebook.add(tab, text=tab_title)
+            self.analytics_trees[analysis] = tree
+        # Rides per weekday and departure hour, to plan the shifts
+        tab = ttk.Frame(notebook)
+        hours = [f"{hour:02d}" for hour in range(24)]
+        grid = ttk.Treeview(tab, columns=["day"] + hours, show="headings")
+        grid.heading("day", text="Jour")
+        grid.column("day", width=80, anchor="w")
+        for hour in hours:
+            grid.heading(hour, text=hour)
+            grid.column(hour, width=26, anchor="e")
+        grid.pack(fill="both", expand=True)
+        notebook.add(tab, text="Grille horaire")
+        self.analytics_trees["grid"] = grid
+        self.analytics_notebook = notebook
+        # Same as the reports: only the visible tab, only after a change
+        self.analytics_versions = {}
+        notebook.bind("<<NotebookTabChanged>>", lambda e: self.refresh_analytics())
+        self.analytics_window.protocol("WM_DELETE_WINDOW", self.on_analytics_close)
+        self.refresh_analytics()
+
+    def refresh_analytics(self):
+        self._analytics_job = None
+        if not (self.analytics_window and self.analytics_window.winfo_exists()):
+            return
+        rides, timed = self.analytics.totals()
+        self.analytics_summary.set(f"{rides} courses, dont {timed} avec heures de départ et d'arrivée")
+        tabs = (*ANALYSES, "grid")
+        analysis = tabs[self.analytics_notebook.index("current")]
+        if self.analytics_versions.get(analysis) == self.analytics.version:
+            return
+        self.analytics_versions[analysis] = self.analytics.version
+        tree = self.analytics_trees[analysis]
+        tree.delete(*tree.get_children())
+        if analysis == "grid":
+            for weekday, counts in zip(WEEKDAYS, self.analytics.grid()):
+                tree.insert("", "end", values=(weekday, *(count or "" for count in counts)))
+            return
+        for row in format_analytics(self.analytics.report(analysis)):
+            tree.insert("", "end", values=row)
+
+    def export_analytics(self):
+        path = filedialog.asksaveasfilename(
+            parent=self.analytics_window,
+            defaultextension=".csv",
+            initialfile="analyse_courses.csv",
+            filetypes=[("CSV", "*.csv")]
+        )
+        if path:
+            # A copy of the buckets: saves may change them while it is written
+            snapshot = RideAnalytics()
+            snapshot.merge(self.analytics.serialize())
+            self.io_worker.submit(
+                write_analytics_csv, path, snapshot,
+                on_done=lambda path: self.status_text.set(f"Analyse exportée: {path}"),
+                on_error=self.report_error
+            )
+
+    def on_analytics_close(self):
+        self.analytics_window.destroy()
+        self.analytics_window = None
+
+    def show_diagnostics(self):
+        if self.diagnostics_window and self.diagnostics_window.winfo_exists():
+            self.diagnostics_window.lift()
+            self.diagnostics_window.focus_force()
+            return
+        self.diagnostics_window = tk.Toplevel(self.root)
+        self.diagnostics_window.title("Diagnostics - Taxi 123")
+        self.diagnostics_window.geometry("640x380")
+        self.diagnostics_window.transient(self.root)
+        
+        columns = ("name", "calls", "p50", "p95", "p99", "max")
+        headings = ("Opération", "Appels", "p50 (ms)", "p95 (ms)", "p99 (ms)", "max (ms)")
+        tree = ttk.Treeview(self.diagnostics_window, columns=columns, show="headings")
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=190 if column == "name" else 80, anchor="w" if column == "name" else "e")
+        tree.pack(fill="both", expand=True, padx=10, pady=(10, 5))
+        self.diagnostics_tree = tree
+        
+        buttons = ttk.Frame(self.diagnostics_window)
+        buttons.pack(fill="x", padx=10, pady=(0, 10))
+        self.profile_button = ttk.Button(buttons, text="Profil (cProfile)", command=self.toggle_profile)
+        self.profile_button.pack(side="left")
+        self.sampling_button = ttk.Button(buttons, text="Échantillonnage", command=self.toggle_sampling)
+        self.sampling_button.pack(side="left", padx=3)
+        ttk.Button(buttons, text="Réinitialiser", command=self.instruments.reset).pack(side="left")
+        
+        self.diagnostics_window.protocol("WM_DELETE_WINDOW", self.on_diagnostics_close)
+        self.refresh_diagnostics()
+
+    def refresh_diagnostics(self):
+        # Polled while the window is open: the numbers also move on the workers
+        self._diagnostics_job = None
+        if not (self.diagnostics_window and self.diagnostics_window.winfo_exists()):
+            return
+        tree = self.diagnostics_tree
+        tree.delete(*tree.get_children())
+        for name, count, *timings in self.instruments.snapshot():
+            tree.insert("", "end", values=(name, count, *(f"{ms:.2f}" for ms in timings)))
+        self._diagnostics_job = self.root.after(DIAGNOSTICS_REFRESH_MS, self.refresh_diagnostics)
+
+    def _profile_path(self, suffix):
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        return os.path.join(directory, f"profile-{datetime.now():%Y%m%d-%H%M%S}{suffix}")
+
+    def toggle_profile(self):
+        if self.instruments.profiler is None:
+            self.instruments.start_profile()
+            self.profile_button.configure(text="Arrêter le profil")
+            self.status_text.set("Profil en cours...")
+        else:
+            path = self.instruments.stop_profile(self._profile_path(".prof"))
+            self.profile_button.configure(text="Profil (cProfile)")
+            self.status_text.set(f"Profil enregistré: {path}")
+
+    def toggle_sampling(self):
+        if self.instruments.sampler is None:
+            self.instruments.start_sampling()
+            self.sampling_button.configure(text="Arrêter l'échantillonnage")
+            self.status_text.set("Échantillonnage en cours...")
+        else:
+            path = self._profile_path(".folded")
+            count = self.instruments.stop_sampling(path)
+            self.sampling_button.configure(text="Échantillonnage")
+            self.status_text.set(f"{count} échantillons enregistrés: {path}")
+
+    def on_diagnostics_close(self):
+        if self._diagnostics_job:
+            self.root.after_cancel(self._diagnostics_job)
+            self._diagnostics_job = None
+        self.diagnostics_window.destroy()
+        self.diagnostics_window = None
+
+    def on_help_close(self):
+        self.help_window.destroy()
+        self.help_window = None
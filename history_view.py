@@ -0,0 +1,296 @@
+from bisect import bisect_left
+from itertools import compress, islice
+from operator import itemgetter
+from tkinter import ttk
+
+# Rows assumed visible before the widget has been laid out
+DEFAULT_VISIBLE_ROWS = 13
+
+
+class VirtualTreeview:
+    """Treeview that only materializes the rows currently on screen.
+
+    `rows` is any sequence of records; `row_values(record)` gives the column
+    values and `row_id(record)` the item iid. Scrolling swaps items in and out
+    at the edges of the window instead of keeping one Tk item per record.
+    """
+
+    def __init__(self, parent, columns, row_values, row_id, **tree_options):
+        self.tree = ttk.Treeview(parent, columns=columns, show="headings", **tree_options)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self._on_scrollbar)
+        self.row_values = row_values
+        self.row_id = row_id
+        self.rows = []
+        self.top = 0
+        self.visible = tree_options.get("height", DEFAULT_VISIBLE_ROWS)
+
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3) or "break")
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3) or "break")
+        self.tree.bind("<Up>", lambda e: self._on_arrow(-1))
+        self.tree.bind("<Down>", lambda e: self._on_arrow(1))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-self.visible) or "break")
+        self.tree.bind("<Next>", lambda e: self.scroll(self.visible) or "break")
+        self.tree.bind("<Configure>", self._on_configure)
+
+    def set_rows(self, rows, top=None):
+        self.rows = rows
+        self.top = self._clamp(self.top if top is None else top)
+        self.redraw()
+
+    def redraw(self):
+        self.tree.delete(*self.tree.get_children())
+        for record in self.rows[self.top:self.top + self.visible]:
+            self._insert("end", record)
+        self._update_scrollbar()
+
+    def rows_extended(self):
+        # Rows were appended to self.rows: only a window not yet full changes
+        shown = len(self.tree.get_children())
+        if shown < self.visible:
+            for record in self.rows[self.top + shown:self.top + self.visible]:
+                self._insert("end", record)
+        self._update_scrollbar()
+
+    def row_inserted(self, index):
+        # Called after rows.insert(index, ...): touches at most two items
+        if index < self.top:
+            self.top += 1
+        elif index < self.top + self.visible:
+            children = self.tree.get_children()
+            if len(children) >= self.visible:
+                self.tree.delete(children[-1])
+            self._insert(index - self.top, self.rows[index])
+        self._update_scrollbar()
+
+    def row_deleted(self, index, iid):
+        # Called after rows.pop(index): touches at most two items
+        if index < self.top:
+            self.top -= 1
+        elif self.tree.exists(iid):
+            self.tree.delete(iid)
+            last = self.top + self.visible - 1
+            if last < len(self.rows):
+                self._insert("end", self.rows[last])
+            elif self.top > 0:
+                self.top -= 1
+                self._insert(0, self.rows[self.top])
+        self._update_scrollbar()
+
+    def scroll(self, delta):
+        top = self._clamp(self.top + delta)
+        delta = top - self.top
+        if not delta:
+            return
+        self.top = top
+        if abs(delta) >= self.visible:
+            self.redraw()
+            return
+        children = self.tree.get_children()
+        if delta > 0:
+            self.tree.delete(*children[:delta])
+            start = self.top + self.visible - delta
+            for record in self.rows[start:self.top + self.visible]:
+                self._insert("end", record)
+        else:
+            self.tree.delete(*children[len(children) + delta:])
+            for record in reversed(self.rows[self.top:self.top - delta]):
+                self._insert(0, record)
+        self._update_scrollbar()
+
+    def scroll_to(self, index):
+        if index < self.top:
+            self.scroll(index - self.top)
+        elif index >= self.top + self.visible:
+            self.scroll(index - self.top - self.visible + 1)
+
+    def _insert(self, position, record):
+        iid = self.row_id(record)
+        self.tree.insert("", position, iid=iid, values=self.row_values(record))
+
+    def _clamp(self, top):
+        return max(0, min(top, len(self.rows) - self.visible))
+
+    def _update_scrollbar(self):
+        total = len(self.rows)
+        if total <= self.visible:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.top / total, (self.top + self.visible) / total)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll(int(float(amount) * len(self.rows)) - self.top)
+        elif unit == "pages":
+            self.scroll(int(amount) * self.visible)
+        else:
+            self.scroll(int(amount))
+
+    def _on_mousewheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def _on_arrow(self, step):
+        focus = self.tree.focus()
+        children = self.tree.get_children()
+        if not children or focus != (children[0] if step < 0 else children[-1]):
+            return None
+        index = self.top + self.tree.index(focus) + step
+        if not 0 <= index < len(self.rows):
+            return "break"
+        self.scroll_to(index)
+        iid = self.row_id(self.rows[index])
+        self.tree.focus(iid)
+        self.tree.selection_set(iid)
+        return "break"
+
+    def _on_configure(self, event):
+        children = self.tree.get_children()
+        if not children:
+            return
+        bbox = self.tree.bbox(children[0])
+        if not bbox:
+            return
+        visible = max(1, (event.height - bbox[1]) // bbox[3])
+        if visible != self.visible:
+            self.visible = visible
+            self.top = self._clamp(self.top)
+            self.redraw()
+
+
+class IndexedRows:
+    """The rows of `source` at the given positions, read on demand."""
+
+    def __init__(self, source, positions):
+        self.source = source
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.source[position] for position in self.positions[index]]
+        return self.source[self.positions[index]]
+
+    def __iter__(self):
+        for position in self.positions:
+            yield self.source[position]
+
+
+class ChainedRows:
+    """Read-only archived rows followed by the mutable list of live rows."""
+
+    def __init__(self, archived, live):
+        self.archived = archived
+        self.live = live
+
+    @property
+    def offset(self):
+        return len(self.archived)
+
+    def __len__(self):
+        return len(self.archived) + len(self.live)
+
+    def __getitem__(self, index):
+        split = len(self.archived)
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(len(self))
+            return (list(self.archived[start:min(stop, split)]) +
+                    self.live[max(start - split, 0):max(stop - split, 0)])
+        if index < 0:
+            index += len(self)
+        return self.archived[index] if index < split else self.live[index - split]
+
+    def __iter__(self):
+        yield from self.archived
+        yield from self.live
+
+
+class SortedRows:
+    """Rows in the order of sorted (key, id) entries, optionally reversed.
+
+    Records are looked up with `resolve(id)` only when read. The entries are
+    owned by this view: insert() and remove() keep them sorted and return
+    the row index to hand to VirtualTreeview.
+    """
+
+    def __init__(self, entries, resolve, reverse=False):
+        self.entries = entries
+        self.resolve = resolve
+        self.reverse = reverse
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _position(self, index):
+        return len(self.entries) - 1 - index if self.reverse else index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self.entries)
+        return self.resolve(self.entries[self._position(index)][1])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def insert(self, entry):
+        position = bisect_left(self.entries, entry)
+        self.entries.insert(position, entry)
+        return self._position(position)
+
+    def remove(self, entry):
+        # Index the row had, or None when it isn't listed
+        position = bisect_left(self.entries, entry)
+        if position == len(self.entries) or self.entries[position] != entry:
+            return None
+        index = self._position(position)
+        del self.entries[position]
+        return index
+
+
+class FilteredRows(SortedRows):
+    """SortedRows over the entries whose ID is set in `mask`, filtered as read.
+
+    Entries are only tested up to the last row read, so the first screen of
+    a filter over a long history doesn't wait for the whole order to be
+    tested; the rest is filtered on the first edit or a scroll down to it.
+    The row count is that of the mask, which must only be set for IDs that
+    have an entry.
+    """
+
+    def __init__(self, entries, mask, resolve, reverse=False):
+        super().__init__(None, resolve, reverse)
+        self.count = mask.count(1)
+        self.read = []
+        # A copy: the column's order changes before insert() and remove()
+        entries = entries[::-1] if reverse else list(entries)
+        self.pending = compress(entries, map(mask.__getitem__, map(itemgetter(1), entries)))
+
+    def __len__(self):
+        return self.count if self.entries is None else len(self.entries)
+
+    def __getitem__(self, index):
+        if self.entries is not None or isinstance(index, slice):
+            return super().__getitem__(index)
+        if index < 0:
+            index += self.count
+        if index >= len(self.read):
+            self.read.extend(islice(self.pending, index + 1 - len(self.read)))
+        return self.resolve(self.read[index][1])
+
+    def _filter_all(self):
+        if self.entries is None:
+            self.read.extend(self.pending)
+            self.entries = self.read[::-1] if self.reverse else self.read
+
+    def insert(self, entry):
+        self._filter_all()
+        return super().insert(entry)
+
+    def remove(self, entry):
+        self._filter_all()
+        return super().remove(entry)
@@ -0,0 +1,207 @@
+import cProfile
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+# Set to 1 (or pass --instrument) to time callbacks and storage operations
+ENV_VAR = "TAXI123_INSTRUMENT"
+# Calls slower than this are logged (ms)
+SLOW_CALL_MS = 100
+# Samples kept per operation for the percentiles
+HISTOGRAM_SIZE = 2048
+# Interval of the sampling profiler (s)
+SAMPLE_INTERVAL = 0.005
+PERF_LOG = "perf.log"
+# Storage and archive operations timed by wrap_storage(); the streamed ones
+# return iterators and are timed over the whole iteration
+STORE_OPERATIONS = ("append", "append_many", "import_invoices", "delete", "delete_many", "load_range", "get",
+                    "count", "page", "days", "max_id", "changes", "data_version", "last_deletion")
+STREAMED_STORE_OPERATIONS = ("iter",)
+ARCHIVE_OPERATIONS = ("get", "search", "ids", "sort_entries", "merge_rollups", "merge_analytics")
+
+log = logging.getLogger("taxi123.perf")
+
+
+def enabled_by_env():
+    return os.environ.get(ENV_VAR, "").strip().lower() not in ("", "0", "false", "no")
+
+
+class Histogram:
+    """Rolling window of the last durations of one operation (ms)."""
+
+    def __init__(self, size=HISTOGRAM_SIZE):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentiles(self, *points):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return tuple(0.0 for _ in points)
+        return tuple(ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] for point in points)
+
+
+class Instruments:
+    """Per-operation timings, shared by the Tk thread and the workers.
+
+    wrap() replaces methods on one instance with timed versions, so it must
+    run before the methods are handed out (e.g. as button commands).
+    """
+
+    def __init__(self, slow_ms=SLOW_CALL_MS):
+        self.slow_ms = slow_ms
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self.profiler = None
+        self.sampler = None
+
+    def record(self, name, ms):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(ms)
+        if ms >= self.slow_ms:
+            log.warning("appel lent: %s %.1f ms (%s)", name, ms, threading.current_thread().name)
+
+    def timed(self, name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, (time.perf_counter() - start) * 1000)
+        return wrapper
+
+    def timed_iter(self, name, func):
+        # For calls returning an iterator: the time spent producing the items,
+        # summed over the iteration and recorded when it ends or is dropped
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            iterator = iter(func(*args, **kwargs))
+            elapsed = time.perf_counter() - start
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield item
+            finally:
+                self.record(name, elapsed * 1000)
+        return wrapper
+
+    def wrap(self, obj, names, prefix=""):
+        for name in names:
+            setattr(obj, name, self.timed(prefix + name, getattr(obj, name)))
+
+    def wrap_storage(self, store=None, archives=None):
+        # Every operation of an InvoiceStore and an ArchiveSet
+        if store is not None:
+            self.wrap(store, STORE_OPERATIONS, "store.")
+            for name in STREAMED_STORE_OPERATIONS:
+                setattr(store, name, self.timed_iter("store." + name, getattr(store, name)))
+        if archives is not None:
+            self.wrap(archives, ARCHIVE_OPERATIONS, "archives.")
+
+    def snapshot(self):
+        # (name, calls, p50, p95, p99, max) per operation, slowest p95 first
+        with self._lock:
+            rows = [(name, histogram.count, *histogram.percentiles(50, 95, 99), histogram.max)
+                    for name, histogram in self.histograms.items()]
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+
+    def start_profile(self):
+        # cProfile only sees the thread it was enabled on: the Tk thread here
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop_profile(self, path):
+        self.profiler.disable()
+        self.profiler.dump_stats(path)
+        self.profiler = None
+        return path
+
+    def start_sampling(self, thread=None):
+        self.sampler = SamplingProfiler(thread or threading.main_thread())
+        self.sampler.start()
+
+    def stop_sampling(self, path):
+        self.sampler.stop()
+        count = self.sampler.dump(path)
+        self.sampler = None
+        return count
+
+
+class SamplingProfiler:
+    """Samples one thread's stack from a side thread.
+
+    Unlike cProfile it costs the sampled thread nothing between samples. The
+    dump is in collapsed-stack format (one "a;b;c count" line per stack), as
+    read by flamegraph tools.
+    """
+
+    def __init__(self, thread, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread.ident
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="perf-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return sum(self.stacks.values())
+
+
+def log_to_file(path=PERF_LOG):
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+
+def format_snapshot(rows):
+    lines = [f"{'opération':<28}{'appels':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}"]
+    for name, count, p50, p95, p99, slowest in rows:
+        lines.append(f"{name:<28}{count:>8}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}{slowest:>10.2f}")
+    return "\n".join(lines)
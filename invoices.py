@@ -0,0 +1,220 @@
+import json
+from array import array
+from bisect import bisect_left
+from datetime import date
+
+from fares import to_cents
+from storage import atomic_write, date_ordinal
+
+# Keys of an invoice dict, in the order the store writes them
+FIELDS = ("id", "date", "name", "departure_time", "arrival_time",
+          "total", "tarifs", "resa", "add_to_total")
+
+
+def time_minutes(text):
+    # "HH:MM" as minutes after midnight, -1 when empty or unreadable
+    try:
+        hours, minutes = text.split(":")
+        return int(hours) * 60 + int(minutes)
+    except (AttributeError, ValueError):
+        return -1
+
+
+def minutes_text(minutes):
+    return "" if minutes < 0 else f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def day_text(day):
+    return date.fromordinal(day).strftime("%d/%m/%Y")
+
+
+class Invoice:
+    """One invoice with compact fields: date as an ordinal, times as minutes
+    and money as integer cents.
+
+    Read access mirrors the invoice dicts (invoice['total'], .get('resa')),
+    so tickets, search and reports take either form.
+    """
+
+    __slots__ = ("id", "day", "name", "departure", "arrival", "total",
+                 "tarif_a", "tarif_b", "tarif_c", "tarif_d", "resa", "supplement")
+
+    def __init__(self, id, day, name, departure, arrival, total,
+                 tarif_a, tarif_b, tarif_c, tarif_d, resa=0, supplement=0):
+        self.id = id
+        self.day = day
+        self.name = name
+        self.departure = departure
+        self.arrival = arrival
+        self.total = total
+        self.tarif_a = tarif_a
+        self.tarif_b = tarif_b
+        self.tarif_c = tarif_c
+        self.tarif_d = tarif_d
+        self.resa = resa
+        self.supplement = supplement
+
+    @classmethod
+    def from_dict(cls, invoice, names=None):
+        # `names` shares one string per client across the whole history
+        name = invoice['name']
+        if names is not None:
+            name = names.setdefault(name, name)
+        tarifs = invoice.get('tarifs') or (0, 0, 0, 0)
+        day = date_ordinal(invoice['date'])
+        return cls(
+            invoice.get('id'),
+            # An unreadable legacy date is kept as its text
+            invoice['date'] if day is None else day,
+            name,
+            time_minutes(invoice.get('departure_time')),
+            time_minutes(invoice.get('arrival_time')),
+            to_cents(invoice['total']),
+            to_cents(tarifs[0]), to_cents(tarifs[1]), to_cents(tarifs[2]), to_cents(tarifs[3]),
+            int(invoice.get('resa') or 0),
+            to_cents(invoice.get('add_to_total') or 0),
+        )
+
+    @classmethod
+    def from_row(cls, row, names=None):
+        # A row selected with InvoiceStore.COLUMNS, without an intermediate dict
+        invoice_id, name, text, departure, arrival, total, tarifs, resa, supplement = row
+        name = name or ""
+        if names is not None:
+            name = names.setdefault(name, name)
+        day = date_ordinal(text)
+        tarifs = json.loads(tarifs) if tarifs else (0, 0, 0, 0)
+        return cls(
+            invoice_id, (text or "") if day is None else day, name,
+            time_minutes(departure), time_minutes(arrival), to_cents(total or 0),
+            to_cents(tarifs[0]), to_cents(tarifs[1]), to_cents(tarifs[2]), to_cents(tarifs[3]),
+            int(resa or 0), to_cents(supplement or 0),
+        )
+
+    def to_dict(self):
+        return {field: self[field] for field in FIELDS}
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return self.id
+        if key == 'name':
+            return self.name
+        if key == 'date':
+            return self.day if isinstance(self.day, str) else day_text(self.day)
+        if key == 'total':
+            return self.total / 100
+        if key == 'departure_time':
+            return minutes_text(self.departure)
+        if key == 'arrival_time':
+            return minutes_text(self.arrival)
+        if key == 'tarifs':
+            return [self.tarif_a / 100, self.tarif_b / 100, self.tarif_c / 100, self.tarif_d / 100]
+        if key == 'resa':
+            return self.resa
+        if key == 'add_to_total':
+            return self.supplement / 100
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        if not isinstance(other, Invoice):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Invoice(id={self.id!r}, date={self['date']!r}, name={self.name!r}, total={self['total']:.2f})"
+
+
+# Struct-of-arrays columns: (Invoice slot, array typecode)
+COLUMNS = [
+    ("id", "q"), ("day", "i"), ("departure", "h"), ("arrival", "h"), ("total", "q"),
+    ("tarif_a", "q"), ("tarif_b", "q"), ("tarif_c", "q"), ("tarif_d", "q"),
+    ("resa", "i"), ("supplement", "q"),
+]
+
+
+class InvoiceColumns:
+    """A whole history as one typed array per field.
+
+    Client names are dictionary-encoded; an Invoice is only built when a row
+    is read. Invoices are kept in the order they are appended, which for the
+    store means ID order, so find() can bisect the id column.
+    """
+
+    def __init__(self, invoices=()):
+        self.columns = {slot: array(typecode) for slot, typecode in COLUMNS}
+        self.client = array("I")
+        self.names = []
+        self.codes = {}
+        self.extend(invoices)
+
+    def append(self, invoice):
+        if not isinstance(invoice, Invoice):
+            invoice = Invoice.from_dict(invoice)
+        if isinstance(invoice.day, str):
+            raise ValueError(f"date invalide: {invoice.day!r}")
+        for slot, column in self.columns.items():
+            column.append(getattr(invoice, slot))
+        code = self.codes.get(invoice.name)
+        if code is None:
+            code = self.codes[invoice.name] = len(self.names)
+            self.names.append(invoice.name)
+        self.client.append(code)
+
+    def extend(self, invoices):
+        for invoice in invoices:
+            self.append(invoice)
+
+    def __len__(self):
+        return len(self.client)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        c = self.columns
+        return Invoice(c["id"][row], c["day"][row], self.names[self.client[row]],
+                       c["departure"][row], c["arrival"][row], c["total"][row],
+                       c["tarif_a"][row], c["tarif_b"][row], c["tarif_c"][row], c["tarif_d"][row],
+                       c["resa"][row], c["supplement"][row])
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def find(self, invoice_id):
+        ids = self.columns["id"]
+        row = bisect_left(ids, invoice_id)
+        return row if row < len(ids) and ids[row] == invoice_id else None
+
+    def __delitem__(self, row):
+        for column in self.columns.values():
+            del column[row]
+        del self.client[row]
+
+    def nbytes(self):
+        # Payload size of the columns, without the (shared) name strings
+        return sum(len(column) * column.itemsize for column in (*self.columns.values(), self.client))
+
+
+def dump_jsonl(path, invoices):
+    # Invoice records or dicts, written as the usual invoice dicts
+    count = 0
+    with atomic_write(path, 'w', encoding='utf-8') as f:
+        for invoice in invoices:
+            record = invoice.to_dict() if isinstance(invoice, Invoice) else invoice
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def load_jsonl(path):
+    names = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return [Invoice.from_dict(json.loads(line), names) for line in f if line.strip()]
@@ -0,0 +1,87 @@
+from storage import atomic_write
+from tickets import render_ticket
+
+PAGE_FORMAT = (105, 148)  # A6, in mm
+FONT_FAMILY = "Courier"
+FONT_SIZE = 9
+LINE_HEIGHT = 4.2
+MARGIN = 6
+
+
+class TicketPDF:
+    """PDF writer laying tickets out one ride per page.
+
+    The font is selected once per document and the line positions are
+    computed once, so a bulk export only pays for the text of each ticket.
+    """
+
+    def __init__(self):
+        # Imported on first use: only PDF exports need fpdf
+        from fpdf import FPDF
+
+        self.pdf = FPDF(unit="mm", format=PAGE_FORMAT)
+        self.pdf.set_auto_page_break(False)
+        self.pdf.set_font(FONT_FAMILY, size=FONT_SIZE)
+        self._line_y = []
+
+    def add(self, invoice):
+        # Core PDF fonts are Latin-1 only: "EUR" for the euro sign, "?" for
+        # any other character outside it (a client name in another script)
+        text = render_ticket(invoice).replace("€", "EUR")
+        lines = text.encode("latin-1", "replace").decode("latin-1").splitlines()
+        while len(self._line_y) < len(lines):
+            self._line_y.append(MARGIN + LINE_HEIGHT * (len(self._line_y) + 1))
+        self.pdf.add_page()
+        for y, line in zip(self._line_y, lines):
+            if line.strip():
+                self.pdf.text(MARGIN, y, line.rstrip())
+
+    def save(self, path):
+        with atomic_write(path, 'wb') as f:
+            f.write(self.to_bytes())
+        return path
+
+    def to_bytes(self):
+        # fpdf 1.x returns a Latin-1 str, fpdf2 a bytearray
+        data = self.pdf.output(dest="S")
+        return data.encode("latin-1") if isinstance(data, str) else bytes(data)
+
+
+def write_pdf(path, invoices):
+    document = TicketPDF()
+    count = 0
+    for invoice in invoices:
+        document.add(invoice)
+        count += 1
+    document.save(path)
+    return count
+
+
+def write_invoice_pdf(path, invoice):
+    write_pdf(path, [invoice])
+    return path
+
+
+def invoice_pdf_bytes(invoice):
+    document = TicketPDF()
+    document.add(invoice)
+    return document.to_bytes()
+
+
+if __name__ == '__main__':
+    # Per-invoice cost of a multi-page export: python pdf_export.py
+    import os
+    import tempfile
+    import time
+
+    sample = {
+        "id": 1, "date": "11/04/2025", "name": "DEXTER",
+        "departure_time": "01:00", "arrival_time": "06:03", "total": 1210.7,
+        "tarifs": [500.0, 0.0, 600.0, 0.0], "resa": 7, "add_to_total": 100.0,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in (1000, 10000):
+            start = time.perf_counter()
+            write_pdf(os.path.join(tmp, "bench.pdf"), (sample for _ in range(count)))
+            elapsed = time.perf_counter() - start
+            print(f"{count:>6} invoices: {elapsed:.2f} s total, {elapsed / count * 1000:.3f} ms/invoice")
@@ -0,0 +1,117 @@
+from collections import defaultdict
+from datetime import date
+
+from fares import format_cents, to_cents, tva_cents
+from invoices import Invoice
+from storage import date_ordinal
+
+GROUPINGS = ("day", "month", "client", "band")
+TARIFF_LETTERS = "ABCD"
+
+# Bucket slots: ride count, then sums in cents
+RIDES, TOTAL, TVA, RESA, SUPPLEMENT = range(5)
+
+
+def tariff_band(tarifs):
+    # The tariffs actually used on the ride, e.g. "A", "A+C"
+    letters = [letter for letter, km in zip(TARIFF_LETTERS, tarifs) if km]
+    return "+".join(letters) or "-"
+
+
+def rollup_fields(invoice):
+    # (day ordinal, client, tariffs, total, RESA, supplement; money in
+    # cents) of an Invoice or dict; Invoice fields are read as stored
+    if isinstance(invoice, Invoice):
+        day = invoice.day if isinstance(invoice.day, int) else None
+        tarifs = (invoice.tarif_a, invoice.tarif_b, invoice.tarif_c, invoice.tarif_d)
+        return day, invoice.name, tarifs, invoice.total, invoice.resa * 100, invoice.supplement
+    return (date_ordinal(invoice['date']), invoice['name'], invoice['tarifs'], to_cents(invoice['total']),
+            to_cents(invoice.get('resa', 0)), to_cents(invoice.get('add_to_total', 0)))
+
+
+def group_keys(day, name, tarifs):
+    if day is None:
+        month = None
+    else:
+        as_date = date.fromordinal(day)
+        month = (as_date.year, as_date.month)
+    return day, month, name.strip(), tariff_band(tarifs)
+
+
+def format_key(grouping, key):
+    if key is None:
+        return "?"
+    if grouping == "day":
+        return date.fromordinal(key).strftime("%d/%m/%Y")
+    if grouping == "month":
+        return f"{key[1]:02d}/{key[0]}"
+    return key
+
+
+class RevenueRollups:
+    """Revenue aggregates per day, month, client and tariff band.
+
+    add() and remove() adjust one bucket per grouping, so a report is read
+    straight from the buckets instead of re-scanning the history.
+    """
+
+    def __init__(self, invoices=()):
+        self.buckets = {grouping: defaultdict(lambda: [0, 0, 0, 0, 0]) for grouping in GROUPINGS}
+        self.version = 0
+        for invoice in invoices:
+            self.add(invoice)
+
+    def add(self, invoice):
+        self._apply(invoice, 1)
+
+    def remove(self, invoice):
+        self._apply(invoice, -1)
+
+    def _apply(self, invoice, sign):
+        day, name, tarifs, total, resa, supplement = rollup_fields(invoice)
+        amounts = (1, total, tva_cents(total), resa, supplement)
+        for grouping, key in zip(GROUPINGS, group_keys(day, name, tarifs)):
+            groups = self.buckets[grouping]
+            bucket = groups[key]
+            for slot, amount in enumerate(amounts):
+                bucket[slot] += sign * amount
+            if not bucket[RIDES]:
+                del groups[key]
+        self.version += 1
+
+    def merge(self, serialized):
+        # Adds buckets saved as {grouping: [[key, bucket], ...]} (e.g. by an archive)
+        for grouping, entries in serialized.items():
+            groups = self.buckets[grouping]
+            for key, amounts in entries:
+                bucket = groups[tuple(key) if isinstance(key, list) else key]
+                for slot, amount in enumerate(amounts):
+                    bucket[slot] += amount
+        self.version += 1
+
+    def serialize(self):
+        return {grouping: [[key, bucket] for key, bucket in buckets.items()]
+                for grouping, buckets in self.buckets.items()}
+
+    def report(self, grouping):
+        # Rows of (label, rides, revenue, TVA, average fare, RESA, supplements) in cents
+        rows = []
+        for key in sorted(self.buckets[grouping], key=lambda key: (key is None, key)):
+            rides, total, tva, resa, supplement = self.buckets[grouping][key]
+            rows.append((format_key(grouping, key), rides, total, tva,
+                         (total + rides // 2) // rides, resa, supplement))
+        return rows
+
+    def totals(self):
+        rides = total = tva = 0
+        for bucket in self.buckets["band"].values():
+            rides += bucket[RIDES]
+            total += bucket[TOTAL]
+            tva += bucket[TVA]
+        return rides, total, tva
+
+
+def format_report(rows):
+    # Same rows with amounts as display strings
+    return [(label, rides, *(format_cents(amount) for amount in amounts))
+            for label, rides, *amounts in rows]
@@ -0,0 +1,64 @@
+import logging
+import os
+from datetime import date
+
+from archive import ARCHIVE_SUFFIX, closed_months, compress_month, month_files, seal_month
+
+# Retention at startup is opt-in: it moves rows out of invoices.db, so it
+# only runs when these are set (`app.py archive` does it on demand)
+# Months kept in the live store besides the current one; older months are
+# sealed into archives. 0 keeps everything live
+KEEP_MONTHS_ENV_VAR = "TAXI123_KEEP_MONTHS"
+KEEP_MONTHS = 0
+# Sealed months older than this many months are compressed; 0 never does
+COMPRESS_ENV_VAR = "TAXI123_COMPRESS_AFTER"
+COMPRESS_AFTER = 0
+
+log = logging.getLogger("taxi123.retention")
+
+
+def _months_setting(name, default):
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        return max(0, int(value))
+    except ValueError:
+        log.warning("%s invalide: %r, %d mois retenus", name, value, default)
+        return default
+
+
+def retention_settings():
+    # (months kept live, months before compressing) from the environment
+    return _months_setting(KEEP_MONTHS_ENV_VAR, KEEP_MONTHS), _months_setting(COMPRESS_ENV_VAR, COMPRESS_AFTER)
+
+
+def month_start(today, months_back):
+    # Ordinal of the first day of the month `months_back` before today's
+    index = today.year * 12 + today.month - 1 - months_back
+    return date(index // 12, index % 12 + 1, 1).toordinal()
+
+
+def apply_retention(store, directory, keep_months=KEEP_MONTHS, compress_after=COMPRESS_AFTER, today=None):
+    """Seal live months older than `keep_months`, then compress sealed
+    months older than `compress_after`.
+
+    Returns ([(year, month, invoices sealed)], [compressed paths]). Run it
+    after open_archives(), which removes the rows left live by a seal cut
+    short. Sealing deletes the live rows only once the archive is on disk,
+    and a month still mapped elsewhere is compressed by a later run.
+    """
+    today = today or date.today()
+    sealed = []
+    if keep_months:
+        for year, month in closed_months(store, month_start(today, keep_months)):
+            sealed.append((year, month, seal_month(store, year, month, directory)))
+    compressed = []
+    if compress_after:
+        limit = date.fromordinal(month_start(today, compress_after)).strftime("%Y-%m")
+        for path in month_files(directory):
+            if path.endswith(ARCHIVE_SUFFIX) and os.path.basename(path)[:7] < limit:
+                target = compress_month(path)
+                if target:
+                    compressed.append(target)
+    return sealed, compressed
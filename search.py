@@ -0,0 +1,309 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from itertools import compress
+from operator import and_, itemgetter
+
+from invoices import Invoice
+from storage import date_ordinal
+
+# Search criteria of each column that can be filtered by range
+RANGE_FILTERS = {"date": ("date_from", "date_to"), "total": ("total_min", "total_max")}
+# A search scans the whole history in ID order once its narrowest criterion
+# matches more than 1/SCAN_FRACTION of it
+SCAN_FRACTION = 4
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def invoice_day(invoice):
+    # Date ordinal of an Invoice or dict, 0 when unreadable; Invoice
+    # records are read directly instead of formatting and parsing the date
+    if isinstance(invoice, Invoice):
+        return invoice.day if isinstance(invoice.day, int) else 0
+    return date_ordinal(invoice['date']) or 0
+
+
+def invoice_total(invoice):
+    return invoice.total / 100 if isinstance(invoice, Invoice) else invoice['total']
+
+
+class InvoiceIndex:
+    """Search indexes over the invoice history.
+
+    Client names are indexed once per distinct name (sorted for prefix search,
+    trigrams for substring search); dates and totals are kept as sorted
+    (key, id) lists so ranges are answered by bisection. Each invoice's day,
+    total and name code are also kept in arrays indexed by ID: a search on
+    several criteria checks the candidates of the narrowest one against
+    them instead of intersecting ID sets, and a broad one scans them whole.
+    """
+
+    def __init__(self, invoices=()):
+        self.ids_by_name = defaultdict(set)
+        self.sorted_names = []
+        self.names_by_trigram = defaultdict(set)
+        self.by_date = []
+        self.by_total = []
+        self.build(invoices)
+
+    def build(self, invoices):
+        self.ids_by_name.clear()
+        self.names_by_trigram.clear()
+        self.sorted_names = []
+        self.by_date = []
+        self.by_total = []
+        self.name_codes = {}
+        self.days, self.totals, self.codes = array("i"), array("d"), array("I")
+        self.extend(invoices)
+
+    def _add_keys(self, invoice, name):
+        # Per-ID keys, the arrays growing up to the highest ID seen
+        invoice_id = invoice['id']
+        if invoice_id >= len(self.days):
+            missing = invoice_id + 1 - len(self.days)
+            for keys in (self.days, self.totals, self.codes):
+                keys.frombytes(bytes(keys.itemsize * missing))
+        # Code 0 (and day 0) marks an ID missing from the history: never
+        # added, or removed
+        code = self.name_codes.setdefault(name, len(self.name_codes) + 1)
+        day, total = invoice_day(invoice), invoice_total(invoice)
+        self.days[invoice_id] = day
+        self.totals[invoice_id] = total
+        self.codes[invoice_id] = code
+        return day, total
+
+    def _add_name(self, name, invoice_id):
+        if name not in self.ids_by_name:
+            insort(self.sorted_names, name)
+            for trigram in _trigrams(name):
+                self.names_by_trigram[trigram].add(name)
+        self.ids_by_name[name].add(invoice_id)
+
+    def extend(self, invoices):
+        # Bulk add: appended runs are merged by one sort instead of per-row insort
+        for invoice in invoices:
+            name = invoice['name'].casefold()
+            self._add_name(name, invoice['id'])
+            day, total = self._add_keys(invoice, name)
+            self.by_date.append((day, invoice['id']))
+            self.by_total.append((total, invoice['id']))
+        self.by_date.sort()
+        self.by_total.sort()
+
+    def add(self, invoice):
+        name = invoice['name'].casefold()
+        self._add_name(name, invoice['id'])
+        day, total = self._add_keys(invoice, name)
+        insort(self.by_date, (day, invoice['id']))
+        insort(self.by_total, (total, invoice['id']))
+
+    def remove(self, invoice):
+        self.codes[invoice['id']] = 0
+        self.days[invoice['id']] = 0
+        name = invoice['name'].casefold()
+        ids = self.ids_by_name.get(name)
+        if ids is not None:
+            ids.discard(invoice['id'])
+            if not ids:
+                del self.ids_by_name[name]
+                del self.sorted_names[bisect_left(self.sorted_names, name)]
+                for trigram in _trigrams(name):
+                    self.names_by_trigram[trigram].discard(name)
+        for entries, key in ((self.by_date, invoice_day(invoice)),
+                             (self.by_total, invoice_total(invoice))):
+            i = bisect_left(entries, (key, invoice['id']))
+            if i < len(entries) and entries[i] == (key, invoice['id']):
+                del entries[i]
+
+    def match_names(self, query):
+        query = query.casefold()
+        if len(query) < 3:
+            # Too short for trigrams: prefix match on the sorted names
+            start = bisect_left(self.sorted_names, query)
+            end = bisect_left(self.sorted_names, query + "\U0010ffff")
+            return self.sorted_names[start:end]
+        candidates = None
+        for trigram in _trigrams(query):
+            names = self.names_by_trigram.get(trigram, set())
+            candidates = names if candidates is None else candidates & names
+            if not candidates:
+                return []
+        return [name for name in candidates if query in name]
+
+    def matches(self, invoice, name=None, date_from=None, date_to=None, total_min=None, total_max=None):
+        # Same criteria as search(), for a single invoice saved while filtering
+        if name:
+            query, client = name.casefold(), invoice['name'].casefold()
+            if not (client.startswith(query) if len(query) < 3 else query in client):
+                return False
+        day = invoice_day(invoice)
+        if (date_from is not None and day < date_from) or (date_to is not None and day > date_to):
+            return False
+        total = invoice_total(invoice)
+        return not ((total_min is not None and total < total_min) or
+                    (total_max is not None and total > total_max))
+
+    @staticmethod
+    def range_column(name=None, date_from=None, date_to=None, total_min=None, total_max=None):
+        # The column a filter on one range alone is answered in, else None
+        dates = date_from is not None or date_to is not None
+        totals = total_min is not None or total_max is not None
+        if name or dates == totals:
+            return None
+        return "date" if dates else "total"
+
+    def range_entries(self, column, filters):
+        # Matching (key, id) entries of a single range filter: a bisected
+        # slice of the sorted index, already in that column's order
+        return range_slice(self.by_date if column == "date" else self.by_total, column, filters)
+
+    def search(self, name=None, date_from=None, date_to=None, total_min=None, total_max=None):
+        # Returns the matching IDs in ascending order, or None without filters.
+        # The narrowest criterion gives the candidates, the others filter them
+        criteria = self._criteria(name, date_from, date_to, total_min, total_max)
+        if not criteria:
+            return None
+        if criteria[0][0] * SCAN_FRACTION > len(self.by_date):
+            # Even the narrowest matches much of the history (a one or two
+            # letter name, an open date range): one pass over the arrays in
+            # ID order, which also saves sorting the result
+            return list(compress(range(len(self.codes)), self._scan(criteria, date_from, date_to, total_min, total_max)))
+        _, column, bounds = criteria[0]
+        if column == "name":
+            ids = [invoice_id for match in bounds for invoice_id in self.ids_by_name[match]]
+        else:
+            start, end = bounds
+            ids = list(map(itemgetter(1), (self.by_date if column == "date" else self.by_total)[start:end]))
+        # The other criteria are tested with C-level map() and compress()
+        # over the per-ID arrays: no Python code runs per candidate
+        for _, column, bounds in criteria[1:]:
+            if column == "name":
+                allowed = {self.name_codes[match] for match in bounds}
+                ids = list(compress(ids, map(allowed.__contains__, map(self.codes.__getitem__, ids))))
+                continue
+            keys, low, high = self._range_keys(column, date_from, date_to, total_min, total_max)
+            if low is not None:
+                ids = list(compress(ids, map(low.__le__, map(keys.__getitem__, ids))))
+            if high is not None:
+                ids = list(compress(ids, map(high.__ge__, map(keys.__getitem__, ids))))
+        ids.sort()
+        return ids
+
+    def mask(self, name=None, date_from=None, date_to=None, total_min=None, total_max=None):
+        # 1 at each matching ID, 0 elsewhere, for filtering the entries of
+        # another order (history_view.FilteredRows); one pass over the arrays
+        criteria = self._criteria(name, date_from, date_to, total_min, total_max)
+        return bytearray(self._scan(criteria, date_from, date_to, total_min, total_max))
+
+    def _criteria(self, name, date_from, date_to, total_min, total_max):
+        # (size, column, bounds) of each filter, narrowest first
+        criteria = []
+        if name:
+            names = self.match_names(name)
+            criteria.append((sum(len(self.ids_by_name[match]) for match in names), "name", names))
+        for column, entries in (("date", self.by_date), ("total", self.by_total)):
+            low, high = (date_from, date_to) if column == "date" else (total_min, total_max)
+            if low is not None or high is not None:
+                start, end = _bounds(entries, low, high)
+                criteria.append((end - start, column, (start, end)))
+        criteria.sort(key=lambda criterion: criterion[0])
+        return criteria
+
+    def _scan(self, criteria, date_from, date_to, total_min, total_max):
+        # Whether each ID matches, in ID order: the criteria's tests over
+        # the whole arrays, chained by C-level map()
+        masks = []
+        # Absent IDs have code 0 and day 0: a test on the name or a start
+        # date leaves them out, else they are tested for on their own
+        present = date_from is not None and date_from > 0
+        for _, column, bounds in criteria:
+            if column == "name":
+                if len(bounds) < len(self.ids_by_name):
+                    allowed = {self.name_codes[match] for match in bounds}
+                    masks.append(map(allowed.__contains__, self.codes))
+                    present = True
+                continue
+            keys, low, high = self._range_keys(column, date_from, date_to, total_min, total_max)
+            if low is not None:
+                masks.append(map(low.__le__, keys))
+            if high is not None:
+                masks.append(map(high.__ge__, keys))
+        if not present:
+            masks.append(map(bool, self.codes))
+        mask = masks[0]
+        for other in masks[1:]:
+            mask = map(and_, mask, other)
+        return mask
+
+    def _range_keys(self, column, date_from, date_to, total_min, total_max):
+        if column == "date":
+            return self.days, date_from, date_to
+        return self.totals, _float(total_min), _float(total_max)
+
+
+def _float(value):
+    return None if value is None else float(value)
+
+
+def _bounds(entries, low, high):
+    start = 0 if low is None else bisect_left(entries, (low,))
+    end = len(entries) if high is None else bisect_right(entries, (high, float("inf")))
+    return start, end
+
+
+def range_slice(entries, column, filters):
+    # The (key, id) entries sorted by `column` within its range filter
+    low, high = (filters.get(key) for key in RANGE_FILTERS[column])
+    start, end = _bounds(entries, low, high)
+    return entries[start:end]
+
+
+# Sort key per history column; ties are broken by invoice ID
+SORT_KEYS = {
+    "date": invoice_day,
+    "client": lambda invoice: invoice['name'].casefold(),
+    "total": invoice_total,
+}
+
+
+class SortOrders:
+    """Sorted (key, id) lists per history column, archived months included.
+
+    A column's order is built on the first sort by that column, then kept
+    current by add() and remove() like the search indexes.
+    """
+
+    def __init__(self):
+        self.orders = {}
+
+    @staticmethod
+    def entry(column, invoice):
+        return SORT_KEYS[column](invoice), invoice['id']
+
+    def order(self, column, invoices, archives=()):
+        entries = self.orders.get(column)
+        if entries is None:
+            entries = archives.sort_entries(column) if archives else []
+            entries.extend(self.entry(column, invoice) for invoice in invoices)
+            entries.sort()
+            self.orders[column] = entries
+        return entries
+
+    def extend(self, invoices):
+        for column, entries in self.orders.items():
+            entries.extend(self.entry(column, invoice) for invoice in invoices)
+            entries.sort()
+
+    def add(self, invoice):
+        for column, entries in self.orders.items():
+            insort(entries, self.entry(column, invoice))
+
+    def remove(self, invoice):
+        for column, entries in self.orders.items():
+            entry = self.entry(column, invoice)
+            i = bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
@@ -0,0 +1,260 @@
+import itertools
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+# Backend choice: "os", "cmd:<command line>" or "file:<directory>"
+PRINTER_ENV_VAR = "TAXI123_PRINTER"
+# Tickets queued within this delay go out as one job (s)
+BATCH_DELAY = 0.3
+MAX_BATCH = 20
+# Jobs waiting beyond this are refused instead of piling up
+MAX_QUEUE = 500
+# Waits before each new attempt of a failed job (s)
+RETRY_DELAYS = (1, 5, 30)
+# Sent batches kept around: the OS print verb reads the file after returning
+KEEP_SENT = 50
+JOB_SUFFIX = ".txt"
+# A job claimed this long ago by an instance that never finished it (it
+# stopped mid-send) goes back to the queue at the next start (s)
+STALE_CLAIM = 600
+
+log = logging.getLogger("taxi123.spooler")
+
+
+class SpoolFull(Exception):
+    pass
+
+
+def spool_directory():
+    # Per machine, even when invoices.db is on a shared folder
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "taxi123", "spool")
+
+
+class OSPrintBackend:
+    """The default printer through the shell's "print" verb (Windows)."""
+
+    name = "imprimante système"
+
+    def send(self, path):
+        os.startfile(path, "print")
+
+
+class CommandBackend:
+    """A print command such as `lpr -P ticket`, given the job file last."""
+
+    def __init__(self, command):
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.name = self.command[0]
+
+    def send(self, path):
+        subprocess.run(self.command + [path], check=True, capture_output=True, timeout=60)
+
+
+class FileSinkBackend:
+    """Copies each job into a directory instead of printing it."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.name = directory
+
+    def send(self, path):
+        os.makedirs(self.directory, exist_ok=True)
+        shutil.copy(path, os.path.join(self.directory, os.path.basename(path)))
+
+
+def default_backend():
+    setting = os.environ.get(PRINTER_ENV_VAR, "").strip()
+    if setting.startswith("cmd:"):
+        return CommandBackend(setting[4:])
+    if setting.startswith("file:"):
+        return FileSinkBackend(setting[5:])
+    if setting == "os" or sys.platform == "win32":
+        return OSPrintBackend()
+    for command in ("lp", "lpr"):
+        if shutil.which(command):
+            return CommandBackend([command])
+    return FileSinkBackend(os.path.join(spool_directory(), "printed"))
+
+
+class PrintSpooler:
+    """Persistent print queue served by one thread.
+
+    submit() writes each ticket to its own uniquely named file in `queue/`
+    before returning, so nothing is lost if the app stops; files left there
+    are printed at the next start. The thread sends the waiting tickets
+    (at most MAX_BATCH) as one job, and retries a failed job after each of
+    RETRY_DELAYS before moving its tickets to `failed/`.
+
+    Every window and CLI of the PC shares the directory: a ticket is first
+    claimed by renaming it into `claimed/<pid>/`, which only one of them can
+    do, so it is never printed twice.
+    """
+
+    def __init__(self, directory=None, backend=None, batch_delay=BATCH_DELAY):
+        self.directory = directory or spool_directory()
+        self.backend = backend or default_backend()
+        self.batch_delay = batch_delay
+        self.queue_dir = os.path.join(self.directory, "queue")
+        self.sent_dir = os.path.join(self.directory, "sent")
+        self.failed_dir = os.path.join(self.directory, "failed")
+        self.claims_dir = os.path.join(self.directory, "claimed")
+        self.claim_dir = os.path.join(self.claims_dir, str(os.getpid()))
+        for path in (self.queue_dir, self.sent_dir, self.failed_dir, self.claim_dir):
+            os.makedirs(path, exist_ok=True)
+        self._release_stale_claims()
+        self.sent = 0
+        self.last_error = None
+        self._counter = itertools.count()
+        self._pending = sorted(name for name in os.listdir(self.queue_dir) if name.endswith(JOB_SUFFIX))
+        self._condition = threading.Condition()
+        self._stopping = False
+        self.thread = threading.Thread(target=self._run, name="print-spooler", daemon=True)
+        self.thread.start()
+
+    @property
+    def depth(self):
+        # Tickets waiting, including a batch being sent or retried
+        with self._condition:
+            return len(self._pending)
+
+    def _job_name(self, prefix="ticket"):
+        # Sorts in submission order; unique even within one clock tick
+        return f"{time.time_ns():020d}-{os.getpid()}-{next(self._counter):06d}-{prefix}{JOB_SUFFIX}"
+
+    def submit(self, data):
+        with self._condition:
+            if len(self._pending) >= MAX_QUEUE:
+                raise SpoolFull(f"{len(self._pending)} tickets en attente d'impression")
+            name = self._job_name()
+            path = os.path.join(self.queue_dir, name)
+            with open(path + ".tmp", 'wb') as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            self._pending.append(name)
+            self._condition.notify()
+        return name
+
+    def stop(self, timeout=None):
+        # Unsent tickets stay in the queue directory for the next start
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self.thread.join(timeout)
+
+    def _release_stale_claims(self):
+        # Jobs claimed by an instance that stopped before sending them; our
+        # own pid's are from an earlier process, whatever their age
+        now = time.time()
+        for pid in os.listdir(self.claims_dir):
+            directory = os.path.join(self.claims_dir, pid)
+            try:
+                names = os.listdir(directory)
+            except NotADirectoryError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    if directory == self.claim_dir or now - os.path.getmtime(path) > STALE_CLAIM:
+                        os.replace(path, os.path.join(self.queue_dir, name))
+                except OSError:
+                    pass
+            if directory != self.claim_dir:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                # Let a burst of reprints gather into one job
+                if self._condition.wait_for(lambda: self._stopping, self.batch_delay):
+                    return
+                batch = self._pending[:MAX_BATCH]
+            try:
+                batch = self._claim(batch)
+                if batch and not self._send(batch):
+                    # Stopped while waiting to retry: back to the queue
+                    for name in batch:
+                        os.replace(os.path.join(self.claim_dir, name), os.path.join(self.queue_dir, name))
+                    return
+            except Exception as error:
+                # The thread must outlive any job: the files stay where they
+                # are (queued or claimed) and go out at the next start
+                log.exception("Impression interrompue")
+                self.last_error = error
+                self._forget(batch)
+
+    def _claim(self, batch):
+        # The tickets of `batch` we now own; another instance took the others
+        claimed = []
+        for name in batch:
+            path = os.path.join(self.claim_dir, name)
+            try:
+                os.replace(os.path.join(self.queue_dir, name), path)
+            except FileNotFoundError:
+                continue
+            # Claim time, read by _release_stale_claims
+            os.utime(path)
+            claimed.append(name)
+        if len(claimed) < len(batch):
+            self._forget(set(batch).difference(claimed))
+        return claimed
+
+    def _forget(self, names):
+        names = set(names)
+        with self._condition:
+            self._pending = [name for name in self._pending if name not in names]
+
+    def _send(self, batch):
+        # Returns False when the spooler was stopped while waiting to retry
+        job = os.path.join(self.sent_dir, self._job_name(f"batch{len(batch)}"))
+        with open(job, 'wb') as out:
+            for name in batch:
+                with open(os.path.join(self.claim_dir, name), 'rb') as f:
+                    out.write(f.read())
+        for delay in (*RETRY_DELAYS, None):
+            try:
+                self.backend.send(job)
+            except Exception as error:
+                self.last_error = error
+                if delay is None:
+                    self._finish(batch, self.failed_dir)
+                    return True
+                with self._condition:
+                    if self._condition.wait_for(lambda: self._stopping, delay):
+                        return False
+            else:
+                self.last_error = None
+                self.sent += len(batch)
+                self._finish(batch, None)
+                self._prune_sent()
+                return True
+
+    def _finish(self, batch, move_to):
+        for name in batch:
+            path = os.path.join(self.claim_dir, name)
+            if move_to:
+                os.replace(path, os.path.join(move_to, name))
+            else:
+                os.remove(path)
+        self._forget(batch)
+
+    def _prune_sent(self):
+        names = sorted(os.listdir(self.sent_dir))
+        for name in names[:max(0, len(names) - KEEP_SENT)]:
+            try:
+                os.remove(os.path.join(self.sent_dir, name))
+            except OSError:
+                pass
@@ -0,0 +1,350 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+INVOICE_FILE = "invoices.json"
+JOURNAL_FILE = "invoices.journal"
+DB_FILE = "invoices.db"
+# Bumped whenever InvoiceStore migrates the invoices.db schema
+SCHEMA_VERSION = 1
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d")
+# Set to 1 when invoices.db sits on a folder shared by several terminals
+SHARED_ENV_VAR = "TAXI123_SHARED"
+# How long a write waits for another terminal's transaction (s)
+LOCK_TIMEOUT = 30
+DRIVE_REMOTE = 4
+
+log = logging.getLogger("taxi123.storage")
+
+
+def _fsync_dir(path):
+    # Make the rename itself durable (no-op where directories can't be opened)
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_write(path, mode='w', **kwargs):
+    """Open a temporary file that replaces `path` once fully written and synced.
+
+    A crash at any point leaves either the previous file or the new one,
+    never a truncated mix. The temporary file is removed if the block raises.
+    """
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(path)
+
+
+@lru_cache(maxsize=4096)
+def date_ordinal(text):
+    if isinstance(text, int):
+        return text
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).toordinal()
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def load_legacy_history(journal_path, json_path):
+    # History written by earlier versions: the journal, else invoices.json
+    if os.path.exists(journal_path):
+        return load_journal(journal_path)
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        try:
+            return json.loads(text)
+        except ValueError as error:
+            # Earlier versions rewrote the file in place: a crash mid-save
+            # left it cut short. The file itself is left as it is
+            invoices = salvage_invoices(text)
+            log.warning("%s endommagé (%s): %d factures récupérées", json_path, error, len(invoices))
+            return invoices
+    return []
+
+
+def salvage_invoices(text):
+    # Every complete invoice object of a damaged JSON array, in file order
+    decoder = json.JSONDecoder()
+    invoices = []
+    position = text.find("{")
+    while position != -1:
+        try:
+            record, end = decoder.raw_decode(text, position)
+        except ValueError:
+            position = text.find("{", position + 1)
+            continue
+        if isinstance(record, dict) and "name" in record and "total" in record:
+            invoices.append(record)
+        position = text.find("{", end)
+    return invoices
+
+
+def on_network_share(path):
+    # WAL needs shared memory between the processes, which a network
+    # filesystem doesn't provide: such databases use the rollback journal
+    setting = os.environ.get(SHARED_ENV_VAR, "").strip().lower()
+    if setting:
+        return setting not in ("0", "false", "no")
+    path = os.path.abspath(path)
+    if path.startswith(("\\\\", "//")):
+        return True
+    if os.name == "nt":
+        import ctypes
+        drive = os.path.splitdrive(path)[0] + "\\"
+        return ctypes.windll.kernel32.GetDriveTypeW(drive) == DRIVE_REMOTE
+    return False
+
+
+def open_store(db_path=DB_FILE, journal_path=JOURNAL_FILE, json_path=INVOICE_FILE):
+    store = InvoiceStore(db_path, shared=on_network_share(db_path))
+    if store.needs_import:
+        # One-time import of the JSON history kept by earlier versions
+        store.import_invoices(load_legacy_history(journal_path, json_path))
+    return store
+
+
+def load_journal(path):
+    # Replays the append-only journal of earlier versions: one JSON record
+    # per line, "add" records and "del" tombstones. A torn last line (a
+    # crash mid-append) and unreadable lines are skipped
+    invoices = {}
+    with open(path, 'rb') as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                continue
+            if record.get("op") == "add":
+                invoice = record["invoice"]
+                invoices[invoice["id"]] = invoice
+            elif record.get("op") == "del":
+                invoices.pop(record["id"], None)
+    return list(invoices.values())
+
+
+class InvoiceStore:
+    """SQLite invoice store on top of invoices.db.
+
+    Every save is a single-row INSERT and every delete a DELETE by primary
+    key; history queries go through the client, date and total indexes.
+    Several terminals may use the same file: SQLite's locks serialize the
+    writes, and changes() tells each one what the others did.
+    """
+
+    COLUMNS = "id, client, date, departure, arrival, total, tarifs, resa, add_to_total"
+    INSERT = ("INSERT INTO invoices (client, date, departure, arrival, total, tarifs, resa, add_to_total, day) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        # Used from the app's storage worker thread; calls are never concurrent.
+        # Writes from other terminals are waited for, up to LOCK_TIMEOUT
+        self.conn = sqlite3.connect(path, timeout=LOCK_TIMEOUT, check_same_thread=False)
+        if shared:
+            # Network share: rollback journal and file locks, fully synced
+            self.conn.execute("PRAGMA journal_mode=DELETE")
+            self.conn.execute("PRAGMA synchronous=FULL")
+        else:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+
+    def _migrate(self):
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS invoices ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, client TEXT, date TEXT, "
+                "departure TEXT, arrival TEXT, total REAL)"
+            )
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(invoices)")}
+            for name, decl in (("tarifs", "TEXT"), ("resa", "INTEGER DEFAULT 0"),
+                               ("add_to_total", "REAL DEFAULT 0"), ("day", "INTEGER")):
+                if name not in columns:
+                    self.conn.execute(f"ALTER TABLE invoices ADD COLUMN {name} {decl}")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_client ON invoices(client)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices(day)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_total ON invoices(total)")
+            # Deleted IDs in deletion order, so other terminals can catch up
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS deletions (seq INTEGER PRIMARY KEY AUTOINCREMENT, id INTEGER)"
+            )
+        self.needs_import = self.conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION
+
+    def import_invoices(self, invoices):
+        # Runs once: the schema version is only bumped in the same transaction,
+        # which holds the write lock so a second terminal starting now waits
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                self.needs_import = False
+                return
+            for date, in self.conn.execute("SELECT DISTINCT date FROM invoices WHERE day IS NULL").fetchall():
+                self.conn.execute("UPDATE invoices SET day = ? WHERE date = ?", (date_ordinal(date), date))
+            self.conn.executemany(self.INSERT, (self._params(invoice) for invoice in invoices))
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.needs_import = False
+
+    def max_id(self):
+        return self.conn.execute("SELECT MAX(id) FROM invoices").fetchone()[0] or 0
+
+    def load_range(self, after_id, until_id, limit, record=None):
+        # Keyset pagination: each chunk is an index range scan on the primary key.
+        # `record` builds each invoice from its row (default: a dict)
+        cursor = self.conn.execute(
+            f"SELECT {self.COLUMNS} FROM invoices WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+            (after_id, until_id, limit),
+        )
+        return list(map(record or self._invoice, cursor))
+
+    def get(self, invoice_id):
+        row = self.conn.execute(f"SELECT {self.COLUMNS} FROM invoices WHERE id = ?", (invoice_id,)).fetchone()
+        return self._invoice(row) if row else None
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM invoices{where}", params).fetchone()[0]
+
+    def page(self, offset=0, limit=100, **filters):
+        where, params = self._where(**filters)
+        cursor = self.conn.execute(
+            f"SELECT {self.COLUMNS} FROM invoices{where} ORDER BY id LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        )
+        return [self._invoice(row) for row in cursor]
+
+    def append(self, invoice):
+        with self.conn:
+            cursor = self.conn.execute(self.INSERT, self._params(invoice))
+        invoice["id"] = cursor.lastrowid
+        return invoice["id"]
+
+    def append_many(self, invoices):
+        # One transaction for the whole batch; returns the number of rows written
+        with self.conn:
+            cursor = self.conn.executemany(self.INSERT, (self._params(invoice) for invoice in invoices))
+        return cursor.rowcount
+
+    def iter(self, **filters):
+        # Streams rows from the cursor instead of materializing the result
+        where, params = self._where(**filters)
+        cursor = self.conn.execute(f"SELECT {self.COLUMNS} FROM invoices{where} ORDER BY id", params)
+        return map(self._invoice, cursor)
+
+    def days(self, before=None):
+        # Distinct date ordinals, read from the date index
+        if before is None:
+            cursor = self.conn.execute("SELECT DISTINCT day FROM invoices WHERE day IS NOT NULL")
+        else:
+            cursor = self.conn.execute("SELECT DISTINCT day FROM invoices WHERE day < ?", (before,))
+        return [day for day, in cursor]
+
+    def delete_many(self, invoice_ids):
+        invoice_ids = [(invoice_id,) for invoice_id in invoice_ids]
+        with self.conn:
+            self.conn.executemany("DELETE FROM invoices WHERE id = ?", invoice_ids)
+            self.conn.executemany("INSERT INTO deletions (id) VALUES (?)", invoice_ids)
+
+    def delete(self, invoice_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM invoices WHERE id = ?", (invoice_id,))
+            self.conn.execute("INSERT INTO deletions (id) VALUES (?)", (invoice_id,))
+
+    def data_version(self):
+        # Changes whenever another connection commits; one page-cache read
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def last_deletion(self):
+        return self.conn.execute("SELECT MAX(seq) FROM deletions").fetchone()[0] or 0
+
+    def changes(self, after_id, after_deletion, record=None):
+        # Invoices added after `after_id` and IDs deleted after deletion
+        # number `after_deletion`, read in one transaction
+        with self.conn:
+            self.conn.execute("BEGIN")
+            cursor = self.conn.execute(f"SELECT {self.COLUMNS} FROM invoices WHERE id > ? ORDER BY id", (after_id,))
+            added = list(map(record or self._invoice, cursor))
+            deleted = self.conn.execute("SELECT seq, id FROM deletions WHERE seq > ? ORDER BY seq",
+                                        (after_deletion,)).fetchall()
+        last_deletion = deleted[-1][0] if deleted else after_deletion
+        return added, [invoice_id for _, invoice_id in deleted], last_deletion
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _where(client=None, date_from=None, date_to=None, total_min=None, total_max=None):
+        clauses, params = [], []
+        if client:
+            # Prefix match so the client index can be used
+            clauses.append("client >= ? AND client < ?")
+            params += [client, client + "\U0010ffff"]
+        if date_from is not None:
+            clauses.append("day >= ?")
+            params.append(date_ordinal(date_from))
+        if date_to is not None:
+            clauses.append("day <= ?")
+            params.append(date_ordinal(date_to))
+        if total_min is not None:
+            clauses.append("total >= ?")
+            params.append(total_min)
+        if total_max is not None:
+            clauses.append("total <= ?")
+            params.append(total_max)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    @staticmethod
+    def _params(invoice):
+        return (
+            invoice["name"],
+            invoice["date"],
+            invoice.get("departure_time", ""),
+            invoice.get("arrival_time", ""),
+            invoice["total"],
+            json.dumps(invoice.get("tarifs", [0.0, 0.0, 0.0, 0.0])),
+            invoice.get("resa", 0),
+            invoice.get("add_to_total", 0.0),
+            date_ordinal(invoice["date"]),
+        )
+
+    @staticmethod
+    def _invoice(row):
+        return {
+            "id": row[0],
+            "date": row[2] or "",
+            "name": row[1] or "",
+            "departure_time": row[3] or "",
+            "arrival_time": row[4] or "",
+            "total": row[5] or 0.0,
+            "tarifs": json.loads(row[6]) if row[6] else [0.0, 0.0, 0.0, 0.0],
+            "resa": row[7] or 0,
+            "add_to_total": row[8] or 0.0,
+        }
@@ -0,0 +1,214 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from operator import attrgetter
+
+from fares import PRISE_EN_CHARGE, format_cents, to_cents, tva_cents
+from invoices import Invoice
+from storage import atomic_write
+
+TICKET_HEADER = "BENATSOU YAZID"
+# Bump when the layout of render_ticket changes, so cached tickets are redone
+TEMPLATE_REVISION = 1
+TICKET_CACHE_SIZE = 256
+TICKET_CACHE_DIR = "taxi123-tickets"
+# Buffer size used when streaming many tickets into one file
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+def render_ticket(invoice):
+    # Everything is read from the invoice itself so reprints match the original ride
+    tarifs = invoice['tarifs']
+    total = invoice['total']
+    total_cents = to_cents(total)
+    tva = tva_cents(total_cents)
+    return f"""
+        {TICKET_HEADER}
+
+Date course:        {invoice['date']:<20}
+
+Heure départ:            {invoice['departure_time']:<20}
+Heure d'arrivée:         {invoice['arrival_time']:<20}
+
+******************************
+Tarif(s) appliqué(s)
+
+Tarif A (km):     {tarifs[0]:>10.2f} €
+Tarif B (km):     {tarifs[1]:>10.2f} €
+Tarif C (km):     {tarifs[2]:>10.2f} €
+Tarif D (km):     {tarifs[3]:>10.2f} €
+
+RESA:             {float(invoice.get('resa', 0)):>10.2f} €
+Prise en charge:  {PRISE_EN_CHARGE:>10.2f} €
+Ajouter au total: {float(invoice.get('add_to_total', 0)):>10.2f} €
+
+Total TTC:        {total:>10.2f} €
+TVA (10%):        {format_cents(tva):>10} €
+Sous-total HT:    {format_cents(total_cents - tva):>10} €
+******************************
+Nom du client:        {invoice['name']:<20}
+******************************
+
+    Exemplaire chauffeur
+"""
+
+
+def ticket_filename(invoice):
+    return f"facture_{invoice['name'].replace(' ', '_')}.txt"
+
+
+def write_tickets(path, invoices):
+    # Streams any iterable of invoices into a single file, one ticket after another
+    count = 0
+    with atomic_write(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+        for invoice in invoices:
+            f.write(render_ticket(invoice))
+            count += 1
+    return count
+
+
+def ticket_cache_dir(db_path):
+    # One directory per database under the temp directory: invoice IDs only
+    # name a ride within their own database
+    key = hashlib.sha1(os.path.abspath(db_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), TICKET_CACHE_DIR, key)
+
+
+def template_version():
+    # Changes with the layout, the header or the pick-up charge printed on it
+    key = f"{TEMPLATE_REVISION}|{TICKET_HEADER}|{PRISE_EN_CHARGE:.2f}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]
+
+
+# The record fields a ticket prints: all but the ID
+_printed_fields = attrgetter(*(field for field in Invoice.__slots__ if field != "id"))
+
+
+def ticket_stamp(invoice):
+    # Short hash of every field printed on the ticket: an invoice ID reused
+    # by a recreated database, or an edited ride, never gets a stale ticket.
+    # Read from the record's fields, the same for either form of an invoice
+    if not isinstance(invoice, Invoice):
+        invoice = Invoice.from_dict(invoice)
+    return hashlib.sha1(repr(_printed_fields(invoice)).encode("utf-8")).hexdigest()[:8]
+
+
+def ticket_bytes(invoice):
+    # Exactly what a ticket file holds, newline translation included
+    return render_ticket(invoice).replace("\n", os.linesep).encode("utf-8")
+
+
+class TicketCache:
+    """Bounded LRU of rendered tickets, keyed by (invoice ID, template version,
+    ticket stamp).
+
+    With a directory (one per database, see ticket_cache_dir), every cached
+    ticket is also a file there that can be spooled as is, and tickets
+    survive a restart. Used from the print thread
+    and the Tk thread, hence the lock.
+    """
+
+    def __init__(self, capacity=TICKET_CACHE_SIZE, directory=None):
+        self.capacity = capacity
+        self.directory = directory
+        self.hits = self.misses = 0
+        # key -> ticket bytes, or None when only the file has been seen yet
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._scanned = directory is None
+
+    def _file(self, key):
+        return os.path.join(self.directory, "-".join(map(str, key)) + ".txt")
+
+    def _scan(self):
+        # Deferred to the first use so opening the app does no disk I/O here
+        self._scanned = True
+        os.makedirs(self.directory, exist_ok=True)
+        version = template_version()
+        found = []
+        for filename in os.listdir(self.directory):
+            stem, ext = os.path.splitext(filename)
+            parts = stem.split("-")
+            path = os.path.join(self.directory, filename)
+            if ext != ".txt" or len(parts) != 3 or not parts[0].isdigit() or parts[1] != version:
+                # Another header or layout, or a write cut short: never valid again
+                self._remove(path)
+            else:
+                found.append((os.path.getmtime(path), int(parts[0]), parts[2]))
+        for _, invoice_id, stamp in sorted(found):
+            self._entries[(invoice_id, version, stamp)] = None
+        self._trim()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _trim(self):
+        while len(self._entries) > self.capacity:
+            key, _ = self._entries.popitem(last=False)
+            if self.directory:
+                self._remove(self._file(key))
+
+    def _lookup(self, invoice):
+        # Returns (key, ticket bytes); the bytes are rendered on a miss
+        if not self._scanned:
+            self._scan()
+        key = (invoice['id'], template_version(), ticket_stamp(invoice))
+        if key[0] is None:
+            return None, ticket_bytes(invoice)
+        if key in self._entries:
+            data = self._entries[key]
+            self._entries.move_to_end(key)
+            if data is None:
+                try:
+                    with open(self._file(key), 'rb') as f:
+                        data = f.read()
+                except OSError:
+                    data = None
+            if data is not None:
+                self._entries[key] = data
+                self.hits += 1
+                return key, data
+        self.misses += 1
+        data = ticket_bytes(invoice)
+        if self.directory:
+            # Never a torn file for the next start's scan to trust
+            with atomic_write(self._file(key), 'wb') as f:
+                f.write(data)
+        self._entries[key] = data
+        self._trim()
+        return key, data
+
+    def get(self, invoice):
+        with self._lock:
+            return self._lookup(invoice)[1]
+
+    def write(self, path, invoice):
+        # A ticket file for the invoice, from the cache
+        data = self.get(invoice)
+        with atomic_write(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def invalidate(self, invoice_id):
+        # The invoice changed or is gone: drop every version of its ticket
+        with self._lock:
+            if not self._scanned:
+                self._scan()
+            for key in [key for key in self._entries if key[0] == invoice_id]:
+                del self._entries[key]
+                if self.directory:
+                    self._remove(self._file(key))
+
+    def clear(self):
+        with self._lock:
+            if not self._scanned:
+                self._scan()
+            if self.directory:
+                for key in self._entries:
+                    self._remove(self._file(key))
+            self._entries.clear()
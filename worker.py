@@ -0,0 +1,61 @@
+import queue
+import threading
+
+# How often the Tk loop checks for finished jobs while some are in flight (ms)
+POLL_INTERVAL_MS = 30
+
+
+class BackgroundWorker:
+    """Runs jobs one after another on a daemon thread.
+
+    Jobs execute in submission order. Their result (or exception) is handed
+    back to `on_done` (or `on_error`) on the Tk main thread, via root.after
+    polling, so callbacks may touch widgets freely.
+    """
+
+    def __init__(self, root, name):
+        self.root = root
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = 0
+        self._poll_job = None
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args, on_done=None, on_error=None):
+        self.pending += 1
+        self.jobs.put((func, args, on_done, on_error))
+        if self._poll_job is None:
+            self._poll_job = self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def stop(self, timeout=None):
+        # Lets queued jobs finish before the thread exits
+        self.jobs.put(None)
+        self.thread.join(timeout)
+        if self._poll_job is not None:
+            self.root.after_cancel(self._poll_job)
+            self._poll_job = None
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            func, args, on_done, on_error = job
+            try:
+                self.results.put((on_done, func(*args)))
+            except Exception as error:
+                self.results.put((on_error, error))
+
+    def _poll(self):
+        self._poll_job = None
+        while True:
+            try:
+                callback, value = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            if callback:
+                callback(value)
+        if self.pending:
+            self._poll_job = self.root.after(POLL_INTERVAL_MS, self._poll)